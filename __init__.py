@@ -0,0 +1,52 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from importlib import import_module
+
+
+# Nothing is imported until it is first used, so importing the package (or
+# a module in it that only needs the calendar or the population types) does
+# not pull in pydantic and the calculator.
+
+_EXPORTS = {
+    'Schedule': 'schedule',
+    'period_start_dates': 'schedule',
+    'PeriodCalendar': 'period_calendar',
+    'get_period_calendar': 'period_calendar',
+    'PopulationYear': 'population_year',
+    'PopulationIndex': 'population_index',
+    'RunningPopulationIndex': 'population_index',
+    'ChangePointPopulation': 'change_points',
+    'PoolYearReader': 'pool_years',
+    'PopulationLog': 'ingestion',
+    'IngestionStore': 'ingestion',
+    'Substance': 'substance',
+    'Employer': 'employer',
+    'Calculator': 'calculator',
+    'CalculatorSession': 'calculator',
+    'get_calculator_instance': 'calculator',
+    'generate_results': 'calculator',
+    'generate_fleet_results': 'fleet_calculator',
+    'encode_substance': 'substance_codec',
+    'decode_substance': 'substance_codec',
+    'DataPersist': 'data_persist',
+    'OvercountDistribution': 'overcount_distribution',
+    'MetricsRecorder': 'metrics',
+    'TimingRecorder': 'metrics',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
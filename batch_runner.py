@@ -0,0 +1,134 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import os
+import random
+
+try:
+    from .schedule import Schedule
+    from .change_points import ChangePointPopulation, stream_compact_population_from_file
+    from .fleet_calculator import generate_fleet_results
+    from .result_cache import ResultCache, cached_generate_results
+except ImportError:
+    from schedule import Schedule
+    from change_points import ChangePointPopulation, stream_compact_population_from_file
+    from fleet_calculator import generate_fleet_results
+    from result_cache import ResultCache, cached_generate_results
+
+# The same settings DataPersist.run_like_veriport_would uses
+DISALLOW = 0
+DR_FRACTION = .5
+AL_FRACTION = .1
+
+SUMMARY_HEADER = 'pool,schedule,inception,drug_overcount,alcohol_overcount,final_overcount,rejected_lines,error\n'
+
+
+# Runs every population file matched by a directory or glob through the
+# calculator inside one interpreter, on a pool of worker processes that
+# each load and process their own files. A file that cannot be read ends
+# up as an error row in the summary instead of stopping the run.
+#
+# Every pool and schedule reseeds the random module from the master seed,
+# so each row is reproducible on its own. With a cache directory a row is
+# looked up by the hash of its population and settings first, so a rerun
+# of unchanged pools costs a hash and a lookup. Each worker process keeps
+# its own in memory tier in front of the shared directory.
+
+_caches = {}
+
+
+def get_cache(directory: str) -> ResultCache:
+    if directory not in _caches:
+        _caches[directory] = ResultCache(directory=directory)
+    return _caches[directory]
+
+
+def find_files(pattern: str) -> list[str]:
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.csv')
+    return sorted(glob.glob(pattern))
+
+
+def schedules_from_string(s: str) -> list[Schedule]:
+    # 'all' or a comma separated list, e.g. 'monthly,quarterly'
+    if s.strip().lower() == 'all':
+        return list(Schedule)
+    return [Schedule.from_string_to_schedule(name) for name in s.split(',')]
+
+
+def process_file(job: tuple) -> list[tuple]:
+    (filename, vp_format, schedules, seed, cache_dir) = job
+    pool = os.path.splitext(os.path.basename(filename))[0]
+    try:
+        (population, rejected) = stream_compact_population_from_file(filename, vp_format)
+        rows = []
+        for schedule in schedules:
+            # seeded per row, so the result does not depend on which worker ran it
+            row_seed = f'{seed}:{pool}:{Schedule.as_str(schedule)}'
+            (drug_overcount, alcohol_overcount) = run_schedule(population, schedule, row_seed, cache_dir)
+            rows.append((
+                pool,
+                Schedule.as_str(schedule),
+                str(population.inception),
+                drug_overcount,
+                alcohol_overcount,
+                abs(drug_overcount) + abs(alcohol_overcount),
+                rejected,
+                ''))
+    except (OSError, ValueError) as exc:
+        return [(pool, '', '', '', '', '', '', str(exc).replace(',', ';'))]
+    return rows
+
+
+def run_schedule(population, schedule: Schedule, seed: str, cache_dir: str = None) -> tuple:
+    # (drug overcount, alcohol overcount) of one pool under one schedule
+    if cache_dir is not None:
+        # the cache key and the calculator need every day
+        if isinstance(population, ChangePointPopulation):
+            population = population.to_dense()
+        result = cached_generate_results(
+            get_cache(cache_dir),
+            schedule,
+            population.inception,
+            population,
+            DISALLOW,
+            DR_FRACTION,
+            AL_FRACTION,
+            seed,
+            lagged_start_counts=True
+            )
+        return (result.drug_overcount, result.alcohol_overcount)
+    random.seed(seed)
+    [r] = generate_fleet_results([population], schedule, DISALLOW, DR_FRACTION, AL_FRACTION, lagged_start_counts=True)
+    return (r.dr.final_overcount(), r.al.final_overcount())
+
+
+def run_batch(
+        pattern: str,
+        vp_format: bool,
+        schedules: list[Schedule],
+        summary_file: str,
+        workers: int = 1,
+        seed: int = 0,
+        cache_dir: str = None
+        ) -> list[tuple]:
+    jobs = [(f, vp_format, schedules, seed, cache_dir) for f in find_files(pattern)]
+    rows = []
+    if workers <= 1:
+        for job in jobs:
+            rows.extend(process_file(job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for file_rows in pool.map(process_file, jobs, chunksize=max(1, len(jobs) // (4 * workers))):
+                rows.extend(file_rows)
+
+    os.makedirs(os.path.dirname(summary_file) or '.', exist_ok=True)
+    with open(summary_file, 'w') as f:
+        f.write(SUMMARY_HEADER)
+        for row in rows:
+            f.write(','.join(str(v) for v in row) + '\n')
+    return rows
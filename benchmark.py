@@ -0,0 +1,297 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from schedule import Schedule
+from employer import Employer
+from calculator import get_calculator_instance
+from data_persist import DataPersist
+from file_io import stream_population_from_file
+from file_io import write_population_to_vp_file
+from random_population import generate_population
+
+
+# Times the stages a pool goes through, over the bundled veriport_input
+# files plus synthetic pools, and writes the timings and peak memory as
+# json. With --compare the run is checked against a saved result and any
+# stage that got slower than the tolerance allows is flagged.
+
+
+def make_synthetic_files(directory: str, num_pools: int, pool_size: int, seed: int) -> list[str]:
+    rng_state = random.getstate()
+    random.seed(seed)
+    files = []
+    jan_1 = date(year=2023, month=1, day=1).toordinal()
+    for i in range(num_pools):
+        start = date.fromordinal(jan_1 + random.randint(0, 300))
+        population = generate_population(start, date(year=2023, month=12, day=31), pool_size, 0.01, 2.0)
+        filename = os.path.join(directory, f'synthetic_{i}.csv')
+        write_population_to_vp_file(population, filename)
+        files.append(filename)
+    random.setstate(rng_state)
+    return files
+
+
+class Stages:
+    # one method per stage, each run over every input pool
+
+    def __init__(self, files: list[str], schedule: Schedule, work_dir: str):
+        self.files = files
+        self.schedule = schedule
+        self.work_dir = work_dir
+        self.populations = [stream_population_from_file(f, True)[0] for f in files]
+        self.calculators = []
+
+    def file_load(self) -> None:
+        for f in self.files:
+            stream_population_from_file(f, True)
+
+    def period_calendar(self) -> None:
+        for population in self.populations:
+            for schedule in Schedule:
+                Employer.initialize_period_start_dates(population.inception, schedule)
+
+    def process_period(self) -> None:
+        self.calculators = []
+        random.seed(0)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for population in self.populations:
+                calc = get_calculator_instance(self.schedule, population.inception, population, 0, .5, .1)
+                (dr_json, al_json) = ('', '')
+                for period_index in range(calc.num_periods+1):
+                    (dr_json, al_json, _, _) = calc.process_period(period_index, dr_json, al_json)
+                self.calculators.append(calc)
+
+    def persistence(self) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i, calc in enumerate(self.calculators):
+                data_persist = DataPersist(
+                    self.schedule, self.populations[i], self.work_dir, 'bench', f'pool_{i}', '', True)
+                (dr_json, al_json) = calc.get_data_to_persist()
+                data_persist.store_json(dr_json, 'tmp_dr.json')
+                data_persist.store_json(al_json, 'tmp_al.json')
+                data_persist.state_store.flush()
+                data_persist.retrieve_json('tmp_dr.json')
+                data_persist.retrieve_json('tmp_al.json')
+
+    def report_rendering(self) -> None:
+        for calc in self.calculators:
+            calc.employer.make_html_report()
+            calc.employer.make_text_report()
+            calc.employer.generate_csv_report()
+
+    # process_period has to run before persistence and report_rendering
+    ORDER = ['file_load', 'period_calendar', 'process_period', 'persistence', 'report_rendering']
+
+
+def time_stage(stage, repeat: int) -> dict:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage()
+        runs.append(time.perf_counter() - start)
+
+    # a separate run for memory since tracing slows everything down
+    tracemalloc.start()
+    stage()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': statistics.median(runs), 'runs': runs, 'peak_bytes': peak}
+
+
+# modules a job runner might start from, cheapest first
+IMPORT_MODULES = [
+    'schedule',
+    'population_year',
+    'file_io',
+    'fleet_calculator',
+    'cli',
+    'substance',
+    'employer',
+    'calculator',
+    'data_persist',
+    'main',
+]
+
+
+def import_time(module: str) -> tuple:
+    # (cumulative microseconds, pulled in pydantic) for a fresh interpreter,
+    # as reported by python -X importtime
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True)
+    cumulative = 0
+    pydantic = False
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        (_, total, name) = line[len('import time:'):].split('|')
+        pydantic = pydantic or name.strip() == 'pydantic'
+        if name.strip() == module:
+            cumulative = int(total)
+    return (cumulative, pydantic)
+
+
+def run_import_benchmarks(args: argparse.Namespace) -> dict:
+    results = {}
+    for module in IMPORT_MODULES:
+        runs = []
+        for _ in range(args.repeat):
+            (cumulative, pydantic) = import_time(module)
+            runs.append(cumulative / 1e6)
+        results[f'import {module}'] = {'seconds': statistics.median(runs), 'runs': runs, 'pydantic': pydantic}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'stages': results,
+    }
+
+
+def run_benchmarks(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as work_dir:
+        files = sorted(glob.glob(args.input))
+        files += make_synthetic_files(work_dir, args.pools, args.size, args.seed)
+        stages = Stages(files, Schedule.from_string_to_schedule(args.sch), work_dir)
+        results = {}
+        for name in Stages.ORDER:
+            results[name] = time_stage(getattr(stages, name), args.repeat)
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'input_files': len(files) - args.pools,
+            'synthetic_pools': args.pools,
+            'synthetic_pool_size': args.size,
+            'schedule': args.sch,
+            'repeat': args.repeat,
+        },
+        'stages': results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, stage in current['stages'].items():
+        if name not in baseline['stages']:
+            continue
+        before = baseline['stages'][name]['seconds']
+        after = stage['seconds']
+        ratio = after / before if before > 0 else 1.0
+        flag = ratio > 1.0 + tolerance
+        print(f'{name:>18}: {before:.6f}s -> {after:.6f}s ({ratio:5.2f}x){" REGRESSION" if flag else ""}')
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Arguments: input files, synthetic pools, output file, baseline to compare with'
+        )
+    parser.add_argument(
+        '--input',
+        type=str,
+        help='glob of VP format files to include',
+        default='veriport_input/*.csv'
+        )
+    parser.add_argument(
+        '--pools',
+        type=int,
+        help='number of synthetic pools to generate',
+        default=20
+        )
+    parser.add_argument(
+        '--size',
+        type=int,
+        help='starting size of each synthetic pool',
+        default=200
+        )
+    parser.add_argument(
+        '--sch',
+        type=str,
+        help='the testing schedule (MONTHLY, QUARTERLY, etc.)',
+        default='monthly'
+        )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        help='timed runs per stage (the median is reported)',
+        default=3
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='seed for the synthetic pools',
+        default=0
+        )
+    parser.add_argument(
+        '--imports',
+        action='store_true',
+        help='time importing each module in a fresh interpreter instead'
+        )
+    parser.add_argument(
+        '--out',
+        type=str,
+        help='write the results to this json file',
+        default=''
+        )
+    parser.add_argument(
+        '--compare',
+        type=str,
+        help='baseline json from an earlier run',
+        default=''
+        )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        help='allowed slowdown before a stage is flagged (0.1 == 10%%)',
+        default=0.1
+        )
+    args = parser.parse_args()
+    return args
+
+
+def main() -> int:
+    args = get_args()
+    results = run_import_benchmarks(args) if args.imports else run_benchmarks(args)
+    output = json.dumps(results, indent=4)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if len(compare(results, baseline, args.tolerance)) > 0:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
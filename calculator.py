@@ -4,17 +4,27 @@
 # Written by John Read <john.read@colibri-software.com>, September 2023
 
 
-from datetime import date
-RUN_FROM_VERIPORT = True
-
-if RUN_FROM_VERIPORT:
+from datetime import date, timedelta
+try:
     from .employer import Employer
     from .initialize_json import compile_json
+    from .metrics import MetricsRecorder, NULL_METRICS
+    from .period_calendar import get_period_calendar
+    from .population_year import PopulationYear
+    from .tracing import Tracer, NULL_TRACER, debug_lines
+    from .population_index import RunningPopulationIndex
     from .schedule import Schedule
-else:
+    from .substance_codec import decode_substance
+except ImportError:
     from employer import Employer
     from initialize_json import compile_json
+    from metrics import MetricsRecorder, NULL_METRICS
+    from period_calendar import get_period_calendar
+    from population_year import PopulationYear
+    from tracing import Tracer, NULL_TRACER, debug_lines
+    from population_index import RunningPopulationIndex
     from schedule import Schedule
+    from substance_codec import decode_substance
 
 
 class Calculator:
@@ -26,47 +36,41 @@ class Calculator:
         population: dict,
         disallow_zero_chance: int = 100,
         dr_fraction: float = .5,
-        al_fraction: float = .1
+        al_fraction: float = .1,
+        metrics: MetricsRecorder = NULL_METRICS,
+        tracer: Tracer = NULL_TRACER
     ):
 
         self.schedule = schedule
         self.pool_inception = pool_inception
+        self.metrics = metrics
+        self.tracer = tracer
 
         # initialize the employer
-        employer_json = compile_json(
-            self.pool_inception,
-            self.schedule,
-            disallow_zero_chance,
-            dr_fraction,
-            al_fraction)
+        with metrics.stage('load'):
+            employer_json = compile_json(
+                self.pool_inception,
+                self.schedule,
+                disallow_zero_chance,
+                dr_fraction,
+                al_fraction)
 
-        self.employer = Employer(**employer_json)
-        self.employer.initialize(population)
+            self.employer = Employer(**employer_json)
+            self.employer.initialize(population)
+            self.employer.attach_tracer(tracer)
 
     def period_end_calculations(self, period_index: int, dr_json: str, al_json: str) -> int:
-        return self.employer.load_persisted_data_and_do_period_calculations(
-            period_index,
-            dr_json,
-            al_json)
+        with self.metrics.stage('validate'):
+            self.employer.load_persisted_data(dr_json, al_json)
+        with self.metrics.stage('truth'):
+            return self.employer.do_period_calculations(period_index)
 
     @property
     def num_periods(self):
         return self.employer.num_periods
 
     def find_period_index(self, day: date) -> int:
-        if day.year > self.pool_inception.year:
-            return self.employer.num_periods
-
-        if day < self.pool_inception:
-            return -1
-
-        for counter in range(self.employer.num_periods):
-            period_index = self.employer.num_periods - (counter+1)
-            if self.employer.period_start_dates[period_index] <= day:
-                return period_index
-
-        # This can actually never happen
-        return self.employer.num_periods
+        return self.employer.period_calendar.period_of(day)
 
     def process_period(
             self,
@@ -74,7 +78,8 @@ class Calculator:
             curr_dr_json: str = '',
             curr_al_json: str = ''
             ) -> tuple:
-        print(f'\n\nIn process_period: {period_index=} \n {curr_dr_json=}\n')
+        self.metrics.count('process_period')
+        self.metrics.size('state_in', len(curr_dr_json) + len(curr_al_json))
         score = 0
         html = None
         (dr_json, al_json) = (curr_dr_json, curr_al_json)
@@ -83,23 +88,30 @@ class Calculator:
             score = self.period_end_calculations(period_index-1, dr_json, al_json)
 
         if period_index == self.employer.num_periods:
-            html = self.employer.make_html_report()
+            with self.metrics.stage('report'):
+                html = self.employer.make_html_report()
+            self.metrics.size('report', len(html))
         else:
-            self.employer.make_estimates(period_index)
+            with self.metrics.stage('estimate'):
+                self.employer.make_estimates(period_index)
 
-        (dr_json, al_json) = self.employer.get_data_to_persist()
-        print(f'leave process_period: {period_index=} \n {dr_json=}\n')
+        with self.metrics.stage('serialize'):
+            (dr_json, al_json) = self.employer.get_data_to_persist()
+        self.metrics.size('state_out', len(dr_json) + len(al_json))
         return (dr_json, al_json, score, html)
 
+    def write_html_report(self, out) -> None:
+        with self.metrics.stage('report'):
+            self.employer.write_html_report(out)
+
     def get_requirements(self, period_index: int, drug: bool) -> int:
         if drug:
             return self.employer._dr.required_tests_predicted[period_index]
         return self.employer._al.required_tests_predicted[period_index]
 
     def get_debug_all_info(self, drugs=True):
-        if drugs:
-            return self.employer._dr.debug_all_data
-        return self.employer._al.debug_all_data
+        # the old debug lines, from the DETAIL records still in the tracer's ring
+        return debug_lines(self.tracer.recent(), 'drug' if drugs else 'alcohol')
 
     def get_dr_json(self) -> dict:
         import json
@@ -112,15 +124,129 @@ class Calculator:
     def get_data_to_persist(self) -> tuple:
         return self.employer.get_data_to_persist()
 
+
+class CalculatorSession:
+    # A Calculator that lives for the whole pool year. Instead of being
+    # rebuilt from the full population and the persisted json every period,
+    # it is handed the days that are new since the last call and keeps the
+    # population index and both Substances in memory. Json is only produced
+    # when snapshot() is called.
+
+    def __init__(
+        self,
+        schedule: Schedule,
+        pool_inception: date,
+        disallow_zero_chance: int = 100,
+        dr_fraction: float = .5,
+        al_fraction: float = .1,
+        metrics: MetricsRecorder = NULL_METRICS,
+        tracer: Tracer = NULL_TRACER
+    ):
+        self.schedule = schedule
+        self.pool_inception = pool_inception
+        self.metrics = metrics
+        self.tracer = tracer
+
+        with metrics.stage('load'):
+            employer_json = compile_json(
+                self.pool_inception,
+                self.schedule,
+                disallow_zero_chance,
+                dr_fraction,
+                al_fraction)
+
+            self.population = RunningPopulationIndex(pool_inception)
+            self.employer = Employer(**employer_json)
+            self.employer.initialize(self.population)
+            self.employer.attach_tracer(tracer)
+        self.next_period_index = 0
+
+    @staticmethod
+    def from_snapshot(
+        schedule: Schedule,
+        pool_inception: date,
+        population_days: list[int],
+        period_index: int,
+        dr_json: str,
+        al_json: str,
+        tracer: Tracer = NULL_TRACER
+    ) -> 'CalculatorSession':
+        # pick a session back up from the population seen so far and a
+        # snapshot taken after advance(period_index-1, ...)
+        session = CalculatorSession(schedule, pool_inception, tracer=tracer)
+        session.population.extend(population_days)
+        session.employer._dr = decode_substance(dr_json)
+        session.employer._al = decode_substance(al_json)
+        session.employer.attach_tracer(tracer)
+        session.next_period_index = period_index
+        return session
+
+    @property
+    def num_periods(self):
+        return self.employer.num_periods
+
+    @property
+    def last_day_known(self) -> date:
+        return self.population.last_day
+
+    def advance(self, period_index: int, new_population_days: list[int], render_html: bool = True) -> tuple:
+        # new_population_days are the counts for the days following the last
+        # day we know about, in order. Pass render_html=False to stream the
+        # final report with write_html_report instead.
+        if period_index != self.next_period_index:
+            raise ValueError(f'expected period {self.next_period_index}, got {period_index}')
+        self.metrics.count('advance')
+        with self.metrics.stage('load'):
+            self.population.extend(new_population_days)
+
+        score = 0
+        html = None
+        if period_index > 0:
+            with self.metrics.stage('truth'):
+                score = self.employer.do_period_calculations(period_index-1)
+
+        if period_index == self.employer.num_periods:
+            if render_html:
+                with self.metrics.stage('report'):
+                    html = self.employer.make_html_report()
+                self.metrics.size('report', len(html))
+        else:
+            with self.metrics.stage('estimate'):
+                self.employer.make_estimates(period_index)
+
+        self.next_period_index += 1
+        return (score, html)
+
+    @property
+    def finished(self) -> bool:
+        return self.next_period_index > self.employer.num_periods
+
+    def write_html_report(self, out) -> None:
+        with self.metrics.stage('report'):
+            self.employer.write_html_report(out)
+
+    def get_debug_all_info(self, drugs=True):
+        # the old debug lines, from the DETAIL records still in the tracer's ring
+        return debug_lines(self.tracer.recent(), 'drug' if drugs else 'alcohol')
+
+    def snapshot(self) -> tuple:
+        with self.metrics.stage('serialize'):
+            (dr_json, al_json) = self.employer.get_data_to_persist()
+        self.metrics.size('state_out', len(dr_json) + len(al_json))
+        return (dr_json, al_json)
+
+
 def get_calculator_instance(
         schedule: Schedule,
         inception: date,
         population: dict,
         disallow: int,
         dr_fraction: float,
-        al_fraction: float
+        al_fraction: float,
+        metrics: MetricsRecorder = NULL_METRICS,
+        tracer: Tracer = NULL_TRACER
         ) -> Calculator:
-    return Calculator(schedule, inception, population, disallow, dr_fraction, al_fraction)
+    return Calculator(schedule, inception, population, disallow, dr_fraction, al_fraction, metrics, tracer)
 
 
 def generate_results(
@@ -129,9 +255,11 @@ def generate_results(
         population: dict,
         disallow: int,
         dr_fraction: float,
-        al_fraction: float
+        al_fraction: float,
+        metrics: MetricsRecorder = NULL_METRICS,
+        tracer: Tracer = NULL_TRACER
         ) -> Calculator:
-    c = get_calculator_instance(schedule, inception, population, disallow, dr_fraction, al_fraction)
+    c = get_calculator_instance(schedule, inception, population, disallow, dr_fraction, al_fraction, metrics, tracer)
     curr_dr_json = ''
     curr_al_json = ''
     score = 0
@@ -141,3 +269,37 @@ def generate_results(
             c.process_period(period_index, curr_dr_json, curr_al_json)
 
     return c
+
+
+def generate_session_results(
+        schedule: Schedule,
+        inception: date,
+        population: dict,
+        disallow: int,
+        dr_fraction: float,
+        al_fraction: float,
+        metrics: MetricsRecorder = NULL_METRICS
+        ) -> tuple:
+    # A whole pool year the way DataPersist.run_like_veriport_would runs it:
+    # each period only sees the days up to the day before it starts.
+    # Returns the session and the final score. A year still in progress
+    # (its days end before the year does) stops after the last period its
+    # days cover, and the session is left unfinished.
+    population = PopulationYear.from_dict(population)
+    periods = get_period_calendar(inception, schedule)
+    session = CalculatorSession(schedule, inception, disallow, dr_fraction, al_fraction, metrics)
+    score = 0
+    for period_index in range(periods.num_periods + 1):
+        # the days up to the day before the period starts, see
+        # DataPersist.trim_population_to_period
+        if period_index == 0:
+            end = inception
+        elif period_index >= periods.num_periods:
+            end = periods.ends[-1]
+        else:
+            end = periods.starts[period_index] - timedelta(days=1)
+        if period_index > 0 and end > population.last_day:
+            break
+        new_days = population.window(session.population.next_day, end)
+        (score, _) = session.advance(period_index, new_days.counts, render_html=False)
+    return (session, score)
@@ -0,0 +1,252 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from bisect import bisect_right
+from datetime import date
+from itertools import accumulate
+
+try:
+    from .file_io import process_line, is_blank_or_header, PopulationFileError, stream_population_from_file
+    from .population_index import PopulationIndex
+    from .population_year import PopulationYear
+except ImportError:
+    from file_io import process_line, is_blank_or_header, PopulationFileError, stream_population_from_file
+    from population_index import PopulationIndex
+    from population_year import PopulationYear
+
+
+class ChangePointPopulation:
+    # A pool's daily donor counts kept the way the VP format sends them: the
+    # days the headcount changed and what it changed to. Run j covers the
+    # days [starts[j], starts[j+1]) (offsets from the first day) at a count of
+    # values[j]. With a prefix sum over the runs every question the Employer
+    # asks is a bisect over the k change points, O(log k), instead of
+    # expanding the year to one slot per day.
+    #
+    # It answers the same queries as PopulationIndex, so Employer.initialize
+    # takes either, and the fleet engine works out its period inputs from it
+    # directly. interval() and to_dense() expand the days when something
+    # really needs them one by one.
+
+    __slots__ = ('_first', '_num_days', '_starts', '_values', '_prefix', '_negatives', '_min_table')
+
+    def __init__(self, first_day: date, num_days: int, starts: list[int], values: list[int]):
+        if len(starts) == 0 or starts[0] != 0 or len(starts) != len(values):
+            raise ValueError('runs must start on the first day and have one value each')
+        if num_days <= starts[-1]:
+            raise ValueError(f'{num_days} days do not reach the last change on day {starts[-1]}')
+        self._first = first_day.toordinal()
+        self._num_days = num_days
+        self._starts = starts
+        self._values = values
+        lengths = [b - a for (a, b) in zip(starts, starts[1:] + [num_days])]
+        self._prefix = list(accumulate((v * n for (v, n) in zip(values, lengths)), initial=0))
+        self._negatives = list(accumulate((1 if v < 0 else 0 for v in values), initial=0))
+        self._min_table = PopulationIndex.build_min_table(values)
+
+    @staticmethod
+    def from_counts(first_day: date, counts) -> 'ChangePointPopulation':
+        # compress dense daily counts
+        starts = []
+        values = []
+        for i, c in enumerate(counts):
+            if i == 0 or c != values[-1]:
+                starts.append(i)
+                values.append(c)
+        return ChangePointPopulation(first_day, len(counts), starts, values)
+
+    @staticmethod
+    def from_population(population) -> 'ChangePointPopulation':
+        population = PopulationYear.from_dict(population)
+        return ChangePointPopulation.from_counts(population.inception, population.counts)
+
+    def to_dense(self) -> PopulationYear:
+        population = PopulationYear.starting_on(self.first_day)
+        for (j, start) in enumerate(self._starts):
+            population.fill_to(population.offset + start, self._values[j-1] if j > 0 else 0)
+        population.fill_to(population.offset + self._num_days, self._values[-1])
+        return population
+
+    @property
+    def num_changes(self) -> int:
+        return len(self._starts)
+
+    @property
+    def first_day(self) -> date:
+        return date.fromordinal(self._first)
+
+    @property
+    def last_day(self) -> date:
+        return date.fromordinal(self._first + self._num_days - 1)
+
+    # the same as PopulationYear.inception and PopulationYear.year
+    @property
+    def inception(self) -> date:
+        return self.first_day
+
+    @property
+    def year(self) -> int:
+        return self.first_day.year
+
+    def __len__(self) -> int:
+        return self._num_days
+
+    def __contains__(self, day: date) -> bool:
+        return 0 <= day.toordinal() - self._first < self._num_days
+
+    def __getitem__(self, day: date) -> int:
+        return self.count_on(day)
+
+    def _bounds(self, start: date, end: date) -> tuple:
+        lo = start.toordinal() - self._first
+        hi = end.toordinal() - self._first + 1
+        if hi <= lo:
+            return (0, 0)
+        if lo < 0 or hi > self._num_days:
+            raise KeyError(f'population does not cover [{start} to {end}]')
+        return (lo, hi)
+
+    def _run(self, i: int) -> int:
+        return bisect_right(self._starts, i) - 1
+
+    def _sum_before(self, i: int) -> int:
+        # sum of the counts of days [0, i)
+        if i == 0:
+            return 0
+        j = self._run(i - 1)
+        return self._prefix[j] + self._values[j] * (i - self._starts[j])
+
+    def count_on(self, day: date) -> int:
+        if day not in self:
+            raise KeyError(day)
+        return self._values[self._run(day.toordinal() - self._first)]
+
+    def interval(self, start: date, end: date) -> list[int]:
+        (lo, hi) = self._bounds(start, end)
+        counts = []
+        j = self._run(lo) if hi > lo else 0
+        for i in range(lo, hi):
+            if j + 1 < len(self._starts) and self._starts[j + 1] == i:
+                j += 1
+            counts.append(self._values[j])
+        return counts
+
+    def interval_sum(self, start: date, end: date) -> int:
+        (lo, hi) = self._bounds(start, end)
+        return self._sum_before(hi) - self._sum_before(lo)
+
+    def interval_average(self, start: date, end: date) -> float:
+        (lo, hi) = self._bounds(start, end)
+        return float(self._sum_before(hi) - self._sum_before(lo)) / float(hi - lo)
+
+    def has_negative(self, start: date, end: date) -> bool:
+        (lo, hi) = self._bounds(start, end)
+        if hi == lo:
+            return False
+        return self._negatives[self._run(hi - 1) + 1] > self._negatives[self._run(lo)]
+
+    def minimum(self, start: date, end: date) -> int:
+        (lo, hi) = self._bounds(start, end)
+        if hi == lo:
+            raise ValueError(f'empty interval [{start} to {end}]')
+        (j_lo, j_hi) = (self._run(lo), self._run(hi - 1) + 1)
+        level = (j_hi - j_lo).bit_length() - 1
+        row = self._min_table[level]
+        return min(row[j_lo], row[j_hi - (1 << level)])
+
+    @property
+    def total(self) -> int:
+        return self._prefix[-1]
+
+    @property
+    def average(self) -> int:
+        if self._num_days == 0:
+            return 0
+        return round(self.total / self._num_days)
+
+
+##############################
+#         VP LOADING         #
+##############################
+
+# The same rules as file_io.load_population_from_vp_lines: nothing counts
+# before the first positive change, that day is the inception, changes add
+# to the running headcount and the last count runs to Dec 31.
+
+def load_change_points_from_vp_lines(lines) -> tuple:
+    inception = None
+    starts = []
+    values = []
+    rejected = 0
+    for i, line in enumerate(lines):
+        (d, delta) = process_line(line, i)
+        if d is None or delta is None:
+            if not is_blank_or_header(line, i):
+                rejected += 1
+            continue
+        if inception is None:
+            if delta <= 0:
+                continue
+            inception = d
+            starts.append(0)
+            values.append(delta)
+            continue
+        if d.year != inception.year:
+            raise PopulationFileError(f'line {i+1}: data spans multiple years ({inception.year} and {d.year})')
+
+        offset = d.toordinal() - inception.toordinal()
+        if offset < starts[-1]:
+            raise PopulationFileError(f'line {i+1}: {d} is before an earlier line')
+        if delta == 0:
+            continue
+        if offset == starts[-1]:
+            values[-1] += delta
+        else:
+            starts.append(offset)
+            values.append(values[-1] + delta)
+
+    if inception is None:
+        raise PopulationFileError('no inception date found')
+
+    # changes that cancel out on the same day leave two runs with one value
+    (merged_starts, merged_values) = ([], [])
+    for (s, v) in zip(starts, values):
+        if len(merged_values) == 0 or v != merged_values[-1]:
+            merged_starts.append(s)
+            merged_values.append(v)
+
+    num_days = PopulationYear.days_in(inception.year) - (inception.timetuple().tm_yday - 1)
+    return (ChangePointPopulation(inception, num_days, merged_starts, merged_values), rejected)
+
+
+def load_change_points_from_vp_file(filename: str) -> ChangePointPopulation:
+    with open(filename, 'r') as f:
+        return load_change_points_from_vp_lines(f)[0]
+
+
+# A pool that changes headcount on more than one day in DENSE_RATIO is
+# expanded after all: a PopulationIndex answers in O(1) instead of O(log k)
+# and the runs would not save much.
+DENSE_RATIO = 8
+
+
+def load_compact_population_from_vp_lines(lines) -> tuple:
+    (population, rejected) = load_change_points_from_vp_lines(lines)
+    if population.num_changes * DENSE_RATIO > len(population):
+        return (population.to_dense(), rejected)
+    return (population, rejected)
+
+
+# returns (population, number of lines that could not be read), like
+# file_io.stream_population_from_file, but a VP file with few changes comes
+# back as change points. Natural files list every day, so they stay dense.
+def stream_compact_population_from_file(datafile: str, vp_format: bool) -> tuple:
+    if not vp_format:
+        return stream_population_from_file(datafile, vp_format)
+    with open(datafile, 'r') as f:
+        try:
+            return load_compact_population_from_vp_lines(f)
+        except ValueError as exc:
+            raise PopulationFileError(f'{datafile}: {exc}') from exc
@@ -0,0 +1,42 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from change_points import ChangePointPopulation, load_change_points_from_vp_file, load_compact_population_from_vp_lines
+from file_io import load_population_from_vp_file
+from fleet_calculator import period_inputs
+from period_calendar import get_period_calendar
+from population_index import PopulationIndex
+from schedule import Schedule
+
+
+def test_change_points_answer_like_population_index(input_file):
+    dense = load_population_from_vp_file(input_file)
+    index = PopulationIndex(dense)
+    changes = load_change_points_from_vp_file(input_file)
+
+    assert changes.first_day == index.first_day
+    assert changes.last_day == index.last_day
+    assert changes.total == index.total
+    assert changes.to_dense().counts.tolist() == dense.counts.tolist()
+    for schedule in Schedule:
+        periods = get_period_calendar(dense.inception, schedule)
+        for (start, end) in zip(periods.starts, periods.ends):
+            assert changes.count_on(start) == index.count_on(start)
+            assert changes.interval_sum(start, end) == index.interval_sum(start, end)
+            assert changes.minimum(start, end) == index.minimum(start, end)
+            assert changes.has_negative(start, end) == index.has_negative(start, end)
+            assert changes.interval_average(start, end) == index.interval_average(start, end)
+        for lagged in (False, True):
+            assert period_inputs(changes, schedule, lagged) == period_inputs(dense, schedule, lagged)
+
+
+def test_busy_pools_fall_back_to_dense():
+    # a pool that starts in December and changes nearly every day
+    lines = ['2023-12-01,10\n'] + [f'2023-12-{day:02},1\n' for day in range(2, 30)]
+    (few, _) = load_compact_population_from_vp_lines(lines[:3])
+    (many, _) = load_compact_population_from_vp_lines(lines)
+    assert isinstance(few, ChangePointPopulation)
+    assert not isinstance(many, ChangePointPopulation)
+    assert many.counts[-1] == 38
@@ -0,0 +1,173 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import argparse
+import sys
+
+
+# Quick commands for short lived job runners:
+#
+#   python cli.py schedule monthly --inception 2023-03-15
+#   python cli.py convert veriport_input/cab.csv --to bin
+#   python cli.py requirements veriport_input/cab.csv --sch monthly --period 3
+#   python cli.py overcount --sch monthly --mu 0.01 --sig 2 --inception 2023-03-15
+#
+# Each command imports only what it needs, and none of them import pydantic:
+# requirements runs the fleet engine, which does the same arithmetic as the
+# Calculator without the Employer and Substance models.
+
+
+def is_true(s: str) -> bool:
+    return s.lower()[0] == 't'
+
+
+def load_input(filename: str, vp_format: bool, pool_id: int):
+    if filename.endswith('.bin'):
+        from population_bin import load_population_from_bin_file
+        return load_population_from_bin_file(filename, pool_id)
+    from file_io import stream_population_from_file
+    return stream_population_from_file(filename, vp_format)[0]
+
+
+def schedule_command(args: argparse.Namespace) -> int:
+    from datetime import date
+    from schedule import Schedule
+    from period_calendar import get_period_calendar
+
+    schedule = Schedule.from_string_to_schedule(args.name)
+    inception = date.fromisoformat(args.inception) if args.inception else date(date.today().year, 1, 1)
+    periods = get_period_calendar(inception, schedule)
+    print(f'{Schedule.as_str(schedule)} ({int(schedule)} periods a year)')
+    for p in range(periods.num_periods):
+        (start, end, days, _) = periods.period(p)
+        print(f'{p},{start},{end},{days}')
+    return 0
+
+
+def convert_command(args: argparse.Namespace) -> int:
+    import os
+    population = load_input(args.file, is_true(args.vp), args.pool)
+    out = args.out
+    if out is None:
+        suffix = {'vp': '_vp.csv', 'natural': '_nat.csv', 'bin': '.bin'}[args.to]
+        out = os.path.splitext(args.file)[0] + suffix
+    if args.to == 'bin':
+        from population_bin import write_population_bin
+        write_population_bin(out, [(args.pool, population, None)])
+    elif args.to == 'vp':
+        from file_io import write_population_to_vp_file
+        write_population_to_vp_file(population, out)
+    else:
+        from file_io import write_population_to_natural_file
+        write_population_to_natural_file(population, out)
+    print(out)
+    return 0
+
+
+def requirements_command(args: argparse.Namespace) -> int:
+    import random
+    from fleet_calculator import generate_fleet_results, period_day_bounds
+    from population_year import PopulationYear
+    from schedule import Schedule
+
+    population = load_input(args.file, is_true(args.vp), args.pool)
+    schedule = Schedule.from_string_to_schedule(args.sch)
+    periods = period_day_bounds(population.inception, schedule)
+    wanted = range(len(periods)) if args.period is None else [args.period]
+    if wanted[-1] >= len(periods) or wanted[0] < 0:
+        print(f'{Schedule.as_str(schedule)} has periods 0 to {len(periods)-1} for {population.inception}')
+        return 1
+
+    # an estimate only looks at the days before its period starts, so pad
+    # the days we do not know yet with the last count
+    (first, _) = periods[wanted[-1]]
+    if population.stop < first:
+        print(f'the population ends on {population.last_day}, before period {wanted[-1]} starts')
+        return 1
+    padded = population.copy()
+    padded.fill_to(PopulationYear.days_in(population.year), population.counts[-1])
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    [result] = generate_fleet_results([padded], schedule, args.disallow, args.dr, args.al, lagged_start_counts=True)
+    print('period,drug,alcohol')
+    for p in wanted:
+        print(f'{p},{result.dr.required_tests_predicted[p]},{result.al.required_tests_predicted[p]}')
+    return 0
+
+
+def overcount_command(args: argparse.Namespace) -> int:
+    from datetime import date
+    from overcount_distribution import OvercountDistribution
+    from schedule import Schedule
+
+    schedule = Schedule.from_string_to_schedule(args.sch)
+    model = OvercountDistribution(args.mu, args.sig, args.dr, args.al, lagged_start_counts=True)
+    if args.inception is None:
+        levels = model.for_random_pools(schedule)
+    else:
+        levels = model.for_inception(date.fromisoformat(args.inception), schedule)
+    print('level,probability')
+    for e in levels:
+        if levels[e] >= 0.00005:
+            print(f'{e},{levels[e]:.4f}')
+    return 0
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Arguments: command (schedule, convert, requirements, overcount) and its options'
+        )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    schedule = commands.add_parser('schedule', help='print the periods of a schedule')
+    schedule.add_argument('name', type=str, help='the testing schedule (MONTHLY, QUARTERLY, etc.)')
+    schedule.add_argument('--inception', type=str, help='pool inception (YYYY-MM-DD), Jan 1 this year by default')
+    schedule.set_defaults(run=schedule_command)
+
+    convert = commands.add_parser('convert', help='convert a population file between VP, natural and binary')
+    convert.add_argument('file', type=str, help='population file (.csv or .bin)')
+    convert.add_argument('--to', type=str, choices=['vp', 'natural', 'bin'], required=True)
+    convert.add_argument('--vp', type=str, help='whether a csv input is in VP format', default='true')
+    convert.add_argument('--pool', type=int, help='pool id in a .bin file', default=0)
+    convert.add_argument('--out', type=str, help='file to write', default=None)
+    convert.set_defaults(run=convert_command)
+
+    requirements = commands.add_parser('requirements', help='print the tests required per period')
+    requirements.add_argument('file', type=str, help='population file (.csv or .bin)')
+    requirements.add_argument('--sch', type=str, help='the testing schedule', default='quarterly')
+    requirements.add_argument('--period', type=int, help='only this period', default=None)
+    requirements.add_argument('--vp', type=str, help='whether a csv input is in VP format', default='true')
+    requirements.add_argument('--pool', type=int, help='pool id in a .bin file', default=0)
+    requirements.add_argument('--disallow', type=int, help='percent chance of turning a 0 into a 1', default=100)
+    requirements.add_argument('--dr', type=float, help='drug fraction', default=.5)
+    requirements.add_argument('--al', type=float, help='alcohol fraction', default=.1)
+    requirements.add_argument('--seed', type=int, help='seed for the zero test correction', default=None)
+    requirements.set_defaults(run=requirements_command)
+
+    overcount = commands.add_parser('overcount', help='print the chance of each final overcount error level')
+    overcount.add_argument('--sch', type=str, help='the testing schedule', default='quarterly')
+    overcount.add_argument('--mu', type=float, help='mu value of gaussian', default=0.01)
+    overcount.add_argument('--sig', type=float, help='sigma value of gaussian', default=2.0)
+    overcount.add_argument('--inception', type=str, help='pool inception (YYYY-MM-DD), random pools by default')
+    overcount.add_argument('--dr', type=float, help='drug fraction', default=.5)
+    overcount.add_argument('--al', type=float, help='alcohol fraction', default=.1)
+    overcount.set_defaults(run=overcount_command)
+
+    args = parser.parse_args()
+    return args
+
+
+def main() -> int:
+    args = get_args()
+    try:
+        return args.run(args)
+    except (OSError, ValueError) as exc:
+        print(f'{args.command}: {exc}')
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
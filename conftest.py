@@ -0,0 +1,39 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import glob
+import os
+import random
+
+import pytest
+
+from file_io import population_dict_from_file
+from population_year import PopulationYear
+
+INPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'veriport_input')
+
+
+def pytest_generate_tests(metafunc):
+    # a test that takes input_file runs once for every bundled population file
+    if 'input_file' in metafunc.fixturenames:
+        input_files = sorted(glob.glob(os.path.join(INPUT_DIR, '*.csv')))
+        metafunc.parametrize('input_file', input_files, ids=os.path.basename)
+
+
+@pytest.fixture
+def input_dir() -> str:
+    return INPUT_DIR
+
+
+@pytest.fixture
+def cab_population(input_dir) -> PopulationYear:
+    return population_dict_from_file(os.path.join(input_dir, 'cab.csv'), True)
+
+
+@pytest.fixture
+def fixed_zero_draw(monkeypatch) -> None:
+    # the zero test correction draws from random.randint; fix the draw at 50
+    # (so disallow 0 never adds a test) and runs can be compared
+    monkeypatch.setattr(random, 'randint', lambda a, b: 50)
@@ -8,29 +8,56 @@ import os
 import json
 from datetime import date, timedelta
 
-from schedule import Schedule
-from calculator import get_calculator_instance
-from initialize_json import compile_json
-
-from file_io import string_to_date
-from file_io import write_population_to_natural_file
-from file_io import write_population_to_vp_file
+try:
+    from .schedule import Schedule
+    from .calculator import CalculatorSession
+    from .initialize_json import compile_json
+    from .metrics import MetricsRecorder, NULL_METRICS
+    from .tracing import Tracer, TraceLevel
+    from .state_store import StateStore, Durability
+    from .population_year import PopulationYear
+    from .substance_codec import decode_substance
+    from .file_io import string_to_date
+    from .file_io import write_population_to_natural_file
+    from .file_io import write_population_to_vp_file
+    from .file_io import vp_to_natural
+    from .file_io import natural_to_vp
+    from .population_bin import write_population_bin
+except ImportError:
+    from schedule import Schedule
+    from calculator import CalculatorSession
+    from initialize_json import compile_json
+    from metrics import MetricsRecorder, NULL_METRICS
+    from tracing import Tracer, TraceLevel
+    from state_store import StateStore, Durability
+    from population_year import PopulationYear
+    from substance_codec import decode_substance
+    from file_io import string_to_date
+    from file_io import write_population_to_natural_file
+    from file_io import write_population_to_vp_file
+    from file_io import vp_to_natural
+    from file_io import natural_to_vp
+    from population_bin import write_population_bin
 
 
 class DataPersist:
 
     def __init__(self,
                  schedule: Schedule,
-                 population: dict,
+                 population: PopulationYear,
                  base_dir: str,
                  sub_dir: str,
                  base_name: str,
                  input_data_file: str,
-                 vp_format: bool):
+                 vp_format: bool,
+                 metrics: MetricsRecorder = NULL_METRICS,
+                 trace_sink=None,
+                 state_store: StateStore = None,
+                 resume: bool = False):
 
         self.schedule = schedule
-        self.population = population
-        self.inception = list(population.keys())[0]
+        self.population = PopulationYear.from_dict(population)
+        self.inception = self.population.inception
         self.base_name = base_name
         self.output_dir = os.path.join(base_dir, sub_dir)
         os.makedirs(self.output_dir, exist_ok=True)
@@ -52,44 +79,68 @@ class DataPersist:
         # needed to load the population from a file:
         self.input_data_file = input_data_file
         self.vp_format = vp_format
+        self.metrics = metrics
+        # gets the full trace of run_like_veriport_would, if given
+        self.trace_sink = trace_sink
+        # the states are kept here between periods; with resume a run picks
+        # up after the last period the store committed instead of starting over
+        if state_store is None:
+            state_store = StateStore(self.storage_dir, Durability.BATCH)
+        self.state_store = state_store
+        self.resume = resume
 
     # used in run_like_veriport_would
     @property
     def num_periods(self) -> int:
         return len(self.period_start_dates)
 
+    # names this run in the state store's checkpoint, so a resume never
+    # picks up the state of another schedule or pool year
+    @property
+    def run_id(self) -> dict:
+        return {
+            'schedule': Schedule.as_str(self.schedule),
+            'inception': self.inception.isoformat(),
+            'num_periods': self.num_periods,
+            }
+
     @property
     def last_day_of_year(self) -> date:
         return self.inception.replace(month=12, day=31)
 
-    # used in run_like_veriport_would
-    def store_reports(self, html: str) -> int:
+    @property
+    def report_file(self) -> str:
         standard_schedule_str = Schedule.as_str(self.schedule)
         base_name = self.base_name + f'_{standard_schedule_str}'
-        outfile = os.path.join(self.storage_dir, f'{base_name}')
-        html = html.split('\n')
-        with open(f'{outfile}.html', 'w') as f:
-            for line in html:
-                f.write(line+'\n')
+        return os.path.join(self.storage_dir, f'{base_name}.html')
+
+    # The report files have always ended with one extra newline after the
+    # html, keep it so they stay byte for byte the same
+    def store_reports(self, html: str) -> int:
+        with open(self.report_file, 'w') as f:
+            f.write(html)
+            f.write('\n')
+
+    # used in run_like_veriport_would
+    def stream_reports(self, session: CalculatorSession) -> None:
+        with open(self.report_file, 'w') as f:
+            session.write_html_report(f)
+            f.write('\n')
 
     # used in run_like_veriport_would
     def store_json(self, tmp_json, file_name) -> None:
-        json_file = os.path.join(self.storage_dir, file_name)
-        with open(json_file, 'w') as f:
-            f.write(tmp_json)
+        self.state_store.put(file_name, tmp_json)
 
     # used in run_like_veriport_would
     def retrieve_json(self, file_name) -> str:
-        json_file = os.path.join(self.storage_dir, file_name)
-        with open(json_file, 'r') as f:
-            return f.read()
+        return self.state_store.get(file_name)
 
     # add this to better mimic the data that Veriport will load
     # the data we assume is loaded is from inception to:
     #   inception    if period_index == 0
     #   end of year  if period index >= num_periods
     #   last day of previous period otherwise
-    def trim_population_to_period(self, period_index) -> dict:
+    def trim_population_to_period(self, period_index) -> PopulationYear:
         start_date = self.inception
         if period_index == 0:
             end_date = self.inception
@@ -98,52 +149,82 @@ class DataPersist:
         else:
             end_date = self.period_start_dates[period_index] - timedelta(days=1)
 
-        trimed_pop = {}
-        for d in self.population:
-            if d >= start_date and d <= end_date:
-                trimed_pop[d] = self.population[d]
-        return trimed_pop
+        return self.population.window(start_date, end_date)
+
+    def start_session(self, last_period, disallow: int, dr_fraction: float, al_fraction: float) -> CalculatorSession:
+        # a new session, or the one the last committed period left
+        tracer = Tracer(TraceLevel.DETAIL, ring_size=4*(self.num_periods+1), sink=self.trace_sink)
+        if last_period is not None:
+            print(f'resuming {self.base_name} after period {last_period}')
+            session = CalculatorSession.from_snapshot(
+                self.schedule,
+                self.inception,
+                self.trim_population_to_period(last_period).counts,
+                last_period+1,
+                self.retrieve_json('tmp_dr.json'),
+                self.retrieve_json('tmp_al.json'),
+                tracer
+                )
+            session.metrics = self.metrics
+            return session
+        return CalculatorSession(
+            self.schedule,
+            self.inception,
+            disallow,
+            dr_fraction,
+            al_fraction,
+            self.metrics,
+            tracer
+            )
 
     def run_like_veriport_would(self):
+        # the debug lines printed at the end come from the tracer's ring,
+        # which holds both records of every period of both substances
         score = 0
-        dr_json = ''
-        al_json = ''
-        html = ''
         disallow = 0
         dr_fraction = .5
         al_fraction = .1
-        debug_all_data_dr = []
-        debug_all_data_al = []
-        for period_index in range(self.num_periods+1):
+        last_period = None
+        if self.resume:
+            last_period = self.state_store.recover(self.run_id)
+            if last_period is None:
+                print(f'no stored state of this run for {self.base_name}, starting over')
+        else:
+            self.state_store.reset(self.run_id)
+        if last_period is not None and last_period > self.num_periods:
+            # past the end of this year, so it cannot be this run's state
+            print(f'stored state of {self.base_name} ends after period {last_period} of {self.num_periods}, starting over')
+            self.state_store.reset(self.run_id)
+            last_period = None
+        if last_period == self.num_periods:
+            # the year was already run to the end, nothing to redo
+            print(f'{self.base_name} already ran every period')
+            return self.stored_score()
+
+        session = self.start_session(last_period, disallow, dr_fraction, al_fraction)
+        for period_index in range(session.next_period_index, self.num_periods+1):
+            # only hand over the days the session has not seen yet
             pop_subset = self.trim_population_to_period(period_index)
-            calc = get_calculator_instance(
-                self.schedule,
-                self.inception,
-                pop_subset,
-                disallow,
-                dr_fraction,
-                al_fraction
-                )
-
-            (dr_json, al_json, score, html) = calc.process_period(period_index, dr_json, al_json)
+            new_days = pop_subset.window(session.population.next_day, pop_subset.last_day)
 
-            # persist json
-            self.store_json(dr_json, 'tmp_dr.json')
-            self.store_json(al_json, 'tmp_al.json')
+            (score, _) = session.advance(period_index, new_days.counts, render_html=False)
 
-            # flush data
-            dr_json = ''
-            al_json = ''
+            # persist json, the store decides when it reaches the disk
+            (dr_json, al_json) = session.snapshot()
+            with self.metrics.stage('persist'):
+                self.store_json(dr_json, 'tmp_dr.json')
+                self.store_json(al_json, 'tmp_al.json')
+                self.state_store.end_period(period_index)
 
-            # load data
-            dr_json = self.retrieve_json('tmp_dr.json')
-            al_json = self.retrieve_json('tmp_al.json')
+        with self.metrics.stage('persist'):
+            self.state_store.flush()
 
-            debug_all_data_dr = calc.get_debug_all_info(True)
-            debug_all_data_al = calc.get_debug_all_info(False)
+        debug_all_data_dr = session.get_debug_all_info(True)
+        debug_all_data_al = session.get_debug_all_info(False)
 
-        if html is not None:
-            self.store_reports(html)
+        if session.finished:
+            with self.metrics.stage('persist'):
+                self.stream_reports(session)
             print('\ndrugs:')
             for line in debug_all_data_dr:
                 print(line)
@@ -153,18 +234,24 @@ class DataPersist:
 
         return score
 
+    def stored_score(self) -> int:
+        # the score of a run whose last period is in the store
+        dr = decode_substance(self.retrieve_json('tmp_dr.json'))
+        al = decode_substance(self.retrieve_json('tmp_al.json'))
+        return abs(dr.final_overcount()) + abs(al.final_overcount())
+
     # This is the method that we need to give the output to Veriport
     def get_requirements(self, period_index: int, drug: bool) -> int:
-        calc = get_calculator_instance(self.schedule, self.inception, self.population)
-        return calc.get_requirements(period_index, drug)
+        substance = decode_substance(self.retrieve_json('tmp_dr.json' if drug else 'tmp_al.json'))
+        return substance.required_tests_predicted[period_index]
 
     @staticmethod
     def generate_initialization_data_files(
-            population: dict,
+            population: PopulationYear,
             schedule: Schedule,
             generic_filepath: str
             ) -> tuple:
-        start = list(population.keys())[0]
+        start = population.inception
 
         nat_file = generic_filepath + '_nat.csv'
         write_population_to_natural_file(population, nat_file)
@@ -172,6 +259,10 @@ class DataPersist:
         vp_file = generic_filepath + '_vp.csv'
         write_population_to_vp_file(population, vp_file)
 
+        # the same population for readers that map it instead of parsing csv
+        bin_file = generic_filepath + '_pop.bin'
+        write_population_bin(bin_file, [(0, population, schedule)])
+
         employer_dict = compile_json(
             start,
             schedule,
@@ -212,8 +303,6 @@ def get_args() -> argparse.Namespace:
 
 
 def main() -> int:
-    from file_io import vp_to_natural
-    from file_io import natural_to_vp
     args = get_args()
     print(f'{args.vp=}')
     vp = True if args.vp.lower()[0] == 't' else False
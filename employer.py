@@ -8,17 +8,28 @@ from pydantic import BaseModel
 from typing import Optional
 from math import ceil
 import calendar
+import io
 
-RUN_FROM_VERIPORT = True
-
-if RUN_FROM_VERIPORT:
+try:
     from .substance import generate_substance
     from .substance import Substance
-    from .schedule import Schedule
-else:
+    from .schedule import Schedule, period_start_dates_by_month_list
+    from .period_calendar import PeriodCalendar, get_period_calendar
+    from .population_index import PopulationIndex
+    from .change_points import ChangePointPopulation
+    from .substance_codec import encode_substance, decode_substance
+    from .tracing import NULL_TRACER
+    from . import html_report
+except ImportError:
     from substance import generate_substance
     from substance import Substance
-    from schedule import Schedule
+    from schedule import Schedule, period_start_dates_by_month_list
+    from period_calendar import PeriodCalendar, get_period_calendar
+    from population_index import PopulationIndex
+    from change_points import ChangePointPopulation
+    from substance_codec import encode_substance, decode_substance
+    from tracing import NULL_TRACER
+    import html_report
 
 
 class Employer(BaseModel):
@@ -74,27 +85,39 @@ class Employer(BaseModel):
             return ceil(self.fraction_of_year*self.start_count*self.drug_percent)
         return ceil(self.fraction_of_year*self.start_count*self.alcohol_percent)
 
+    @property
+    def period_calendar(self) -> PeriodCalendar:
+        return self._calendar
+
     def period_end_date(self, period_index: int) -> int:
-        if period_index == len(self.period_start_dates)-1:
-            return self.last_day_of_year
-        return (self.period_start_dates[period_index+1]-timedelta(days=1))
+        return self._calendar.ends[period_index]
 
     ########################################
     #    VARIOUS INITIALIZATION METHODS    #
     ########################################
 
     def initialize_periods(self, custom_period_start_dates: list[date] = []) -> None:
-        self.period_start_dates = Employer.initialize_period_start_dates(
-            self.pool_inception,
-            self.schedule
-            )
+        self._calendar = get_period_calendar(self.pool_inception, self.schedule, tuple(custom_period_start_dates))
+        self.period_start_dates = list(self._calendar.starts)
 
     def initialize(self, population: dict, custom_period_start_dates: list = []) -> None:
-        self._population = population
+        # every population query below goes through this index (or the
+        # change points, which answer the same queries)
+        if isinstance(population, (PopulationIndex, ChangePointPopulation)):
+            self._population = population
+        else:
+            self._population = PopulationIndex(population)
         self.initialize_periods(custom_period_start_dates)
 
         self._dr = generate_substance(self.sub_d)
         self._al = generate_substance(self.sub_a)
+        self.attach_tracer(NULL_TRACER)
+
+    def attach_tracer(self, tracer) -> None:
+        # the substances report to tracer, including ones loaded later
+        self._tracer = tracer
+        self._dr._tracer = tracer
+        self._al._tracer = tracer
 
     @staticmethod
     def extended_start_dates(old_dates, additional_dates):
@@ -115,38 +138,27 @@ class Employer(BaseModel):
     ########################################
 
     def population_valid(self, start: date, end: date) -> bool:
-        population = self.get_population_report(start, end)
-        for d in population:
-            if population[d] < 0:
-                # print(f'On {str(d)} population is {population[d]} < 0')
-                return False
-        return True
+        return not self._population.has_negative(start, end)
 
     def get_population_report(self, start: date, end: date) -> list[int]:
-        requested_population = []
-        while start <= end:
-            requested_population.append(self._population[start])
-            start += timedelta(days=1)
-        return requested_population
+        return self._population.interval(start, end)
 
     @property
     def average_population(self) -> int:
-        if len(self._population) == 0:
-            return 0
-        return round(sum(self._population.values()) / len(self._population))
+        return self._population.average
 
     # This is the only code that needs to pull data from the DB
     def fetch_donor_queryset_by_interval(self, start: date, end: date) -> list[int]:
         return self.get_population_report(start, end)
 
+    def donor_sum_by_interval(self, start: date, end: date) -> int:
+        return self._population.interval_sum(start, end)
+
     def donor_count_on(self, day: date) -> int:
-        query_set = self.fetch_donor_queryset_by_interval(day, day)
-        if len(query_set) > 0:
-            return query_set[0]
-        return 0
+        return self._population.count_on(day)
 
     def period_start_end(self, period_index: int) -> tuple:
-        return (self.period_start_dates[period_index], self.period_end_date(period_index))
+        return self._calendar.start_end(period_index)
 
     def make_estimates(self, period_index: int) -> None:
         (start_date, end_date) = self.period_start_end(period_index)
@@ -165,7 +177,7 @@ class Employer(BaseModel):
         self._dr.make_apriori_predictions(period_start_count, start_date, end_date, self.total_days_in_year)
 
     def get_data_to_persist(self) -> tuple:
-        return (self._dr.data_to_persist(), self._al.data_to_persist())
+        return (encode_substance(self._dr), encode_substance(self._al))
 
     def load_persisted_data_and_do_period_calculations(
             self,
@@ -173,18 +185,25 @@ class Employer(BaseModel):
             dr_tmp_json: str,
             al_tmp_json: str
             ) -> int:
+        self.load_persisted_data(dr_tmp_json, al_tmp_json)
+        return self.do_period_calculations(period_index)
+
+    def load_persisted_data(self, dr_tmp_json: str, al_tmp_json: str) -> None:
+        # accepts both the compact and the plain json state
+        try:
+            self._dr = decode_substance(dr_tmp_json)
+        except ValueError as exc:
+            print(f'ERROR: drug json {dr_tmp_json} is invalid: {exc}')
+        try:
+            self._al = decode_substance(al_tmp_json)
+        except ValueError as exc:
+            print(f'ERROR: alcohol json {al_tmp_json} is invalid: {exc}')
+        self.attach_tracer(self._tracer)
+
+    def do_period_calculations(self, period_index: int) -> int:
         (start_date, end_date) = self.period_start_end(period_index)
         period_donor_list = self.fetch_donor_queryset_by_interval(start_date, end_date)
 
-        if not check_substance_json_valid(dr_tmp_json):
-            print(f'ERROR: drug json {dr_tmp_json} is invalid')
-        else:
-            self._dr = Substance.model_validate_json(dr_tmp_json)
-        if not check_substance_json_valid(al_tmp_json):
-            print(f'ERROR: alcohol json {al_tmp_json} is invalid')
-        else:
-            self._al = Substance.model_validate_json(al_tmp_json)
-
         self._al.determine_aposteriori_truth(period_donor_list, self.total_days_in_year)
         self._dr.determine_aposteriori_truth(period_donor_list, self.total_days_in_year)
         return abs(self._dr.final_overcount()) + abs(self._al.final_overcount())
@@ -196,8 +215,7 @@ class Employer(BaseModel):
     def average_pool_size(self, period_index: int) -> float:
         start = self.period_start_dates[period_index]
         end = self.period_end_date(period_index)
-        pop = self.fetch_donor_queryset_by_interval(start, end)
-        return float(sum(pop))/float(len(pop))
+        return self._population.interval_average(start, end)
 
     def generate_csv_report(self) -> str:
         initial_pop = []
@@ -206,10 +224,9 @@ class Employer(BaseModel):
         for p in range(len(self.period_start_dates)):
             (start, end) = self.period_start_end(p)
             s_count = self.donor_count_on(start)
-            all_donors = self.fetch_donor_queryset_by_interval(start, end)
             num_days = (end-start).days + 1
             initial_pop.append(s_count)
-            avg_pop.append(float(sum(all_donors))/float(num_days))
+            avg_pop.append(float(self.donor_sum_by_interval(start, end))/float(num_days))
             percent_of_year.append(float(num_days)/float(self.total_days_in_year))
 
         s = 'Company stats\n'
@@ -255,8 +272,6 @@ class Employer(BaseModel):
         s += f'   Wild guess at inception date for alcoho  : {self.guess_for("alcohol")}\n'
         s += '\nPOPULATION DATA AT EACH PERIOD:\n'
 
-        donor_query_set_for_period = []
-
         s += '   Period |          Date Range           | % of yr |  pop  | Avg pop |  period var\n'
         for p in range(self.num_periods):
             start = self.period_start_dates[p]
@@ -265,14 +280,12 @@ class Employer(BaseModel):
             fract_of_year = float(days)/float(self.total_days_in_year)
             percent_of_yr = Employer.format_float(100.0*fract_of_year)
 
-            p_data = self.fetch_donor_query_set_for_period(p)
-            avg = float(sum(p_data))/float(days)
+            start_count = self.donor_count_on(start)
+            avg = float(self.donor_sum_by_interval(start, end))/float(days)
             avg_s = Employer.format_float(avg)
-            w = min(p_data[0], avg) + 1
-            var = Employer.format_float(float(avg-p_data[0])/w)
-            s += f'        {p+1} | [{start} to {end}]={days} | {percent_of_yr}% |  {p_data[0]}  | {avg_s} | {var}\n'
-
-            donor_query_set_for_period.append(p_data)
+            w = min(start_count, avg) + 1
+            var = Employer.format_float(float(avg-start_count)/w)
+            s += f'        {p+1} | [{start} to {end}]={days} | {percent_of_yr}% |  {start_count}  | {avg_s} | {var}\n'
 
         s += self._dr.make_text_substance_report()
         s += self._al.make_text_substance_report()
@@ -283,90 +296,13 @@ class Employer(BaseModel):
     #         HTML  REPORT       #
     ##############################
 
-    def html_period_row(self, p: int):
-        start = self.period_start_dates[p]
-        end = self.period_end_date(p)
-        days = (end-start).days+1
-        fract_of_year = float(days)/float(self.total_days_in_year)
-        percent_of_yr = Employer.format_float(100.0*fract_of_year)
-
-        p_data = self.fetch_donor_query_set_for_period(p)
-        avg = float(sum(p_data))/float(days)
-        # w = min(p_data[0], avg) + 1
-        # var = Employer.format_float(float(avg-p_data[0])/w)
-        avg_s = Employer.format_float(avg)
-        s = []
-        s.append('          <tr>\n')
-        s.append(f'              <td>{p+1}</td>\n')
-        s.append(f'              <td>{start}</td>\n')
-        # s.append(f'              <td>{end}</td>\n')
-        s.append(f'              <td>{days}</td>\n')
-        s.append(f'              <td>{percent_of_yr}</td>\n')
-        s.append(f'              <td>{p_data[0]}</td>\n')
-        s.append(f'              <td>{avg_s}</td>\n')
-        # s.append(f'              <td>{var}</td>\n')
-        s.append('          </tr>\n')
-        return s
+    def write_html_report(self, out) -> None:
+        html_report.write_html_report(self, out)
 
     def make_html_report(self):
-        s = ''
-        s += '<!DOCTYPE html>\n'
-        s += '<html lang="en">\n'
-        s += '<head>\n'
-        s += '  <title>Bootstrap Example</title>\n'
-        s += '  <meta charset="utf-8">\n'
-        s += '  <meta name="viewport" content="width=device-width, initial-scale=1">\n'
-        s += '  <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.4.1/css/bootstrap.min.css">\n'
-        s += '  <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.6.4/jquery.min.js"></script>\n'
-        s += '  <script src="https://maxcdn.bootstrapcdn.com/bootstrap/3.4.1/js/bootstrap.min.js"></script>\n'
-        s += '</head>\n'
-        s += '<body>\n'
-
-        s += '<div class="container">\n'
-        s += '  <h2>INITIAL DATA ON INCEPTION DATE:</h2>\n'
-        s += f'  <p>Initial Pool Size: {self.start_count} </p>\n'
-        s += f'  <p>Inception Date: {self.pool_inception} </p>\n'
-        s += f'  <p>Percent of Year: {Employer.format_float(100.0 * self.fraction_of_year)}% </p>\n'
-        s += f'  <p>Initial Guess at Num Drug Tests: {self.guess_for("drug")} </p>\n'
-        s += f'  <p>Initial Guess at Num Alcohol Tests: {self.guess_for("alcohol")} </p>\n'
-        s += '   </br>\n'
-        s += '   </hr>\n'
-        s += '   </br>\n'
-        s += '  <h2>POPULATION DATA PER PERIOD:</h2>\n'
-        s += '  <table class="table table-striped">\n'
-        s += '      <thead>\n'
-        s += '          <tr>\n'
-        s += '              <th>Period</th>\n'
-        s += '              <th>Start Date</th>\n'
-        # s += '              <th>End Date</th>\n'
-        s += '              <th>Num Days</th>\n'
-        s += '              <th>% of Year</th>\n'
-        s += '              <th>Start Size</th>\n'
-        s += '              <th>Avg. Size</th>\n'
-        # s += '              <th>Variation</th>\n'
-        s += '          </tr>\n'
-        s += '      </thead>\n'
-        s += '      <tbody>\n'
-
-        for p in range(self.num_periods):
-            row_lines = self.html_period_row(p)
-            for line in row_lines:
-                s += line
-        s += '      </tbody>\n'
-        s += '  </table>\n'
-        s += '</div>\n'
-
-        lines = self._dr.make_html_substance_report()
-        for line in lines:
-            s += line
-
-        lines = self._al.make_html_substance_report()
-        for line in lines:
-            s += line
-
-        s += '</body>\n'
-        s += '</html>\n'
-        return s
+        s = io.StringIO()
+        self.write_html_report(s)
+        return s.getvalue()
 
     @staticmethod
     def set_period_start_dates_by_month_list(
@@ -374,18 +310,7 @@ class Employer(BaseModel):
             month_list: list[int],
             bi: bool = False
             ) -> list[date]:
-        period_start_dates = [pool_inception]
-        year = pool_inception.year
-        for m in month_list:
-            d_1 = date(year=year, month=m, day=1)
-            if pool_inception < d_1:
-                period_start_dates.append(d_1)
-            if bi:
-                d_15 = date(year=year, month=m, day=15)
-                if pool_inception < d_15:
-                    period_start_dates.append(d_15)
-
-        return period_start_dates
+        return period_start_dates_by_month_list(pool_inception, month_list, bi)
 
     @staticmethod
     def initialize_period_start_dates(
@@ -393,41 +318,7 @@ class Employer(BaseModel):
             schedule: Schedule,
             custom_period_start_dates: list[date] = []
             ) -> list[date]:
-        if schedule == Schedule.SEMIMONTHLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12], True)
-
-        if schedule == Schedule.MONTHLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12])
-
-        if schedule == Schedule.BIMONTHLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1, 3, 5, 7, 9, 11])
-
-        if schedule == Schedule.QUARTERLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1, 4, 7, 10])
-
-        if schedule == Schedule.SEMIANNUALLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1, 7])
-
-        if schedule == Schedule.ANNUALLY:
-            return Employer.set_period_start_dates_by_month_list(
-                pool_inception, [1])
-
-        period_start_dates = [pool_inception]
-        for d in sorted(custom_period_start_dates):
-            if d < pool_inception:
-                continue
-            period_start_dates.append(d)
-
-        # dec_15 = self.pool_inception.replace(month=12, day=15)
-        # if self.pool_inception < dec_15:
-        #     self.period_start_dates.append(dec_15)
-
-        return period_start_dates
+        return list(get_period_calendar(pool_inception, schedule, tuple(custom_period_start_dates)).starts)
 
 
 def check_substance_json_valid(item):
@@ -3,19 +3,34 @@
 # Proprietary and confidential
 # Written by John Read <john.read@colibri-software.com>, July 2023
 
-from datetime import date, timedelta
-from dateutil.parser import parse
-# from dateutil.parser import ParseError
-# from dateutil.parser._parser import ParseError
+from datetime import date
 import argparse
 
+try:
+    from .population_year import PopulationYear
+except ImportError:
+    from population_year import PopulationYear
+
+
+class PopulationFileError(ValueError):
+    pass
+
 
-# TODO: figure out how to get rid of the bare except
 def string_to_date(s: str) -> date:
+    s = s.strip()
+    # nearly every row we ingest is YYYY-MM-DD, which needs no dateutil
+    if len(s) == 10 and s[4] == '-' and s[7] == '-':
+        try:
+            return date.fromisoformat(s)
+        except ValueError:
+            pass
+    # a header like 'date' cannot be a date, no need to load dateutil for it
+    if not any(c.isdigit() for c in s):
+        return None
+    from dateutil.parser import parse, ParserError
     try:
         return parse(s).date()
-    # except ParseError:
-    except:
+    except (ParserError, ValueError, OverflowError):
         return None
 
 
@@ -40,77 +55,99 @@ def process_line(line: str, i: int) -> tuple:
     return (d, pop)
 
 
-def load_population_from_vp_line_array(lines: list) -> dict:
-    inception_not_found = True
-    population = {}
+def is_blank_or_header(line: str, i: int) -> bool:
+    # neither of these count as rejected lines
+    return len(line.strip()) == 0 or (i == 0 and not line[:1].isdigit())
+
+
+# lines can be any iterable of lines, including an open file
+def load_population_from_vp_lines(lines) -> tuple:
+    population = None
     last_population_seen = 0
-    last_date_processed = date(year=1900, month=1, day=1)
     year = 1900
+    rejected = 0
     for i, line in enumerate(lines):
         (d, pop) = process_line(line, i)
-        if d is None:
-            # print(f'cannot process line number: {i+1} \"{line}\"')
+        if d is None or pop is None:
+            if not is_blank_or_header(line, i):
+                rejected += 1
             continue
         if year == 1900:
             year = d.year
         elif year != d.year:
-            print(f'array {lines} spans multiple years')
-            exit(0)
+            raise PopulationFileError(f'line {i+1}: data spans multiple years ({year} and {d.year})')
 
-        if inception_not_found and pop > 0:
-            inception_not_found = False
-            last_date_processed = d
+        if population is None and pop > 0:
+            population = PopulationYear.starting_on(d)
             # print(f'Inception: {str(d)} -> {pop=}')
-        if inception_not_found:
+        if population is None:
             continue
 
         # pad out any missing dates with the last population seen
-        while last_date_processed < d:
-            population[last_date_processed] = last_population_seen
-            last_date_processed += timedelta(days=1)
+        day = population.day_index(d)
+        population.fill_to(day, last_population_seen)
 
-        last_date_processed = d
         last_population_seen += pop
-        population[last_date_processed] = last_population_seen
+        population.set(d, last_population_seen)
+
+    if population is None:
+        raise PopulationFileError('no inception date found')
 
     # Now pad out to the end of the year
-    year_end = date(year, month=12, day=31)
-    while last_date_processed <= year_end:
-        population[last_date_processed] = last_population_seen
-        last_date_processed += timedelta(days=1)
-    return population
+    population.fill_to(PopulationYear.days_in(year), last_population_seen)
+    return (population, rejected)
 
 
-def load_population_from_vp_file(filename: str) -> dict:
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        return load_population_from_vp_line_array(lines)
+def load_population_from_natural_lines(lines) -> tuple:
+    population = None
+    year = 1900
+    rejected = 0
+    for i, line in enumerate(lines):
+        (d, pop) = process_line(line, i)
+        if d is None or pop is None:
+            if not is_blank_or_header(line, i):
+                rejected += 1
+            continue
+        if year == 1900:
+            year = d.year
+        elif year != d.year:
+            raise PopulationFileError(f'line {i+1}: data spans multiple years ({year} and {d.year})')
+        if population is None:
+            population = PopulationYear.starting_on(d)
+        population.set(d, pop)
+    if population is None:
+        raise PopulationFileError('no population data found')
+    return (population, rejected)
 
 
-def load_population_from_natural_file(filename: str) -> dict:
-    population = {}
-    year = 1900
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-        for i, line in enumerate(lines):
-            (d, pop) = process_line(line, i)
-            if d is None:
-                # print(f'cannot process line number: {i+1} \"{line}\"')
-                continue
-            if year == 1900:
-                year = d.year
-            elif year != d.year:
-                print(f'{filename} spans multiple years')
-                exit(0)
-            population[d] = pop
-    return population
+def load_population_from_vp_line_array(lines: list) -> PopulationYear:
+    return load_population_from_vp_lines(lines)[0]
 
 
-def population_dict_from_file(datafile: str, vp_format: bool) -> dict:
-    if vp_format:
-        return load_population_from_vp_file(datafile)
-    else:
-        return load_population_from_natural_file(datafile)
+def load_population_from_vp_file(filename: str) -> PopulationYear:
+    return stream_population_from_file(filename, True)[0]
+
+
+def load_population_from_natural_file(filename: str) -> PopulationYear:
+    return stream_population_from_file(filename, False)[0]
+
+
+# returns (population, number of lines that could not be read)
+def stream_population_from_file(datafile: str, vp_format: bool) -> tuple:
+    with open(datafile, 'r') as f:
+        try:
+            if vp_format:
+                return load_population_from_vp_lines(f)
+            return load_population_from_natural_lines(f)
+        except ValueError as exc:
+            raise PopulationFileError(f'{datafile}: {exc}') from exc
+
+
+def population_dict_from_file(datafile: str, vp_format: bool) -> PopulationYear:
+    (population, rejected) = stream_population_from_file(datafile, vp_format)
+    if rejected > 0:
+        print(f'{datafile}: skipped {rejected} unreadable lines')
+    return population
 
 
 def write_population_to_natural_file(population: dict, filename: str) -> None:
@@ -120,7 +157,7 @@ def write_population_to_natural_file(population: dict, filename: str) -> None:
 
 
 def write_population_to_vp_file(population: dict, filename: str) -> None:
-    last_date_processed = list(population.keys())[0]
+    last_date_processed = next(iter(population))
     last_pop_processed = population[last_date_processed]
 
     with open(filename, 'w') as f:
@@ -134,11 +171,7 @@ def write_population_to_vp_file(population: dict, filename: str) -> None:
     # Do a quick test to catch errors
     new_pop = load_population_from_vp_file(filename)
     if not population_valid(new_pop):
-        print('ERROR:')
-        print(f'{population}')
-        print('became\n')
-        print(f'{new_pop}')
-        exit(0)
+        raise PopulationFileError(f'{filename}: {population} became {new_pop}')
 
 
 def natural_to_vp(filename: str) -> str:
@@ -0,0 +1,201 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import date, timedelta
+from itertools import accumulate
+from math import ceil
+from random import randint
+
+try:
+    from .change_points import ChangePointPopulation
+    from .population_year import PopulationYear
+    from .rounding import discretize_float
+    from .schedule import Schedule
+    from .period_calendar import get_period_calendar
+except ImportError:
+    from change_points import ChangePointPopulation
+    from population_year import PopulationYear
+    from rounding import discretize_float
+    from schedule import Schedule
+    from period_calendar import get_period_calendar
+
+
+# This runs the same arithmetic as calculator.generate_results, but for a
+# whole fleet of pools at once and without building a Calculator, an
+# Employer and two Substance models per period. Period calendars are
+# shared by every pool with the same (inception, schedule), and each pool's
+# population is reduced to a prefix sum array once, or read straight off
+# its change points when it was loaded as a ChangePointPopulation.
+#
+# The results match the scalar path bit for bit, including the draws from
+# the random module made by Substance.random_correct_zero_tests, as long
+# as the pools are run in the same order.
+
+
+class SubstanceTrack:
+    # The lists a Substance accumulates over a pool year, and the same
+    # running totals as its ledger
+
+    __slots__ = ('name', 'percent', 'disallow_zero_chance',
+                 'required_tests_predicted', 'aposteriori_truth', 'overcount_error',
+                 'predicted_total', 'truth_total', 'overcount_error_total')
+
+    def __init__(self, name: str, percent: float, disallow_zero_chance: int):
+        self.name = name
+        self.percent = percent
+        self.disallow_zero_chance = disallow_zero_chance
+        self.required_tests_predicted = []
+        self.aposteriori_truth = []
+        self.overcount_error = []
+        self.predicted_total = 0
+        self.truth_total = 0
+        self.overcount_error_total = 0.0
+
+    @property
+    def actual_num_tests_required(self) -> int:
+        return ceil(discretize_float(self.truth_total))
+
+    def final_overcount(self) -> int:
+        return self.predicted_total - self.actual_num_tests_required
+
+    def predict(self, initial_donor_count: int, num_days: int, days_in_year: int) -> None:
+        # Substance.make_apriori_predictions
+        apriori_estimate = (float(num_days*initial_donor_count)/float(days_in_year))*self.percent
+        account_for = min(apriori_estimate, self.overcount_error_total)
+        predicted_tests = self.random_correct_zero_tests(
+            ceil(discretize_float(apriori_estimate - account_for))
+            )
+        self.required_tests_predicted.append(predicted_tests)
+        self.predicted_total += predicted_tests
+
+    def random_correct_zero_tests(self, predicted_num_test: int) -> int:
+        if predicted_num_test > 0:
+            return predicted_num_test
+        if randint(0, 100) <= self.disallow_zero_chance:
+            return 1
+        return 0
+
+    def settle(self, donor_sum: int, days_in_year: int) -> None:
+        # Substance.determine_aposteriori_truth
+        truth = (float(donor_sum)/float(days_in_year)) * self.percent
+        self.aposteriori_truth.append(truth)
+        self.truth_total += truth
+        error = float(self.required_tests_predicted[-1]) - truth
+        self.overcount_error.append(error)
+        self.overcount_error_total += error
+
+
+class FleetResult:
+
+    __slots__ = ('inception', 'schedule', 'dr', 'al')
+
+    def __init__(self, inception: date, schedule: Schedule, dr: SubstanceTrack, al: SubstanceTrack):
+        self.inception = inception
+        self.schedule = schedule
+        self.dr = dr
+        self.al = al
+
+    # same as the score returned by Calculator.process_period for the last period
+    @property
+    def score(self) -> int:
+        return abs(self.dr.final_overcount()) + abs(self.al.final_overcount())
+
+
+def per_pool(value, num_pools: int) -> list:
+    if isinstance(value, (list, tuple)):
+        if len(value) != num_pools:
+            raise ValueError(f'expected {num_pools} values, got {len(value)}')
+        return list(value)
+    return [value] * num_pools
+
+
+def fleet_population(population):
+    # change points are used as they are, anything else is made dense
+    if isinstance(population, ChangePointPopulation):
+        return population
+    return PopulationYear.from_dict(population)
+
+
+def period_day_bounds(inception: date, schedule: Schedule) -> tuple:
+    # (first, last) day-of-year index of each period
+    return get_period_calendar(inception, schedule).day_bounds
+
+
+def generate_fleet_results(
+        populations: list,
+        schedules,
+        disallow,
+        dr_fractions,
+        al_fractions,
+        lagged_start_counts: bool = False
+        ) -> list[FleetResult]:
+    # schedules, disallow and the fractions are either one value for the
+    # whole fleet or one value per pool.
+    #
+    # With lagged_start_counts each estimate after the first only sees the
+    # population up to the day before the period starts, which is what
+    # DataPersist.run_like_veriport_would hands the calculator.
+    num_pools = len(populations)
+    schedules = per_pool(schedules, num_pools)
+    disallow = per_pool(disallow, num_pools)
+    dr_fractions = per_pool(dr_fractions, num_pools)
+    al_fractions = per_pool(al_fractions, num_pools)
+
+    results = []
+    for i, population in enumerate(populations):
+        population = fleet_population(population)
+        inputs = period_inputs(population, schedules[i], lagged_start_counts)
+        days_in_year = PopulationYear.days_in(population.inception.year)
+        (dr, al) = run_substances(inputs, days_in_year, dr_fractions[i], al_fractions[i], disallow[i])
+        results.append(FleetResult(population.inception, schedules[i], dr, al))
+    return results
+
+
+def period_inputs(population: PopulationYear, schedule: Schedule, lagged_start_counts: bool = False) -> list[tuple]:
+    # (start count, days, donor sum) of each period: everything the two
+    # substances need from the population
+    periods = period_day_bounds(population.inception, schedule)
+    if isinstance(population, ChangePointPopulation):
+        return change_point_period_inputs(population, periods, lagged_start_counts)
+    counts = population.counts
+    sums = list(accumulate(counts, initial=0))
+    offset = population.offset
+
+    inputs = []
+    for p, (first, last) in enumerate(periods):
+        if p == 0 or (not lagged_start_counts and first < population.stop):
+            start_count = counts[first - offset]
+        else:
+            start_count = counts[first - offset - 1]
+        donor_sum = sums[last - offset + 1] - sums[first - offset]
+        inputs.append((start_count, last - first + 1, donor_sum))
+    return inputs
+
+
+def change_point_period_inputs(population: ChangePointPopulation, periods: tuple, lagged_start_counts: bool) -> list[tuple]:
+    # the same as period_inputs, but each period is a few bisects over the
+    # change points; they always run to Dec 31, so every period is covered
+    jan_1 = date(population.year, 1, 1).toordinal()
+    inputs = []
+    for p, (first, last) in enumerate(periods):
+        start = date.fromordinal(jan_1 + first)
+        if p == 0 or not lagged_start_counts:
+            start_count = population.count_on(start)
+        else:
+            start_count = population.count_on(start - timedelta(days=1))
+        donor_sum = population.interval_sum(start, date.fromordinal(jan_1 + last))
+        inputs.append((start_count, last - first + 1, donor_sum))
+    return inputs
+
+
+def run_substances(inputs: list[tuple], days_in_year: int, dr_fraction, al_fraction, disallow) -> tuple:
+    dr = SubstanceTrack('drug', float(str(dr_fraction)), int(disallow))
+    al = SubstanceTrack('alcohol', float(str(al_fraction)), int(disallow))
+    for (start_count, num_days, donor_sum) in inputs:
+        al.predict(start_count, num_days, days_in_year)
+        dr.predict(start_count, num_days, days_in_year)
+        al.settle(donor_sum, days_in_year)
+        dr.settle(donor_sum, days_in_year)
+    return (dr, al)
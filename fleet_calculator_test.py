@@ -0,0 +1,32 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import random
+
+from calculator import generate_results
+from file_io import population_dict_from_file
+from fleet_calculator import generate_fleet_results
+from schedule import Schedule
+
+
+# batch_runner, sweep and monte_carlo all rely on the fleet path giving
+# exactly what generate_results gives, random draws included.
+
+
+def test_fleet_matches_generate_results(input_file):
+    population = population_dict_from_file(input_file, True)
+    for schedule in Schedule:
+        for disallow in (0, 50, 100):
+            random.seed(7)
+            calc = generate_results(schedule, population.inception, population, disallow, .5, .1)
+            random.seed(7)
+            [fleet] = generate_fleet_results([population], schedule, disallow, .5, .1)
+
+            for (substance, track) in ((calc.employer._dr, fleet.dr), (calc.employer._al, fleet.al)):
+                case = f'{schedule.name} disallow {disallow} {track.name}'
+                assert track.required_tests_predicted == substance.required_tests_predicted, case
+                assert track.aposteriori_truth == substance.aposteriori_truth, case
+                assert track.overcount_error == substance.overcount_error, case
+                assert track.final_overcount() == substance.final_overcount(), case
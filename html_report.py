@@ -0,0 +1,175 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import date
+from typing import NamedTuple
+
+
+# Writes the html report piece by piece to anything with a write(str)
+# method: an open file, socket.makefile('w'), io.StringIO. The population
+# table comes from PeriodStats computed once from the employer's population
+# index, and nothing is built up into one big string first. The output is
+# the same, byte for byte, as what Employer.make_html_report always returned.
+
+HEADER = (
+    '<!DOCTYPE html>\n'
+    '<html lang="en">\n'
+    '<head>\n'
+    '  <title>Bootstrap Example</title>\n'
+    '  <meta charset="utf-8">\n'
+    '  <meta name="viewport" content="width=device-width, initial-scale=1">\n'
+    '  <link rel="stylesheet" href="https://maxcdn.bootstrapcdn.com/bootstrap/3.4.1/css/bootstrap.min.css">\n'
+    '  <script src="https://ajax.googleapis.com/ajax/libs/jquery/3.6.4/jquery.min.js"></script>\n'
+    '  <script src="https://maxcdn.bootstrapcdn.com/bootstrap/3.4.1/js/bootstrap.min.js"></script>\n'
+    '</head>\n'
+    '<body>\n'
+    '<div class="container">\n'
+    '  <h2>INITIAL DATA ON INCEPTION DATE:</h2>\n'
+)
+
+POPULATION_TABLE_HEAD = (
+    '   </br>\n'
+    '   </hr>\n'
+    '   </br>\n'
+    '  <h2>POPULATION DATA PER PERIOD:</h2>\n'
+    '  <table class="table table-striped">\n'
+    '      <thead>\n'
+    '          <tr>\n'
+    '              <th>Period</th>\n'
+    '              <th>Start Date</th>\n'
+    '              <th>Num Days</th>\n'
+    '              <th>% of Year</th>\n'
+    '              <th>Start Size</th>\n'
+    '              <th>Avg. Size</th>\n'
+    '          </tr>\n'
+    '      </thead>\n'
+    '      <tbody>\n'
+)
+
+TABLE_FOOT = (
+    '      </tbody>\n'
+    '  </table>\n'
+)
+
+SUBSTANCE_TABLE_HEAD = (
+    '  <table class="table table-striped">\n'
+    '      <thead>\n'
+    '          <tr>\n'
+    '              <th>Period</th>\n'
+    '              <th>Tests Prescribed</th>\n'
+    '              <th>Tests Required</th>\n'
+    '              <th>Over Count</th>\n'
+    '          </tr>\n'
+    '      </thead>\n'
+    '      <tbody>\n'
+)
+
+FOOTER = (
+    '</body>\n'
+    '</html>\n'
+)
+
+
+class PeriodStats(NamedTuple):
+    period_index: int
+    start: date
+    end: date
+    days: int
+    fraction_of_year: float
+    start_count: int
+    average: float
+
+
+def format_float(f) -> str:
+    return "{:6.2f}".format(float(f))
+
+
+def format_tests(f) -> str:
+    return "{:7.2f}".format(float(f))
+
+
+def period_stat(employer, p: int) -> PeriodStats:
+    (start, end, days, fraction_of_year) = employer.period_calendar.period(p)
+    return PeriodStats(
+        p,
+        start,
+        end,
+        days,
+        fraction_of_year,
+        employer.donor_count_on(start),
+        float(employer.donor_sum_by_interval(start, end))/float(days))
+
+
+def period_stats(employer) -> list[PeriodStats]:
+    return [period_stat(employer, p) for p in range(employer.num_periods)]
+
+
+def period_row(stats: PeriodStats) -> str:
+    return (
+        '          <tr>\n'
+        f'              <td>{stats.period_index+1}</td>\n'
+        f'              <td>{stats.start}</td>\n'
+        f'              <td>{stats.days}</td>\n'
+        f'              <td>{format_float(100.0*stats.fraction_of_year)}</td>\n'
+        f'              <td>{stats.start_count}</td>\n'
+        f'              <td>{format_float(stats.average)}</td>\n'
+        '          </tr>\n'
+    )
+
+
+def substance_period_row(substance, p: int) -> str:
+    return (
+        '          <tr>\n'
+        f'              <td>{p+1}</td>\n'
+        f'              <td>{substance.required_tests_predicted[p]}</td>\n'
+        f'              <td>{format_tests(substance.aposteriori_truth[p])}</td>\n'
+        f'              <td>{format_tests(substance.overcount_error[p])}</td>\n'
+        '          </tr>\n'
+    )
+
+
+def substance_total_row(substance) -> str:
+    return (
+        '          <tr>\n'
+        '              <td>TOTAL:</td>\n'
+        f'              <td>{substance.predicted_total}</td>\n'
+        f'              <td>{format_tests(substance.truth_total)}</td>\n'
+        f'              <td>{format_tests(substance.overcount_error_total)}</td>\n'
+        '          </tr>\n'
+    )
+
+
+def write_substance_report(substance, out) -> None:
+    out.write('<div class="container">\n')
+    out.write(f'  <h2>{substance.name.upper()} SUMMARY:</h2>\n')
+    out.write(SUBSTANCE_TABLE_HEAD)
+    for p in range(len(substance.aposteriori_truth)):
+        out.write(substance_period_row(substance, p))
+    out.write(substance_total_row(substance))
+    out.write(TABLE_FOOT)
+    out.write('  <p>\n')
+    out.write(f'  TOTAL  PREDICTED: {substance.predicted_total}</br>\n')
+    out.write(f'  ACTUAL REQUIRED: {substance.actual_num_tests_required}</br>\n')
+    out.write(substance.overcount_summary())
+    out.write('  </p>\n')
+    out.write('</div>\n')
+
+
+def write_html_report(employer, out) -> None:
+    out.write(HEADER)
+    out.write(f'  <p>Initial Pool Size: {employer.start_count} </p>\n')
+    out.write(f'  <p>Inception Date: {employer.pool_inception} </p>\n')
+    out.write(f'  <p>Percent of Year: {format_float(100.0 * employer.fraction_of_year)}% </p>\n')
+    out.write(f'  <p>Initial Guess at Num Drug Tests: {employer.guess_for("drug")} </p>\n')
+    out.write(f'  <p>Initial Guess at Num Alcohol Tests: {employer.guess_for("alcohol")} </p>\n')
+    out.write(POPULATION_TABLE_HEAD)
+    for stats in period_stats(employer):
+        out.write(period_row(stats))
+    out.write(TABLE_FOOT)
+    out.write('</div>\n')
+
+    write_substance_report(employer._dr, out)
+    write_substance_report(employer._al, out)
+    out.write(FOOTER)
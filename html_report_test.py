@@ -0,0 +1,34 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import hashlib
+import io
+import json
+import os
+
+import pytest
+
+from calculator import generate_results
+from file_io import population_dict_from_file
+from schedule import Schedule
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# sha256 of Employer.make_html_report for every bundled input and schedule,
+# from the calculator as it was before the report was streamed, with every
+# zero test draw fixed at 50 (so disallow 0 never adds a test)
+with open(os.path.join(HERE, 'html_report_baseline.json'), 'r') as f:
+    BASELINE = json.load(f)
+
+
+@pytest.mark.parametrize('case', sorted(BASELINE))
+def test_streamed_report_matches_baseline(case, input_dir, fixed_zero_draw):
+    (filename, schedule) = case.split(':')
+    population = population_dict_from_file(os.path.join(input_dir, filename), True)
+    calc = generate_results(Schedule[schedule], population.inception, population, 0, .5, .1)
+
+    out = io.StringIO()
+    calc.employer.write_html_report(out)
+    assert hashlib.sha256(out.getvalue().encode()).hexdigest() == BASELINE[case]
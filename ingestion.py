@@ -0,0 +1,163 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import date, timedelta
+import os
+
+try:
+    from .file_io import process_line, is_blank_or_header
+    from .population_index import RunningPopulationIndex
+except ImportError:
+    from file_io import process_line, is_blank_or_header
+    from population_index import RunningPopulationIndex
+
+
+# Daily headcount changes from Veriport, kept per pool in an append only
+# log. Each record is a VP format line (date,delta), so a log is also a VP
+# file that load_population_from_vp_file can read.
+#
+# Next to the log we keep a RunningPopulationIndex of the days that are
+# closed, plus the running headcount of the open day. Recording a change
+# only touches the open day. Closing days appends one count per day to the
+# index, which updates the counts and cumulative sums in O(1) and the
+# minimum table in O(log n) for a log of n days. The index
+# goes straight into Employer.initialize, and session_days() gives a
+# CalculatorSession the days it has not seen yet. History is only read when
+# a log is opened: its lines are replayed once.
+#
+# Lines before the first positive change are ignored, the same as when a VP
+# file is loaded. The inception date is the day of the first positive change.
+
+
+class PopulationLog:
+
+    def __init__(self, filename: str, fsync: bool = False):
+        self.filename = filename
+        self.fsync = fsync
+        self.index = None
+        self.count = 0
+        self.open_day = None
+        self.rejected = 0
+        if os.path.exists(filename):
+            with open(filename, 'r') as f:
+                self.replay(f)
+
+    def replay(self, lines) -> None:
+        for i, line in enumerate(lines):
+            (d, delta) = process_line(line, i)
+            if d is None or delta is None:
+                if not is_blank_or_header(line, i):
+                    self.rejected += 1
+                continue
+            self.apply(d, delta)
+
+    def close(self) -> None:
+        # the log file is only open while a record is written, nothing to do
+        pass
+
+    def __enter__(self) -> 'PopulationLog':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def inception(self) -> date:
+        return None if self.index is None else self.index.first_day
+
+    @property
+    def year(self) -> int:
+        return None if self.index is None else self.index.first_day.year
+
+    @property
+    def closed_through(self) -> date:
+        # the last day in the index
+        if self.index is None or len(self.index) == 0:
+            return None
+        return self.index.last_day
+
+    def apply(self, day: date, delta: int) -> None:
+        if self.index is not None:
+            if day.year != self.year:
+                raise ValueError(f'{day} is not in {self.year}, start a new log for a new pool year')
+            if day < self.open_day:
+                raise ValueError(f'{day} is already closed, the log only goes forward')
+
+        if self.index is None:
+            # nothing happens until the first positive change
+            if delta <= 0:
+                return
+            self.index = RunningPopulationIndex(day)
+            self.open_day = day
+        elif day > self.open_day:
+            self.close_through(day - timedelta(days=1))
+            self.open_day = day
+        self.count += delta
+
+    def record(self, day: date, delta: int) -> None:
+        # check and apply first, so a bad record never reaches the log
+        self.apply(day, delta)
+        # opened for each record, so a store of many pools never holds more
+        # than one file handle
+        with open(self.filename, 'a') as f:
+            f.write(f'{day},{delta}\n')
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close_through(self, day: date) -> None:
+        # every day up to and including day gets the current headcount; the
+        # open day moves to the day after
+        if self.index is None:
+            return
+        day = min(day, self.index.first_day.replace(month=12, day=31))
+        if day < self.index.next_day:
+            return
+        for _ in range(day.toordinal() - self.index.next_day.toordinal() + 1):
+            self.index.append(self.count)
+        self.open_day = max(self.open_day, day + timedelta(days=1))
+
+    def session_days(self, next_day: date) -> list[int]:
+        # the closed counts from next_day on, for CalculatorSession.advance
+        if self.index is None or next_day > self.index.last_day:
+            return []
+        return self.index.interval(next_day, self.index.last_day)
+
+
+class IngestionStore:
+    # One PopulationLog per pool in a directory. A day's update only opens
+    # and appends to the logs of the pools that changed; pools with no
+    # change catch up the next time they are closed.
+
+    def __init__(self, directory: str, fsync: bool = False):
+        self.directory = directory
+        self.fsync = fsync
+        self.logs = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def log_for(self, pool: str) -> PopulationLog:
+        if pool not in self.logs:
+            self.logs[pool] = PopulationLog(os.path.join(self.directory, f'{pool}.csv'), self.fsync)
+        return self.logs[pool]
+
+    def record_day(self, day: date, deltas: dict) -> None:
+        # deltas: pool -> change in headcount on day
+        for pool, delta in deltas.items():
+            self.log_for(pool).record(day, delta)
+
+    def close_through(self, day: date, pools=None) -> None:
+        for pool in (self.logs if pools is None else pools):
+            self.log_for(pool).close_through(day)
+
+    def close(self) -> None:
+        for log in self.logs.values():
+            log.close()
+        self.logs = {}
+
+    def __enter__(self) -> 'IngestionStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,36 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import os
+from datetime import date
+
+import pytest
+
+from ingestion import IngestionStore
+
+
+def open_files() -> int:
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason='needs /proc to count open files')
+def test_many_pools_hold_no_open_files(tmp_path):
+    with IngestionStore(str(tmp_path)) as store:
+        before = open_files()
+        store.record_day(date(2023, 3, 1), {f'pool_{i}': 5 for i in range(500)})
+        store.record_day(date(2023, 3, 2), {f'pool_{i}': 1 for i in range(0, 500, 2)})
+        assert open_files() == before
+
+
+def test_reopened_store_replays_the_logs(tmp_path):
+    with IngestionStore(str(tmp_path)) as store:
+        store.record_day(date(2023, 3, 1), {'a': 5, 'b': 3})
+        store.record_day(date(2023, 3, 4), {'a': -2})
+        store.close_through(date(2023, 3, 5))
+        expected = store.log_for('a').session_days(date(2023, 3, 1))
+
+    with IngestionStore(str(tmp_path)) as store:
+        store.close_through(date(2023, 3, 5), ['a'])
+        assert store.log_for('a').session_days(date(2023, 3, 1)) == expected == [5, 5, 5, 3, 3]
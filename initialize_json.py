@@ -5,18 +5,17 @@
 
 from datetime import date
 
-RUN_FROM_VERIPORT = True
-
-if RUN_FROM_VERIPORT:
-    from .employer import Schedule, Employer
-else:
-    from employer import Schedule, Employer
+try:
+    from .schedule import Schedule
+    from .period_calendar import get_period_calendar
+except ImportError:
+    from schedule import Schedule
+    from period_calendar import get_period_calendar
 
 
 def get_period_start_dates(inception: date, schedule: Schedule) -> list[date]:
-    sd = Employer.initialize_period_start_dates(inception, schedule)
     sd_str = []
-    for d in sd:
+    for d in get_period_calendar(inception, schedule).starts:
         sd_str.append(str(d))
     return sd_str
 
@@ -7,10 +7,8 @@ import argparse
 import os
 
 from schedule import Schedule
-from data_persist import DataPersist
-from random_population import population_dict_from_rand
-from file_io import population_dict_from_file
 
+# everything else is imported by the mode that needs it, see main()
 
 MAX_NUM_TESTS = 500
 
@@ -91,6 +89,62 @@ def get_args() -> argparse.Namespace:
         help='sigma value of gaussian',
         default=2.0
         )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='run the random trials in memory on this many processes (no output files, no trial cap)',
+        default=0
+        )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        help='master seed for the random trials run with --workers',
+        default=0
+        )
+    parser.add_argument(
+        '--batch',
+        type=str,
+        help='directory or glob of population files to run in one process (--sch may be "all" or a list)',
+        default=None
+        )
+    parser.add_argument(
+        '--cache',
+        type=str,
+        help='keep batch results in this directory and reuse them when the same pools are run again',
+        default=None
+        )
+    parser.add_argument(
+        '--years',
+        action='store_true',
+        help='the file holds several pool years: run every year (on --workers processes) and keep each year\'s state'
+        )
+    parser.add_argument(
+        '--analytic',
+        action='store_true',
+        help='work out the random error levels from the model (with --workers also simulate --iter trials to compare)'
+        )
+    parser.add_argument(
+        '--trace',
+        type=str,
+        help='write the full numeric trace of a file run to this csv file',
+        default=None
+        )
+    parser.add_argument(
+        '--durability',
+        type=str,
+        help='when a file run writes its state to disk: none (at the end), batch (every few periods) or period',
+        default='batch'
+        )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='pick a file run up after the last period it wrote to disk'
+        )
+    parser.add_argument(
+        '--metrics',
+        action='store_true',
+        help='print per stage timings and payload sizes for a file run'
+        )
     args = parser.parse_args()
     return args
 
@@ -98,15 +152,68 @@ def get_args() -> argparse.Namespace:
 def main() -> int:
     args = get_args()
 
+    if args.batch is not None:
+        from batch_runner import run_batch, schedules_from_string
+        summary_file = os.path.join(args.dir, 'batch_summary.csv')
+        rows = run_batch(
+            args.batch,
+            args.vp,
+            schedules_from_string(args.sch),
+            summary_file,
+            max(1, args.workers),
+            args.seed,
+            args.cache
+            )
+        failed = sum(1 for row in rows if row[-1] != '')
+        print(f'{len(rows)-failed} pool runs written to {summary_file}, {failed} files failed')
+        return 0
+
     (schedule, base_dir, sub_dir, input_data_file, vp_format, random) = initialize_from_args(args)
 
     if not random:
+        from data_persist import DataPersist
+        from file_io import population_dict_from_file
+        from file_io import PopulationFileError
+        from metrics import TimingRecorder, NULL_METRICS
         filename = args.file
 
         split_filepath = filename.split('/')
         base_name = os.path.splitext(split_filepath[-1])[0]
 
-        population = population_dict_from_file(filename, vp_format)
+        if args.years:
+            from multi_year import run_pool_years
+            storage_dir = os.path.join(base_dir, sub_dir, base_name)
+            try:
+                results = run_pool_years(filename, vp_format, schedule, storage_dir, max(1, args.workers), args.seed)
+            except PopulationFileError as exc:
+                print(f'Cannot load {exc}')
+                return 0
+            for r in results:
+                progress = '' if r.finished else ' (year in progress)'
+                print(f'{r.year}: inception {r.inception}, final overcount {r.score}{progress}')
+            return results[-1].score
+
+        try:
+            population = population_dict_from_file(filename, vp_format)
+        except PopulationFileError as exc:
+            print(f'Cannot load {exc}')
+            return 0
+        metrics = NULL_METRICS
+        if args.metrics:
+            metrics = TimingRecorder({'pool': base_name, 'schedule': Schedule.as_str(schedule)})
+        trace_file = None
+        trace_sink = None
+        if args.trace is not None:
+            from tracing import CsvTraceSink
+            trace_file = open(args.trace, 'w')
+            trace_sink = CsvTraceSink(trace_file)
+        from state_store import StateStore, Durability
+        try:
+            durability = Durability.from_str(args.durability)
+        except ValueError as exc:
+            print(exc)
+            return 0
+        state_store = StateStore(os.path.join(base_dir, sub_dir, base_name), durability)
         data_persist = DataPersist(
             schedule,
             population,
@@ -114,10 +221,45 @@ def main() -> int:
             sub_dir,
             base_name,
             input_data_file,
-            vp_format
+            vp_format,
+            metrics,
+            trace_sink,
+            state_store,
+            args.resume
             )
-        return data_persist.run_like_veriport_would()
+        score = data_persist.run_like_veriport_would()
+        if trace_file is not None:
+            trace_file.close()
+        if args.metrics:
+            print(metrics)
+        return score
+
+    if args.analytic:
+        if args.workers > 0:
+            from monte_carlo import cross_check
+            rows = cross_check(schedule, args.mu, args.sig, args.iter, args.workers, args.seed)
+            print('level,analytic,simulated')
+            for (e, analytic, simulated) in rows:
+                if analytic >= 0.00005 or simulated > 0:
+                    print(f'{e},{analytic:.4f},{simulated:.4f}')
+            print(f'largest difference {max(abs(a - s) for (_, a, s) in rows):.4f} over {args.iter} trials')
+            return 0
+        from overcount_distribution import random_error_levels
+        levels = random_error_levels(schedule, args.mu, args.sig)
+        for e in levels:
+            if levels[e] >= 0.00005:
+                print(f'level {e} errors: {100*levels[e]:.2f}% of pools')
+        return 0
+
+    if args.workers > 0:
+        from monte_carlo import run_trials
+        errors = run_trials(schedule, args.mu, args.sig, args.iter, args.workers, args.seed)
+        for e in sorted(errors):
+            print(f'level {e} errors: hit {errors[e]} errors out of {args.iter}')
+        return 0
 
+    from data_persist import DataPersist
+    from random_population import population_dict_from_rand
     i = 0
     errors = {}
     num_tests = min(args.iter, MAX_NUM_TESTS)
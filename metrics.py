@@ -0,0 +1,109 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from contextlib import nullcontext
+from time import perf_counter
+
+
+# Calculator and CalculatorSession report what they do through one of
+# these. The base class records nothing and hands back the same empty
+# context manager every time, so leaving metrics off costs a method call
+# per stage.
+#
+# Stages used by the calculator:
+#   load      : building the employer / adding population days
+#   validate  : decoding and checking the persisted Substance state
+#   truth     : the aposteriori calculations at the end of a period
+#   estimate  : the apriori predictions at the start of a period
+#   serialize : encoding the Substance state to persist
+#   report    : rendering the html report
+
+_NO_STAGE = nullcontext()
+
+
+class MetricsRecorder:
+
+    def stage(self, name: str):
+        return _NO_STAGE
+
+    def count(self, name: str, n: int = 1) -> None:
+        pass
+
+    def size(self, name: str, num_bytes: int) -> None:
+        pass
+
+
+NULL_METRICS = MetricsRecorder()
+
+
+class _TimedStage:
+
+    __slots__ = ('recorder', 'name', 'start')
+
+    def __init__(self, recorder: 'TimingRecorder', name: str):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.recorder.record(self.name, perf_counter() - self.start)
+
+
+class TimingRecorder(MetricsRecorder):
+    # Keeps totals per stage, call counts and payload sizes. If a hook is
+    # given it is called as hook(tags, stage, seconds) every time a stage
+    # finishes, e.g. to push the sample to a monitoring system. tags
+    # identify the pool, e.g. {'pool': 'cab', 'schedule': 'monthly'}.
+
+    def __init__(self, tags: dict = {}, hook=None):
+        self.tags = dict(tags)
+        self.hook = hook
+        self.seconds = {}
+        self.calls = {}
+        self.counts = {}
+        self.sizes = {}
+
+    def stage(self, name: str) -> _TimedStage:
+        return _TimedStage(self, name)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.hook is not None:
+            self.hook(self.tags, name, seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def size(self, name: str, num_bytes: int) -> None:
+        (total, largest) = self.sizes.get(name, (0, 0))
+        self.sizes[name] = (total + num_bytes, max(largest, num_bytes))
+
+    def summary(self) -> dict:
+        return {
+            'tags': self.tags,
+            'stages': {
+                name: {'seconds': self.seconds[name], 'calls': self.calls[name]}
+                for name in self.seconds
+            },
+            'counts': dict(self.counts),
+            'sizes': {
+                name: {'total_bytes': total, 'max_bytes': largest}
+                for name, (total, largest) in self.sizes.items()
+            },
+        }
+
+    def __str__(self) -> str:
+        s = f'metrics for {self.tags}:\n'
+        for name in self.seconds:
+            s += f'   {name:>10}: {1000.0*self.seconds[name]:9.3f} ms over {self.calls[name]} calls\n'
+        for name in self.counts:
+            s += f'   {name:>10}: {self.counts[name]}\n'
+        for name, (total, largest) in self.sizes.items():
+            s += f'   {name:>10}: {total} bytes total, {largest} bytes max\n'
+        return s
@@ -0,0 +1,96 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import random
+
+try:
+    from .schedule import Schedule
+    from .random_population import generate_random_population_batch
+    from .fleet_calculator import generate_fleet_results
+    from .overcount_distribution import OvercountDistribution
+except ImportError:
+    from schedule import Schedule
+    from random_population import generate_random_population_batch
+    from fleet_calculator import generate_fleet_results
+    from overcount_distribution import OvercountDistribution
+
+# The same settings DataPersist.run_like_veriport_would uses
+DISALLOW = 0
+DR_FRACTION = .5
+AL_FRACTION = .1
+
+TRIALS_PER_CHUNK = 1000
+
+
+# The trials are cut into fixed size chunks and every chunk reseeds the
+# random module from its own seed, so a run is reproducible from the master
+# seed no matter how many workers share the chunks out.
+def chunk_seeds(master_seed: int, num_chunks: int) -> list[int]:
+    rng = random.Random(master_seed)
+    return [rng.getrandbits(64) for _ in range(num_chunks)]
+
+
+def simulate_chunk(job: tuple) -> Counter:
+    (schedule, mu, sigma, num_trials, seed) = job
+    random.seed(seed)
+    populations = generate_random_population_batch(num_trials, mu, sigma)
+    results = generate_fleet_results(
+        populations,
+        schedule,
+        DISALLOW,
+        DR_FRACTION,
+        AL_FRACTION,
+        lagged_start_counts=True
+        )
+    return Counter(r.score for r in results)
+
+
+def run_trials(
+        schedule: Schedule,
+        mu: float,
+        sigma: float,
+        num_trials: int,
+        workers: int = 1,
+        master_seed: int = 0,
+        trials_per_chunk: int = TRIALS_PER_CHUNK
+        ) -> Counter:
+    # returns error level -> number of trials that hit it
+    num_chunks = (num_trials + trials_per_chunk - 1) // trials_per_chunk
+    seeds = chunk_seeds(master_seed, num_chunks)
+    jobs = []
+    for c in range(num_chunks):
+        trials = min(trials_per_chunk, num_trials - c * trials_per_chunk)
+        jobs.append((schedule, mu, sigma, trials, seeds[c]))
+
+    errors = Counter()
+    if workers <= 1:
+        for job in jobs:
+            errors.update(simulate_chunk(job))
+        return errors
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for histogram in pool.map(simulate_chunk, jobs):
+            errors.update(histogram)
+    return errors
+
+
+def cross_check(
+        schedule: Schedule,
+        mu: float,
+        sigma: float,
+        num_trials: int,
+        workers: int = 1,
+        master_seed: int = 0
+        ) -> list[tuple]:
+    # (level, analytic probability, simulated fraction) for every level
+    # either one reaches
+    analytic = OvercountDistribution(mu, sigma, DR_FRACTION, AL_FRACTION).for_random_pools(schedule)
+    simulated = run_trials(schedule, mu, sigma, num_trials, workers, master_seed)
+    rows = []
+    for e in sorted(set(analytic) | set(simulated)):
+        rows.append((e, analytic.get(e, 0.0), simulated[e] / num_trials))
+    return rows
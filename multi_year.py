@@ -0,0 +1,123 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+import io
+import os
+import random
+
+try:
+    from .schedule import Schedule
+    from .calculator import generate_session_results
+    from .pool_years import PoolYearReader
+    from .file_io import PopulationFileError
+except ImportError:
+    from schedule import Schedule
+    from calculator import generate_session_results
+    from pool_years import PoolYearReader
+    from file_io import PopulationFileError
+
+# The same settings DataPersist.run_like_veriport_would uses
+DISALLOW = 0
+DR_FRACTION = .5
+AL_FRACTION = .1
+
+SUMMARY_HEADER = 'year,inception,final_overcount,finished,state_dir\n'
+
+
+# Backfills every pool year in a multi-year population file in one
+# streaming job. PoolYearReader hands out each year as soon as it is read,
+# and the year goes straight to a worker while the next one is still being
+# read. A pool year is run the way run_like_veriport_would runs it: one
+# CalculatorSession fed the days known at each period start.
+#
+# The Substances restart every pool year, so the years do not depend on
+# each other and run concurrently. Each year's persisted state is kept in
+# its own directory (<storage>/<year>/tmp_dr.json, tmp_al.json and the
+# report). The latest year's state is carried forward to <storage>/tmp_dr.json
+# and tmp_al.json, where the period by period runs pick it up.
+#
+# Every year reseeds the random module from the master seed and the year,
+# so a backfill gives the same state however many workers run it.
+#
+# The latest year of a natural file may still be in progress. It is run
+# through the last period its days cover, so its state is the pool's state
+# today; it gets no report, as the year is not done.
+
+
+class YearResult(NamedTuple):
+    year: int
+    inception: object
+    score: int
+    dr_json: str
+    al_json: str
+    html: str
+    finished: bool
+
+
+def run_year(job: tuple) -> YearResult:
+    (population, schedule, seed) = job
+    random.seed(f'{seed}:{population.year}')
+    inception = population.inception
+    (session, score) = generate_session_results(schedule, inception, population, DISALLOW, DR_FRACTION, AL_FRACTION)
+    (dr_json, al_json) = session.snapshot()
+    html = io.StringIO()
+    if session.finished:
+        session.write_html_report(html)
+        html.write('\n')
+    return YearResult(population.year, inception, score, dr_json, al_json, html.getvalue(), session.finished)
+
+
+def store_year(result: YearResult, storage_dir: str, base_name: str, schedule: Schedule) -> str:
+    year_dir = os.path.join(storage_dir, str(result.year))
+    os.makedirs(year_dir, exist_ok=True)
+    write_file(os.path.join(year_dir, 'tmp_dr.json'), result.dr_json)
+    write_file(os.path.join(year_dir, 'tmp_al.json'), result.al_json)
+    if result.finished:
+        write_file(os.path.join(year_dir, f'{base_name}_{Schedule.as_str(schedule)}.html'), result.html)
+    return year_dir
+
+
+def write_file(filename: str, text: str) -> None:
+    with open(filename, 'w') as f:
+        f.write(text)
+
+
+def run_pool_years(
+        datafile: str,
+        vp_format: bool,
+        schedule: Schedule,
+        storage_dir: str,
+        workers: int = 1,
+        seed: int = 0
+        ) -> list[YearResult]:
+    base_name = os.path.splitext(os.path.basename(datafile))[0]
+    os.makedirs(storage_dir, exist_ok=True)
+
+    with open(datafile, 'r') as f:
+        reader = PoolYearReader(f, vp_format)
+        try:
+            if workers <= 1:
+                results = [run_year((population, schedule, seed)) for population in reader]
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(run_year, (population, schedule, seed)) for population in reader]
+                    results = [future.result() for future in futures]
+        except ValueError as exc:
+            raise PopulationFileError(f'{datafile}: {exc}') from exc
+    if reader.rejected > 0:
+        print(f'{datafile}: skipped {reader.rejected} unreadable lines')
+
+    with open(os.path.join(storage_dir, 'years_summary.csv'), 'w') as summary:
+        summary.write(SUMMARY_HEADER)
+        for result in results:
+            year_dir = store_year(result, storage_dir, base_name, schedule)
+            summary.write(f'{result.year},{result.inception},{result.score},{result.finished},{year_dir}\n')
+
+    # carry the latest year forward as the pool's current state
+    write_file(os.path.join(storage_dir, 'tmp_dr.json'), results[-1].dr_json)
+    write_file(os.path.join(storage_dir, 'tmp_al.json'), results[-1].al_json)
+    return results
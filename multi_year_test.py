@@ -0,0 +1,104 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import contextlib
+import io
+import os
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from data_persist import DataPersist
+from file_io import load_population_from_natural_lines
+from multi_year import run_pool_years
+from pool_years import load_pool_years_from_lines
+from schedule import Schedule
+from state_store import StateStore, Durability
+
+
+class StopRun(Exception):
+    pass
+
+
+class StoppingStore(StateStore):
+    # ends the run right after period stop_after is stored
+
+    def __init__(self, directory, stop_after):
+        super().__init__(directory, Durability.PERIOD)
+        self.stop_after = stop_after
+
+    def end_period(self, period_index: int) -> None:
+        super().end_period(period_index)
+        if period_index == self.stop_after:
+            raise StopRun()
+
+
+def natural_lines(first: date, last: date) -> list[str]:
+    lines = []
+    d = first
+    while d <= last:
+        lines.append(f'{d},{20 + d.day % 3 + d.month}\n')
+        d += timedelta(days=1)
+    return lines
+
+
+def vp_lines(seed: int) -> list[str]:
+    # a pool that starts mid February 2021 and changes every week or so until 2023 ends
+    rng = random.Random(seed)
+    lines = ['2021-02-15,30\n']
+    d = date(2021, 2, 15)
+    while True:
+        d += timedelta(days=rng.randint(3, 12))
+        if d.year > 2023:
+            return lines
+        lines.append(f'{d},{rng.randint(-4, 5)}\n')
+
+
+def read_state(directory: str, name: str) -> str:
+    with open(os.path.join(directory, name), 'r') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('schedule', [Schedule.MONTHLY, Schedule.QUARTERLY], ids=lambda s: s.name)
+def test_every_year_matches_a_one_year_run(tmp_path, fixed_zero_draw, schedule):
+    lines = vp_lines(3)
+    datafile = str(tmp_path / 'pool.csv')
+    with open(datafile, 'w') as f:
+        f.writelines(lines)
+    results = run_pool_years(datafile, True, schedule, str(tmp_path / 'years'))
+    (years, _) = load_pool_years_from_lines(lines, True)
+    assert [r.year for r in results] == [2021, 2022, 2023]
+
+    report = f'pool_{Schedule.as_str(schedule)}.html'
+    for (result, population) in zip(results, years):
+        data_persist = DataPersist(schedule, population, str(tmp_path), str(result.year), 'pool', datafile, True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert data_persist.run_like_veriport_would() == result.score
+        year_dir = str(tmp_path / 'years' / str(result.year))
+        for name in ('tmp_dr.json', 'tmp_al.json', report):
+            assert read_state(year_dir, name) == read_state(data_persist.storage_dir, name)
+
+
+def test_year_in_progress_runs_through_its_known_periods(tmp_path, fixed_zero_draw):
+    datafile = str(tmp_path / 'pool.csv')
+    with open(datafile, 'w') as f:
+        f.writelines(natural_lines(date(2021, 6, 1), date(2022, 3, 31)))
+    storage_dir = str(tmp_path / 'years')
+    results = run_pool_years(datafile, False, Schedule.MONTHLY, storage_dir)
+
+    assert [(r.year, r.finished) for r in results] == [(2021, True), (2022, False)]
+    assert not os.path.exists(os.path.join(storage_dir, '2022', 'pool_monthly.html'))
+
+    # the same year run in full, stopped once March is computed
+    (population, _) = load_population_from_natural_lines(natural_lines(date(2022, 1, 1), date(2022, 12, 31)))
+    store = StoppingStore(str(tmp_path / 'full'), 3)
+    data_persist = DataPersist(
+        Schedule.MONTHLY, population, str(tmp_path), 'full', 'pool', datafile, False, state_store=store)
+    with pytest.raises(StopRun), contextlib.redirect_stdout(io.StringIO()):
+        data_persist.run_like_veriport_would()
+
+    assert read_state(storage_dir, 'tmp_dr.json') == read_state(store.directory, 'tmp_dr.json')
+    assert read_state(storage_dir, 'tmp_al.json') == read_state(store.directory, 'tmp_al.json')
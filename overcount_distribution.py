@@ -0,0 +1,224 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from collections import Counter
+from datetime import date, timedelta
+from fractions import Fraction
+from math import erf, exp, floor, sqrt
+
+try:
+    from .schedule import Schedule
+    from .period_calendar import get_period_calendar
+except ImportError:
+    from schedule import Schedule
+    from period_calendar import get_period_calendar
+
+
+# The error levels the random mode gets by simulating pools one day at a
+# time, worked out from the model instead.
+#
+# Substance.make_apriori_predictions takes the error made so far off every
+# estimate, so the tests predicted up to period p are
+# max(C_p, ceil(T_<p + a_p)): the truth of the periods before it plus the
+# estimate for it, or what was already predicted if that is more. Summed
+# over the year nearly every pool ends up at ceil(T_<last + a_last), and
+#
+#     final_overcount = ceil(T + pct*W/D) - ceil(T)
+#
+# where T is the truth for the year, D the days in the year and
+# W = L*c - S: the last period's length times its start count less the sum
+# of its daily counts. Only the drift inside the last period is left in W,
+# W = -sum((L-i)*X_i) over its weekdays i, so W is a weighted sum of
+# int(gauss(mu, sigma)) draws and close to normal. ceil(T) - T is uniform
+# over the pools, which makes the overcount floor(x) or floor(x)+1 with
+# probability frac(x), x = pct*W/D. Drug and alcohol share T up to the
+# ratio of their fractions, so their roundings are coupled, not independent.
+#
+# Left out: the zero test correction (with disallow 0 about 1 in 101 zero
+# predictions becomes 1) and pools that drift down to no one. Neither moves
+# a level by more than a fraction of a percent with the default settings;
+# cross_check in monte_carlo.py compares against the simulator.
+
+DR_FRACTION = .5
+AL_FRACTION = .1
+
+# get_random_date: a day 0-364 into a year from 2016 to 2026
+RANDOM_YEARS = range(2016, 2027)
+RANDOM_DAYS = 365
+
+GRID_POINTS = 161
+GRID_WIDTH = 8.0
+MAX_RATIO_TERMS = 64
+
+
+def normal_cdf(x: float) -> float:
+    return 0.5 * (1.0 + erf(x / sqrt(2.0)))
+
+
+def drift_moments(mu: float, sigma: float) -> tuple:
+    # mean and variance of int(gauss(mu, sigma)), which truncates towards 0
+    if abs(sigma) < 0.000001:
+        return (0.0, 0.0)
+    sigma = abs(sigma)
+    lo = int(floor(mu - 12*sigma)) - 1
+    hi = int(floor(mu + 12*sigma)) + 2
+    (mean, square) = (0.0, 0.0)
+    for k in range(lo, hi):
+        if k > 0:
+            p = normal_cdf((k+1-mu)/sigma) - normal_cdf((k-mu)/sigma)
+        elif k < 0:
+            p = normal_cdf((k-mu)/sigma) - normal_cdf((k-1-mu)/sigma)
+        else:
+            p = normal_cdf((1-mu)/sigma) - normal_cdf((-1-mu)/sigma)
+        mean += k*p
+        square += k*k*p
+    return (mean, square - mean*mean)
+
+
+def last_period_weights(inception: date, schedule: Schedule, lagged_start_counts: bool = True) -> list[int]:
+    # the weight L-i of each weekday i of the last period whose drift ends
+    # up in W. A lagged start count is the day before the period, so the
+    # first day's drift counts too; period 0 always starts from the count on
+    # inception, which has no drift of its own.
+    periods = get_period_calendar(inception, schedule)
+    last = periods.num_periods - 1
+    (start, _, days, _) = periods.period(last)
+    first = 0 if (lagged_start_counts and last > 0) else 1
+    weights = []
+    weekday = start.weekday()
+    for i in range(first, days):
+        if (weekday + i) % 7 < 5:
+            weights.append(days - i)
+    return weights
+
+
+def coupling(dr: float, al: float) -> tuple:
+    # ceil(T) - T for the two substances is (frac(m*v), frac(n*v)) for one
+    # uniform v when dr/al is m/n. (0, 0) when they are taken as independent.
+    if dr <= 0 or al <= 0:
+        return (0, 0)
+    ratio = Fraction(dr / al).limit_denominator(MAX_RATIO_TERMS)
+    if ratio.numerator * ratio.denominator > MAX_RATIO_TERMS or abs(float(ratio) - dr/al) > 1e-9 * dr/al:
+        return (0, 0)
+    return (ratio.numerator, ratio.denominator)
+
+
+def both_round_up(r_dr: float, r_al: float, terms: tuple) -> float:
+    # P(frac(m*v) < r_dr and frac(n*v) < r_al): the overlap of the intervals
+    # [i/m, (i+r_dr)/m) and [j/n, (j+r_al)/n)
+    (m, n) = terms
+    if m == 0:
+        return r_dr * r_al
+    if n == 1:
+        # v < r_al holds floor(m*r_al) whole intervals of frac(m*v) and a part of one more
+        whole = floor(m * r_al)
+        return (whole * r_dr + min(m*r_al - whole, r_dr)) / m
+    if m == 1:
+        whole = floor(n * r_dr)
+        return (whole * r_al + min(n*r_dr - whole, r_al)) / n
+    overlap = 0.0
+    for i in range(m):
+        (a_lo, a_hi) = (i/m, (i+r_dr)/m)
+        for j in range(n):
+            (b_lo, b_hi) = (j/n, (j+r_al)/n)
+            overlap += max(0.0, min(a_hi, b_hi) - max(a_lo, b_lo))
+    return overlap
+
+
+GRID = [GRID_WIDTH * (2.0*k/(GRID_POINTS-1) - 1.0) for k in range(GRID_POINTS)]
+GRID_WEIGHTS = [exp(-z*z/2.0) for z in GRID]
+GRID_WEIGHTS = [w / sum(GRID_WEIGHTS) for w in GRID_WEIGHTS]
+
+
+def level_probabilities(mean: float, variance: float, days_in_year: int, dr: float, al: float, terms: tuple) -> Counter:
+    # error level -> probability when W is normal(mean, variance)
+    levels = Counter()
+    if variance <= 0:
+        points = [(mean, 1.0)]
+    else:
+        sd = sqrt(variance)
+        points = [(mean + sd*z, w) for (z, w) in zip(GRID, GRID_WEIGHTS)]
+    for (w, weight) in points:
+        x_dr = dr * w / days_in_year
+        x_al = al * w / days_in_year
+        (f_dr, f_al) = (floor(x_dr), floor(x_al))
+        (r_dr, r_al) = (x_dr - f_dr, x_al - f_al)
+        both = both_round_up(r_dr, r_al, terms)
+        levels[abs(f_dr+1) + abs(f_al+1)] += weight * both
+        levels[abs(f_dr+1) + abs(f_al)] += weight * (r_dr - both)
+        levels[abs(f_dr) + abs(f_al+1)] += weight * (r_al - both)
+        levels[abs(f_dr) + abs(f_al)] += weight * (1.0 - r_dr - r_al + both)
+    return levels
+
+
+class OvercountDistribution:
+    # Works out error level probabilities for one set of drift parameters.
+    # Pools whose last periods have the same weights share one result.
+
+    def __init__(
+            self,
+            mu: float,
+            sigma: float,
+            dr: float = DR_FRACTION,
+            al: float = AL_FRACTION,
+            lagged_start_counts: bool = True
+            ):
+        self.mu = mu
+        self.sigma = sigma
+        self.dr = dr
+        self.al = al
+        self.lagged_start_counts = lagged_start_counts
+        (self.drift_mean, self.drift_variance) = drift_moments(mu, sigma)
+        self.terms = coupling(dr, al)
+        self._levels = {}
+
+    def _weighted_levels(self, sum_w: int, sum_w2: int, days_in_year: int) -> Counter:
+        key = (sum_w, sum_w2, days_in_year)
+        if key not in self._levels:
+            # W = -sum((L-i)*X_i)
+            self._levels[key] = level_probabilities(
+                -self.drift_mean * sum_w,
+                self.drift_variance * sum_w2,
+                days_in_year,
+                self.dr,
+                self.al,
+                self.terms
+                )
+        return self._levels[key]
+
+    def for_inception(self, inception: date, schedule: Schedule) -> dict:
+        # error level -> probability for a pool starting on inception
+        weights = last_period_weights(inception, schedule, self.lagged_start_counts)
+        days_in_year = get_period_calendar(inception, schedule).days_in_year
+        levels = self._weighted_levels(sum(weights), sum(w*w for w in weights), days_in_year)
+        return as_distribution(levels)
+
+    def for_random_pools(self, schedule: Schedule, years=RANDOM_YEARS, days: int = RANDOM_DAYS) -> dict:
+        # error level -> probability over the inceptions the random mode
+        # draws, each equally likely
+        mixed = Counter()
+        for year in years:
+            jan_1 = date(year=year, month=1, day=1)
+            for d in range(days):
+                inception = jan_1 + timedelta(days=d)
+                weights = last_period_weights(inception, schedule, self.lagged_start_counts)
+                days_in_year = get_period_calendar(inception, schedule).days_in_year
+                mixed.update(self._weighted_levels(sum(weights), sum(w*w for w in weights), days_in_year))
+        return as_distribution(mixed)
+
+
+def as_distribution(levels: Counter) -> dict:
+    total = sum(levels.values())
+    return {e: p / total for (e, p) in sorted(levels.items()) if p / total > 1e-12}
+
+
+def random_error_levels(
+        schedule: Schedule,
+        mu: float,
+        sigma: float,
+        dr: float = DR_FRACTION,
+        al: float = AL_FRACTION
+        ) -> dict:
+    return OvercountDistribution(mu, sigma, dr, al).for_random_pools(schedule)
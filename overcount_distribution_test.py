@@ -0,0 +1,21 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import pytest
+
+from monte_carlo import cross_check
+from schedule import Schedule
+
+# A simulated fraction over 2000 trials has a standard deviation of at most
+# about 0.011, so this is more than four of them.
+TOLERANCE = 0.05
+
+
+@pytest.mark.parametrize('schedule', [Schedule.MONTHLY, Schedule.QUARTERLY], ids=lambda s: s.name)
+def test_analytic_levels_agree_with_simulation(schedule):
+    rows = cross_check(schedule, 0.01, 2.0, 2000, master_seed=1)
+    assert sum(analytic for (_, analytic, _) in rows) == pytest.approx(1.0)
+    for (level, analytic, simulated) in rows:
+        assert abs(analytic - simulated) < TOLERANCE, f'level {level}'
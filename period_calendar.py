@@ -0,0 +1,102 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from bisect import bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import NamedTuple
+import calendar
+
+try:
+    from .schedule import Schedule, period_start_dates
+except ImportError:
+    from schedule import Schedule, period_start_dates
+
+
+# The periods of one pool year, worked out once and shared: every Employer,
+# the fleet engine and the daily jobs with the same inception, schedule and
+# custom start dates get the same (immutable) PeriodCalendar from
+# get_period_calendar. Looking up the period a day falls in is a bisect over
+# the start ordinals; everything about a period is precomputed.
+
+
+class PeriodBounds(NamedTuple):
+    start: date
+    end: date
+    days: int
+    fraction_of_year: float
+
+
+class PeriodCalendar:
+
+    __slots__ = ('inception', 'schedule', 'starts', 'ends', 'days_in_year', '_start_ordinals', '_periods',
+                 '_day_bounds')
+
+    def __init__(self, inception: date, schedule: Schedule, custom_starts: tuple = ()):
+        self.inception = inception
+        self.schedule = schedule
+        self.starts = tuple(period_start_dates(inception, schedule, list(custom_starts)))
+        last_day = inception.replace(month=12, day=31)
+        self.ends = tuple([d - timedelta(days=1) for d in self.starts[1:]] + [last_day])
+        self.days_in_year = calendar.isleap(inception.year) + 365
+
+        self._start_ordinals = [d.toordinal() for d in self.starts]
+        self._periods = []
+        for (start, end) in zip(self.starts, self.ends):
+            days = (end-start).days+1
+            self._periods.append(PeriodBounds(start, end, days, float(days)/float(self.days_in_year)))
+        jan_1 = date(year=inception.year, month=1, day=1).toordinal()
+        self._day_bounds = tuple(
+            (start.toordinal() - jan_1, end.toordinal() - jan_1) for (start, end) in zip(self.starts, self.ends))
+
+    @property
+    def year(self) -> int:
+        return self.inception.year
+
+    @property
+    def num_periods(self) -> int:
+        return len(self.starts)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def period_of(self, day: date) -> int:
+        # -1 before inception and num_periods after the pool year, the same
+        # as Calculator.find_period_index always returned
+        if day.year > self.year:
+            return self.num_periods
+        if day < self.inception:
+            return -1
+        return bisect_right(self._start_ordinals, day.toordinal()) - 1
+
+    def period(self, period_index: int) -> PeriodBounds:
+        return self._periods[period_index]
+
+    def start_end(self, period_index: int) -> tuple:
+        return (self.starts[period_index], self.ends[period_index])
+
+    def days(self, period_index: int) -> int:
+        return self._periods[period_index].days
+
+    def fraction_of_year(self, period_index: int) -> float:
+        return self._periods[period_index].fraction_of_year
+
+    @property
+    def day_bounds(self) -> tuple:
+        # (first, last) day of year index of each period, Jan 1 being 0
+        return self._day_bounds
+
+    def __repr__(self) -> str:
+        return f'PeriodCalendar({self.inception}, {Schedule.as_str(self.schedule)}, {self.num_periods} periods)'
+
+
+@lru_cache(maxsize=4096)
+def cached_period_calendar(inception: date, schedule: Schedule, custom_starts: tuple) -> PeriodCalendar:
+    return PeriodCalendar(inception, schedule, custom_starts)
+
+
+def get_period_calendar(inception: date, schedule: Schedule, custom_starts=()) -> PeriodCalendar:
+    # always call the cached function the same way so every caller shares one entry
+    return cached_period_calendar(inception, schedule, tuple(custom_starts))
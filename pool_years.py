@@ -0,0 +1,119 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+try:
+    from .file_io import process_line, is_blank_or_header, PopulationFileError
+    from .population_year import PopulationYear
+except ImportError:
+    from file_io import process_line, is_blank_or_header, PopulationFileError
+    from population_year import PopulationYear
+
+
+# Reads a population file that holds several years of a pool's history and
+# cuts it into one PopulationYear per pool year, in one pass over the
+# lines. Each year is handed out as soon as the first line of a later year
+# shows up, so a caller can start on a year while the rest of the file is
+# still being read.
+#
+# VP files are changes to the headcount, and the headcount carries over
+# from Dec 31 into Jan 1. A year after the first starts on Jan 1 with the
+# carried count (a year with no lines at all is a whole year at that
+# count). If the pool was down to no one, the year starts on the first day
+# the headcount goes positive again, the same as the first year's
+# inception. Natural files are counts, so each year simply starts on its
+# first line.
+#
+# A single year file gives the same PopulationYear as the one year loaders.
+
+
+class PoolYearReader:
+
+    def __init__(self, lines, vp_format: bool = True):
+        self.lines = lines
+        self.vp_format = vp_format
+        self.rejected = 0
+
+    def __iter__(self):
+        if self.vp_format:
+            return self.vp_years()
+        return self.natural_years()
+
+    def valid_lines(self):
+        for i, line in enumerate(self.lines):
+            (d, pop) = process_line(line, i)
+            if d is None or pop is None:
+                if not is_blank_or_header(line, i):
+                    self.rejected += 1
+                continue
+            yield (i, d, pop)
+
+    def vp_years(self):
+        population = None
+        year = None
+        count = 0
+        started = False
+        for (i, d, delta) in self.valid_lines():
+            if year is not None and d.year < year:
+                raise PopulationFileError(f'line {i+1}: {d} is in a year that is already closed')
+            if year is not None and d.year > year:
+                # close the year, then any years with no lines in them
+                if population is not None:
+                    population.fill_to(PopulationYear.days_in(year), count)
+                    yield population
+                for gap_year in range(year + 1, d.year):
+                    if count > 0:
+                        population = PopulationYear(gap_year)
+                        population.fill_to(PopulationYear.days_in(gap_year), count)
+                        yield population
+                population = None
+                if count > 0:
+                    population = PopulationYear(d.year)
+            year = d.year
+
+            if population is None:
+                # nothing counts until the headcount goes positive
+                if count + delta <= 0:
+                    continue
+                population = PopulationYear.starting_on(d)
+                started = True
+
+            population.fill_to(population.day_index(d), count)
+            count += delta
+            population.set(d, count)
+
+        if not started:
+            raise PopulationFileError('no inception date found')
+        if population is not None:
+            population.fill_to(PopulationYear.days_in(year), count)
+            yield population
+
+    def natural_years(self):
+        population = None
+        for (i, d, pop) in self.valid_lines():
+            if population is not None and d.year < population.year:
+                raise PopulationFileError(f'line {i+1}: {d} is in a year that is already closed')
+            if population is not None and d.year > population.year:
+                yield population
+                population = None
+            if population is None:
+                population = PopulationYear.starting_on(d)
+            population.set(d, pop)
+        if population is None:
+            raise PopulationFileError('no population data found')
+        yield population
+
+
+def load_pool_years_from_lines(lines, vp_format: bool = True) -> tuple:
+    # ([PopulationYear, ...] in year order, number of lines that could not be read)
+    reader = PoolYearReader(lines, vp_format)
+    return (list(reader), reader.rejected)
+
+
+def stream_pool_years_from_file(datafile: str, vp_format: bool) -> tuple:
+    with open(datafile, 'r') as f:
+        try:
+            return load_pool_years_from_lines(f, vp_format)
+        except ValueError as exc:
+            raise PopulationFileError(f'{datafile}: {exc}') from exc
@@ -0,0 +1,79 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import date
+
+import pytest
+
+from file_io import PopulationFileError, load_population_from_vp_lines
+from pool_years import load_pool_years_from_lines
+
+
+def vp_years(lines: list[str]) -> list:
+    (years, rejected) = load_pool_years_from_lines(lines, True)
+    assert rejected == 0
+    return years
+
+
+def whole_year(population) -> bool:
+    return population.inception == date(population.year, 1, 1) and population.last_day == date(population.year, 12, 31)
+
+
+def test_one_year_file_matches_the_one_year_loader(input_file):
+    with open(input_file, 'r') as f:
+        lines = f.readlines()
+    (years, _) = load_pool_years_from_lines(lines, True)
+    (population, _) = load_population_from_vp_lines(lines)
+    assert len(years) == 1
+    assert years[0].inception == population.inception
+    assert years[0].counts.tolist() == population.counts.tolist()
+
+
+def test_headcount_carries_over_from_dec_31_to_jan_1():
+    years = vp_years(['2021-03-01,10\n', '2021-12-31,2\n', '2022-02-01,-3\n'])
+    assert [p.year for p in years] == [2021, 2022]
+    assert years[0].inception == date(2021, 3, 1)
+    assert years[0][date(2021, 12, 30)] == 10
+    assert years[0][date(2021, 12, 31)] == 12
+    assert whole_year(years[1])
+    assert years[1][date(2022, 1, 1)] == 12
+    assert years[1][date(2022, 1, 31)] == 12
+    assert years[1][date(2022, 2, 1)] == 9
+    assert years[1][date(2022, 12, 31)] == 9
+
+
+def test_years_without_lines_are_whole_years_at_the_carried_count():
+    years = vp_years(['2020-06-01,5\n', '2023-03-01,1\n'])
+    assert [p.year for p in years] == [2020, 2021, 2022, 2023]
+    for population in years[1:3]:
+        assert whole_year(population)
+        assert set(population.values()) == {5}
+    assert whole_year(years[3])
+    assert years[3][date(2023, 2, 28)] == 5
+    assert years[3][date(2023, 3, 1)] == 6
+
+
+def test_pool_restarts_when_the_headcount_goes_positive_again():
+    years = vp_years(['2021-05-01,4\n', '2021-08-01,-4\n', '2023-03-10,3\n'])
+    # 2022 had no one in the pool, so it is no pool year
+    assert [p.year for p in years] == [2021, 2023]
+    assert years[0][date(2021, 7, 31)] == 4
+    assert years[0][date(2021, 12, 31)] == 0
+    assert years[1].inception == date(2023, 3, 10)
+    assert years[1][date(2023, 3, 10)] == 3
+    assert years[1][date(2023, 12, 31)] == 3
+
+
+def test_negative_changes_before_a_restart_are_skipped():
+    years = vp_years(['2021-05-01,4\n', '2021-08-01,-4\n', '2022-02-01,-2\n', '2022-03-10,3\n', '2022-04-01,-1\n'])
+    assert [p.year for p in years] == [2021, 2022]
+    assert years[1].inception == date(2022, 3, 10)
+    assert years[1][date(2022, 3, 31)] == 3
+    assert years[1][date(2022, 4, 1)] == 2
+
+
+def test_lines_of_a_closed_year_are_refused():
+    with pytest.raises(PopulationFileError, match='line 3'):
+        vp_years(['2021-05-01,4\n', '2022-01-10,1\n', '2021-12-01,1\n'])
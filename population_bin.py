@@ -0,0 +1,232 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from array import array
+import argparse
+import glob
+import mmap
+import os
+import struct
+import sys
+
+try:
+    from .population_year import PopulationYear
+    from .schedule import Schedule
+    from .file_io import population_dict_from_file
+    from .file_io import write_population_to_natural_file
+    from .file_io import write_population_to_vp_file
+except ImportError:
+    from population_year import PopulationYear
+    from schedule import Schedule
+    from file_io import population_dict_from_file
+    from file_io import write_population_to_natural_file
+    from file_io import write_population_to_vp_file
+
+
+# Binary population files hold one or more pool years:
+#
+#   file header   : magic, version, number of pools               (16 bytes)
+#   per pool      : pool id, year, inception slot, stop slot,
+#                   schedule (0 if unknown)                        (16 bytes)
+#                   366 little endian int32 day-of-year counts     (1464 bytes)
+#
+# Every record has the same size, so pool n starts at a fixed offset and a
+# pool's counts can be handed to PopulationYear as a view straight into the
+# mmapped file. Loading a fleet is a page-in instead of a parse.
+
+MAGIC = b'VPPB'
+VERSION = 1
+SLOTS = 366
+
+FILE_HEADER = struct.Struct('<4sHxxI4x')
+RECORD_HEADER = struct.Struct('<qHHHH')
+PAYLOAD_SIZE = 4 * SLOTS
+RECORD_SIZE = RECORD_HEADER.size + PAYLOAD_SIZE
+
+
+def write_population_bin(filename: str, pools) -> None:
+    # pools is an iterable of (pool_id, population, schedule or None)
+    pools = list(pools)
+    seen = set()
+    with open(filename, 'wb') as f:
+        f.write(FILE_HEADER.pack(MAGIC, VERSION, len(pools)))
+        for (pool_id, population, schedule) in pools:
+            if pool_id in seen:
+                raise ValueError(f'pool {pool_id} appears twice')
+            seen.add(pool_id)
+            population = PopulationYear.from_dict(population)
+            f.write(RECORD_HEADER.pack(
+                pool_id,
+                population.year,
+                population.offset,
+                population.stop,
+                int(schedule) if schedule is not None else 0))
+            payload = array('i', population._data.tobytes())
+            payload.extend([0] * (SLOTS - len(payload)))
+            if sys.byteorder == 'big':
+                payload.byteswap()
+            f.write(payload.tobytes())
+
+
+class PopulationBinFile:
+    # Read only access to a binary population file. The PopulationYears it
+    # hands out point into the mapped file, so keep it open while they are
+    # in use.
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mm)
+
+        (magic, version, num_pools) = FILE_HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{filename} is not a population file')
+        if version != VERSION:
+            raise ValueError(f'{filename} has unsupported version {version}')
+        if len(self._view) != FILE_HEADER.size + num_pools * RECORD_SIZE:
+            raise ValueError(f'{filename} is truncated')
+
+        self._records = {}
+        for n in range(num_pools):
+            pool_id = RECORD_HEADER.unpack_from(self._view, self.record_offset(n))[0]
+            self._records[pool_id] = n
+
+    @staticmethod
+    def record_offset(n: int) -> int:
+        return FILE_HEADER.size + n * RECORD_SIZE
+
+    @property
+    def pool_ids(self) -> list[int]:
+        return list(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, pool_id: int) -> bool:
+        return pool_id in self._records
+
+    def header(self, pool_id: int) -> tuple:
+        # (pool_id, year, inception slot, stop slot, schedule)
+        return RECORD_HEADER.unpack_from(self._view, self.record_offset(self._records[pool_id]))
+
+    def schedule(self, pool_id: int) -> Schedule:
+        value = self.header(pool_id)[4]
+        return Schedule(value) if value != 0 else None
+
+    def load(self, pool_id: int) -> PopulationYear:
+        (_, year, offset, stop, _) = self.header(pool_id)
+        start = self.record_offset(self._records[pool_id]) + RECORD_HEADER.size
+        payload = self._view[start:start + 4 * PopulationYear.days_in(year)]
+        if sys.byteorder == 'big':
+            data = array('i', payload.tobytes())
+            data.byteswap()
+            return PopulationYear(year, offset, stop, memoryview(data))
+        return PopulationYear(year, offset, stop, payload.cast('i'))
+
+    def copy(self, pool_id: int) -> PopulationYear:
+        # a PopulationYear that owns its data and outlives the file
+        (_, year, offset, stop, _) = self.header(pool_id)
+        start = self.record_offset(self._records[pool_id]) + RECORD_HEADER.size
+        with self._view[start:start + 4 * PopulationYear.days_in(year)] as payload:
+            data = array('i', payload.tobytes())
+        if sys.byteorder == 'big':
+            data.byteswap()
+        return PopulationYear(year, offset, stop, memoryview(data))
+
+    def items(self):
+        for pool_id in self._records:
+            yield (pool_id, self.load(pool_id))
+
+    def close(self) -> None:
+        # fails with BufferError while loaded PopulationYears are alive
+        self._view.release()
+        self._mm.close()
+
+    def __enter__(self) -> 'PopulationBinFile':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def load_population_from_bin_file(filename: str, pool_id: int = 0) -> PopulationYear:
+    with PopulationBinFile(filename) as pool_file:
+        return pool_file.copy(pool_id)
+
+
+##############################
+#         CONVERTERS         #
+##############################
+
+def csv_to_bin(filename: str, vp_format: bool, pool_id: int = 0, schedule: Schedule = None) -> str:
+    population = population_dict_from_file(filename, vp_format)
+    new_file = f'{os.path.splitext(filename)[0]}.bin'
+    write_population_bin(new_file, [(pool_id, population, schedule)])
+    return new_file
+
+
+def bin_to_natural(filename: str, pool_id: int = 0) -> str:
+    population = load_population_from_bin_file(filename, pool_id)
+    new_file = f'{os.path.splitext(filename)[0]}_{pool_id}_nat.csv'
+    write_population_to_natural_file(population, new_file)
+    return new_file
+
+
+def bin_to_vp(filename: str, pool_id: int = 0) -> str:
+    population = load_population_from_bin_file(filename, pool_id)
+    new_file = f'{os.path.splitext(filename)[0]}_{pool_id}_vp.csv'
+    write_population_to_vp_file(population, new_file)
+    return new_file
+
+
+def pack_directory(pattern: str, vp_format: bool, out_file: str) -> dict:
+    # one fleet file from many csv files; returns pool id -> source file
+    sources = {}
+    pools = []
+    for pool_id, filename in enumerate(sorted(glob.glob(pattern))):
+        pools.append((pool_id, population_dict_from_file(filename, vp_format), None))
+        sources[pool_id] = filename
+    write_population_bin(out_file, pools)
+    return sources
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Arguments: csv files to pack, vp_format, output file'
+        )
+    parser.add_argument(
+        '--glob',
+        type=str,
+        help='csv files to pack into one binary file',
+        default='veriport_input/*.csv'
+        )
+    parser.add_argument(
+        '--vp',
+        type=str,
+        help='Whether to read in VP or native format',
+        default='true'
+        )
+    parser.add_argument(
+        '--out',
+        type=str,
+        help='binary file to write',
+        default='populations.bin'
+        )
+    args = parser.parse_args()
+    return args
+
+
+def main() -> int:
+    args = get_args()
+    vp = True if args.vp.lower()[0] == 't' else False
+    sources = pack_directory(args.glob, vp, args.out)
+    for pool_id in sources:
+        print(f'{pool_id},{sources[pool_id]}')
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import date
+from itertools import accumulate
+
+try:
+    from .population_year import PopulationYear
+except ImportError:
+    from population_year import PopulationYear
+
+
+class PopulationIndex:
+    # Read only view of a pool's daily donor counts. Everything is stored
+    # in arrays indexed by (day.toordinal() - first ordinal) along with
+    # cumulative sums, so every interval question the Employer asks is
+    # answered in O(1) instead of walking the population day by day.
+    #
+    # Days that were not in the population passed in behave like missing
+    # dict keys: asking about them raises a KeyError.
+
+    __slots__ = ('_first', '_counts', '_sums', '_negatives', '_present', '_min_table')
+
+    def __init__(self, population):
+        if isinstance(population, PopulationYear):
+            # dense already, no need to go through date keys
+            self._first = population.first_ordinal
+            counts = population.counts.tolist()
+            present = [1] * len(counts)
+        else:
+            (counts, present) = self.from_mapping(population)
+
+        self._counts = counts
+        self._sums = list(accumulate(counts, initial=0))
+        self._negatives = list(accumulate((1 if c < 0 else 0 for c in counts), initial=0))
+        self._present = list(accumulate(present, initial=0))
+        self._min_table = PopulationIndex.build_min_table(counts)
+
+    def from_mapping(self, population) -> tuple:
+        if len(population) == 0:
+            self._first = 0
+            num_days = 0
+        else:
+            ordinals = [d.toordinal() for d in population]
+            self._first = min(ordinals)
+            num_days = 1 + max(ordinals) - self._first
+
+        counts = [0] * num_days
+        present = [0] * num_days
+        for d, count in population.items():
+            i = d.toordinal() - self._first
+            counts[i] = count
+            present[i] = 1
+        return (counts, present)
+
+    @staticmethod
+    def build_min_table(counts: list[int]) -> list[list[int]]:
+        # sparse table: level k holds the minimum of each run of 2**k days
+        table = [counts]
+        width = 1
+        while 2 * width <= len(counts):
+            prev = table[-1]
+            table.append([min(prev[i], prev[i + width]) for i in range(len(prev) - width)])
+            width *= 2
+        return table
+
+    @property
+    def first_day(self) -> date:
+        return date.fromordinal(self._first)
+
+    @property
+    def last_day(self) -> date:
+        return date.fromordinal(self._first + len(self._counts) - 1)
+
+    def __len__(self) -> int:
+        return self._present[-1]
+
+    def __contains__(self, day: date) -> bool:
+        i = day.toordinal() - self._first
+        if i < 0 or i >= len(self._counts):
+            return False
+        return self._present[i+1] > self._present[i]
+
+    def __getitem__(self, day: date) -> int:
+        return self.count_on(day)
+
+    def _bounds(self, start: date, end: date) -> tuple:
+        lo = start.toordinal() - self._first
+        hi = end.toordinal() - self._first + 1
+        if hi <= lo:
+            return (0, 0)
+        if lo < 0 or hi > len(self._counts) or self._present[hi] - self._present[lo] != hi - lo:
+            raise KeyError(f'population does not cover [{start} to {end}]')
+        return (lo, hi)
+
+    def count_on(self, day: date) -> int:
+        if day not in self:
+            raise KeyError(day)
+        return self._counts[day.toordinal() - self._first]
+
+    def interval(self, start: date, end: date) -> list[int]:
+        (lo, hi) = self._bounds(start, end)
+        return self._counts[lo:hi]
+
+    def interval_sum(self, start: date, end: date) -> int:
+        (lo, hi) = self._bounds(start, end)
+        return self._sums[hi] - self._sums[lo]
+
+    def interval_average(self, start: date, end: date) -> float:
+        (lo, hi) = self._bounds(start, end)
+        return float(self._sums[hi] - self._sums[lo]) / float(hi - lo)
+
+    def has_negative(self, start: date, end: date) -> bool:
+        (lo, hi) = self._bounds(start, end)
+        return self._negatives[hi] > self._negatives[lo]
+
+    def minimum(self, start: date, end: date) -> int:
+        (lo, hi) = self._bounds(start, end)
+        if hi == lo:
+            raise ValueError(f'empty interval [{start} to {end}]')
+        level = (hi - lo).bit_length() - 1
+        row = self._min_table[level]
+        return min(row[lo], row[hi - (1 << level)])
+
+    @property
+    def total(self) -> int:
+        return self._sums[-1]
+
+    @property
+    def average(self) -> int:
+        if len(self) == 0:
+            return 0
+        return round(self.total / len(self))
+
+
+class RunningPopulationIndex(PopulationIndex):
+    # A PopulationIndex that grows one day at a time from the inception
+    # date. Appending a day updates every cumulative array in O(log n), so
+    # a pool's history never has to be re-read to answer queries about it.
+
+    __slots__ = ()
+
+    def __init__(self, inception: date, counts: list[int] = []):
+        self._first = inception.toordinal()
+        self._counts = []
+        self._sums = [0]
+        self._negatives = [0]
+        self._present = [0]
+        self._min_table = [self._counts]
+        self.extend(counts)
+
+    @property
+    def next_day(self) -> date:
+        return date.fromordinal(self._first + len(self._counts))
+
+    def append(self, count: int) -> None:
+        self._counts.append(count)
+        self._sums.append(self._sums[-1] + count)
+        self._negatives.append(self._negatives[-1] + (1 if count < 0 else 0))
+        self._present.append(self._present[-1] + 1)
+
+        # the only new entry on each level of the min table is the run of
+        # days that ends on the day we just added
+        n = len(self._counts)
+        width = 1
+        level = 1
+        while 2 * width <= n:
+            if level == len(self._min_table):
+                self._min_table.append([])
+            prev = self._min_table[level-1]
+            i = n - 2 * width
+            self._min_table[level].append(min(prev[i], prev[i + width]))
+            width *= 2
+            level += 1
+
+    def extend(self, counts) -> None:
+        for count in counts:
+            self.append(count)
@@ -0,0 +1,158 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from array import array
+from collections.abc import Mapping
+from datetime import date
+import calendar
+
+
+class PopulationYear(Mapping):
+    # A pool year's daily donor counts stored in one array('i') slot per day
+    # of the year (slot 0 is Jan 1). Only the slots in [offset, stop) hold
+    # data: offset is the inception day and stop is one past the last day
+    # we know about.
+    #
+    # It behaves like the old dict[date, int] (keys() starts at inception,
+    # population[day] raises KeyError for unknown days), so code that
+    # iterates the population keeps working. Windows share the buffer of
+    # the year they were cut from, so trimming a pool to a period is free.
+
+    __slots__ = ('year', 'offset', 'stop', '_jan_1', '_data')
+
+    def __init__(self, year: int, inception_offset: int = 0, stop: int = -1, data=None):
+        self.year = year
+        self._jan_1 = date(year=year, month=1, day=1).toordinal()
+        if data is None:
+            data = memoryview(array('i', bytes(4 * PopulationYear.days_in(year))))
+        if len(data) != PopulationYear.days_in(year):
+            raise ValueError(f'{year} needs {PopulationYear.days_in(year)} slots, got {len(data)}')
+        self._data = data
+        self.offset = inception_offset
+        self.stop = inception_offset if stop < 0 else stop
+        if not (0 <= self.offset <= self.stop <= len(data)):
+            raise ValueError(f'bad bounds [{self.offset}, {self.stop}) for {year}')
+
+    @staticmethod
+    def days_in(year: int) -> int:
+        return calendar.isleap(year) + 365
+
+    @staticmethod
+    def starting_on(inception: date) -> 'PopulationYear':
+        return PopulationYear(inception.year, inception.timetuple().tm_yday - 1)
+
+    @staticmethod
+    def from_bytes(year: int, inception_offset: int, stop: int, raw: bytes) -> 'PopulationYear':
+        return PopulationYear(year, inception_offset, stop, memoryview(array('i', raw)))
+
+    def __reduce__(self):
+        # memoryviews do not pickle, so ship the raw buffer to other processes
+        return (PopulationYear.from_bytes, (self.year, self.offset, self.stop, self._data.tobytes()))
+
+    def copy(self) -> 'PopulationYear':
+        return PopulationYear.from_bytes(self.year, self.offset, self.stop, self._data.tobytes())
+
+    @staticmethod
+    def from_dict(population: Mapping) -> 'PopulationYear':
+        if isinstance(population, PopulationYear):
+            return population
+        days = sorted(population)
+        if len(days) == 0:
+            raise ValueError('cannot build a PopulationYear from an empty population')
+        if days[0].year != days[-1].year:
+            raise ValueError(f'population spans {days[0].year} to {days[-1].year}')
+        pop_year = PopulationYear.starting_on(days[0])
+        for d in days:
+            pop_year.set(d, population[d])
+        return pop_year
+
+    ##############################
+    #      DAY-OF-YEAR ACCESS    #
+    ##############################
+
+    def day_index(self, day: date) -> int:
+        return day.toordinal() - self._jan_1
+
+    def day_at(self, i: int) -> date:
+        return date.fromordinal(self._jan_1 + i)
+
+    @property
+    def inception(self) -> date:
+        return self.day_at(self.offset)
+
+    @property
+    def last_day(self) -> date:
+        return self.day_at(self.stop - 1)
+
+    @property
+    def first_ordinal(self) -> int:
+        return self._jan_1 + self.offset
+
+    @property
+    def counts(self) -> memoryview:
+        # zero copy view of the known days, inception first
+        return self._data[self.offset:self.stop]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def append(self, count: int) -> None:
+        self._data[self.stop] = count
+        self.stop += 1
+
+    def fill_to(self, i: int, count: int) -> None:
+        # pad every unknown day before slot i with count
+        if i > self.stop:
+            self._data[self.stop:i] = array('i', [count]) * (i - self.stop)
+            self.stop = i
+
+    def set(self, day: date, count: int) -> None:
+        # days after the last known day are padded with the last count seen
+        i = self.day_index(day)
+        if i < self.offset or i >= len(self._data):
+            raise ValueError(f'{day} is outside [{self.inception}, {self.year}-12-31]')
+        if i >= self.stop:
+            self.fill_to(i, self._data[self.stop-1] if self.stop > self.offset else count)
+            self.append(count)
+        else:
+            self._data[i] = count
+
+    def window(self, start: date, end: date) -> 'PopulationYear':
+        # the days in [start, end] that we know about, sharing this buffer
+        lo = min(max(self.day_index(start), self.offset), self.stop)
+        hi = max(min(self.day_index(end) + 1, self.stop), lo)
+        return PopulationYear(self.year, lo, hi, self._data)
+
+    ##############################
+    #   dict[date, int] ADAPTER  #
+    ##############################
+
+    def __getitem__(self, day: date) -> int:
+        i = day.toordinal() - self._jan_1
+        if i < self.offset or i >= self.stop:
+            raise KeyError(day)
+        return self._data[i]
+
+    def __contains__(self, day) -> bool:
+        if not isinstance(day, date):
+            return False
+        i = day.toordinal() - self._jan_1
+        return self.offset <= i < self.stop
+
+    def __iter__(self):
+        for ordinal in range(self._jan_1 + self.offset, self._jan_1 + self.stop):
+            yield date.fromordinal(ordinal)
+
+    def __len__(self) -> int:
+        return self.stop - self.offset
+
+    def values(self):
+        return self.counts.tolist()
+
+    def __repr__(self) -> str:
+        if len(self) == 0:
+            return f'PopulationYear({self.year}, empty)'
+        return f'PopulationYear([{self.inception} to {self.last_day}], {len(self)} days)'
@@ -3,10 +3,18 @@
 # Proprietary and confidential
 # Written by John Read <john.read@colibri-software.com>, July 2023
 
+from array import array
 from datetime import date, timedelta
+from functools import lru_cache
+from itertools import accumulate
 from random import randint
 import random
 
+try:
+    from .population_year import PopulationYear
+except ImportError:
+    from population_year import PopulationYear
+
 MAX_POP = 500
 
 
@@ -52,17 +60,19 @@ def generate_population(
         pop: int,
         mu: float = 0.0,
         sigma: float = 0
-        ) -> dict:
+        ) -> PopulationYear:
     (start, end) = order_correctly(start, end)
+    if start.year != end.year:
+        raise ValueError(f'[{start} to {end}] spans multiple years')
     pop = max(0, pop)
-    population = {}
+    population = PopulationYear.starting_on(start)
+    population.append(pop)
     day = start
-    population[start] = pop
     while day < end:
         day = increment(day)
         pop += calculate_population_change(day, mu, sigma)
         pop = max(0, pop)
-        population[day] = pop
+        population.append(pop)
     return population
 
 
@@ -73,5 +83,109 @@ def generate_random_population_data(mu: float, sigma: float):
     return generate_population(start, end, pop, mu, sigma)
 
 
-def population_dict_from_rand(mu: float, sigma: float) -> dict:
+def population_dict_from_rand(mu: float, sigma: float) -> PopulationYear:
     return generate_random_population_data(mu, sigma)
+
+
+##############################
+#     BATCH  GENERATION      #
+##############################
+
+# Many populations at once, each a row of one array('i') with a slot per
+# day of the year, handed out as PopulationYears that share the buffer. The
+# weekday pattern is worked out once per (start, end) and a row is filled
+# from a list of draws with accumulate instead of a date object per day.
+#
+# rng is anything with gauss and randint, by default the random module
+# itself. Draws are made in exactly the order the functions above make
+# them, so under the same seed a batch holds the same populations as
+# calling generate_population / population_dict_from_rand once per row.
+
+ROW_SLOTS = 366
+
+
+@lru_cache(maxsize=None)
+def drift_days(start: date, end: date) -> tuple:
+    # offsets from start of the days after it that can change the population
+    first_weekday = start.weekday()
+    return tuple(j for j in range(1, (end-start).days+1) if (first_weekday + j) % 7 < 5)
+
+
+def floor_at_zero(pop: int, delta: int) -> int:
+    pop += delta
+    return pop if pop > 0 else 0
+
+
+def fill_row(row: memoryview, first: int, pop: int, start: date, end: date, mu: float, sigma: float, rng) -> int:
+    # writes the days [start, end] into row from slot first on, returns the
+    # slot after the last day
+    num_days = (end-start).days+1
+    deltas = [0] * num_days
+    deltas[0] = max(0, pop)
+    if abs(sigma) >= 0.000001:
+        gauss = rng.gauss
+        for j in drift_days(start, end):
+            deltas[j] = int(gauss(mu, sigma))
+    counts = list(accumulate(deltas))
+    if min(counts) < 0:
+        counts = list(accumulate(deltas, floor_at_zero))
+    row[first:first+num_days] = array('i', counts)
+    return first + num_days
+
+
+def generate_population_batch(
+        start: date,
+        end: date,
+        pops: list[int],
+        mu: float = 0.0,
+        sigma: float = 0,
+        rng=random
+        ) -> list[PopulationYear]:
+    # one population per starting size in pops, all over [start, end]
+    (start, end) = order_correctly(start, end)
+    if start.year != end.year:
+        raise ValueError(f'[{start} to {end}] spans multiple years')
+    slots = PopulationYear.days_in(start.year)
+    buffer = memoryview(array('i', bytes(4 * slots * len(pops))))
+    first = start.timetuple().tm_yday - 1
+    populations = []
+    for i, pop in enumerate(pops):
+        row = buffer[i*slots:(i+1)*slots]
+        stop = fill_row(row, first, pop, start, end, mu, sigma, rng)
+        populations.append(PopulationYear(start.year, first, stop, row))
+    return populations
+
+
+def generate_random_population_batch(
+        num_populations: int,
+        mu: float,
+        sigma: float,
+        rng=random
+        ) -> list[PopulationYear]:
+    # num_populations calls of population_dict_from_rand in one buffer
+    buffer = memoryview(array('i', bytes(4 * ROW_SLOTS * num_populations)))
+    populations = []
+    for i in range(num_populations):
+        # get_random_population then get_random_date
+        pop = rng.randint(1, MAX_POP)
+        days = rng.randint(0, 364)
+        start = date(year=2016 + rng.randint(0, 10), month=1, day=1) + timedelta(days=days)
+        end = date(year=start.year, month=12, day=31)
+        row = buffer[i*ROW_SLOTS:i*ROW_SLOTS+PopulationYear.days_in(start.year)]
+        first = start.timetuple().tm_yday - 1
+        stop = fill_row(row, first, pop, start, end, mu, sigma, rng)
+        populations.append(PopulationYear(start.year, first, stop, row))
+    return populations
+
+
+def iter_random_population_batches(
+        num_populations: int,
+        chunk_size: int,
+        mu: float,
+        sigma: float,
+        rng=random
+        ):
+    # the same populations as one big batch, chunk_size at a time, so only
+    # one chunk has to be in memory
+    for first in range(0, num_populations, chunk_size):
+        yield generate_random_population_batch(min(chunk_size, num_populations - first), mu, sigma, rng)
@@ -0,0 +1,234 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from collections import OrderedDict
+from datetime import date
+from typing import NamedTuple, Optional, Union
+import hashlib
+import io
+import json
+import os
+import random
+
+try:
+    from .calculator import generate_results, generate_session_results
+    from .population_year import PopulationYear
+    from .schedule import Schedule
+    from .state_store import write_atomic
+except ImportError:
+    from calculator import generate_results, generate_session_results
+    from population_year import PopulationYear
+    from schedule import Schedule
+    from state_store import write_atomic
+
+
+# Results of generate_results keyed by a hash of everything that goes into
+# them: the population, inception, schedule, disallow chance, fractions, the
+# seed of the random module and whether each estimate only saw the days up
+# to its period (generate_session_results, what DataPersist and the batch
+# runner do). Entries live in a size bounded in memory
+# LRU and, if a directory is given, in a disk tier behind it that survives
+# restarts.
+#
+# The disallow correction draws from the random module whenever a period is
+# predicted to need zero tests, so unless the outcome of that draw is fixed
+# (disallow >= 100 or < 0) a run is only cached when a seed is given.
+
+KEY_VERSION = 2
+
+
+class CachedResult(NamedTuple):
+    dr_json: str
+    al_json: str
+    html: str
+    drug_overcount: int
+    alcohol_overcount: int
+
+    @property
+    def score(self) -> int:
+        return abs(self.drug_overcount) + abs(self.alcohol_overcount)
+
+
+def result_key(
+        schedule: Schedule,
+        inception: date,
+        population,
+        disallow: int,
+        dr_fraction: float,
+        al_fraction: float,
+        seed: Optional[Union[int, str]],
+        lagged_start_counts: bool = False
+        ) -> str:
+    population = PopulationYear.from_dict(population)
+    h = hashlib.sha256()
+    h.update(json.dumps([
+        KEY_VERSION,
+        population.year,
+        population.offset,
+        population.stop,
+        int(schedule),
+        inception.toordinal(),
+        int(disallow),
+        repr(float(dr_fraction)),
+        repr(float(al_fraction)),
+        seed,
+        bool(lagged_start_counts)
+    ]).encode())
+    h.update(population.counts.tobytes())
+    return h.hexdigest()
+
+
+def is_deterministic(disallow: int) -> bool:
+    return disallow >= 100 or disallow < 0
+
+
+class ResultCache:
+
+    def __init__(self, max_entries: int = 1024, directory: str = None, max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self._entries = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self._disk_entries = None
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'uncacheable': self.uncacheable,
+            'evictions': self.evictions,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+        }
+
+    ##############################
+    #         DISK  TIER         #
+    ##############################
+
+    def disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def read_disk(self, key: str) -> Optional[CachedResult]:
+        path = self.disk_path(key)
+        try:
+            with open(path, 'r') as f:
+                result = CachedResult(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        # keep the modification time as the disk tier's LRU order
+        os.utime(path)
+        return result
+
+    def write_disk(self, key: str, result: CachedResult) -> None:
+        path = self.disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, json.dumps(result._asdict()))
+        if self._disk_entries is not None:
+            self._disk_entries += 1
+        self.prune_disk()
+
+    def disk_files(self) -> list[str]:
+        files = []
+        for sub_dir in os.listdir(self.directory):
+            full_dir = os.path.join(self.directory, sub_dir)
+            if os.path.isdir(full_dir):
+                files.extend(os.path.join(full_dir, f) for f in os.listdir(full_dir) if f.endswith('.json'))
+        return files
+
+    def prune_disk(self) -> None:
+        if self._disk_entries is not None and self._disk_entries <= self.max_disk_entries:
+            return
+        files = self.disk_files()
+        if len(files) > self.max_disk_entries:
+            files.sort(key=os.path.getmtime)
+            for f in files[:len(files) - self.max_disk_entries]:
+                os.remove(f)
+            files = files[len(files) - self.max_disk_entries:]
+        self._disk_entries = len(files)
+
+    ##############################
+    #        LRU  LOOKUPS        #
+    ##############################
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return self._entries[key]
+        if self.directory is not None:
+            result = self.read_disk(key)
+            if result is not None:
+                self.disk_hits += 1
+                self.remember(key, result)
+                return result
+        self.misses += 1
+        return None
+
+    def remember(self, key: str, result: CachedResult) -> None:
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put(self, key: str, result: CachedResult) -> None:
+        self.remember(key, result)
+        if self.directory is not None:
+            self.write_disk(key, result)
+
+
+def cached_generate_results(
+        cache: ResultCache,
+        schedule: Schedule,
+        inception: date,
+        population,
+        disallow: int,
+        dr_fraction: float,
+        al_fraction: float,
+        seed: Optional[Union[int, str]] = None,
+        lagged_start_counts: bool = False
+        ) -> CachedResult:
+    cacheable = seed is not None or is_deterministic(disallow)
+    if cacheable:
+        key = result_key(
+            schedule, inception, population, disallow, dr_fraction, al_fraction, seed, lagged_start_counts)
+        result = cache.get(key)
+        if result is not None:
+            return result
+    else:
+        cache.uncacheable += 1
+
+    if seed is not None:
+        random.seed(seed)
+    if lagged_start_counts:
+        (session, _) = generate_session_results(schedule, inception, population, disallow, dr_fraction, al_fraction)
+        (employer, html) = (session.employer, io.StringIO())
+        session.write_html_report(html)
+        html = html.getvalue()
+    else:
+        c = generate_results(schedule, inception, population, disallow, dr_fraction, al_fraction)
+        (employer, html) = (c.employer, c.employer.make_html_report())
+    (dr_json, al_json) = employer.get_data_to_persist()
+    result = CachedResult(
+        dr_json,
+        al_json,
+        html,
+        employer._dr.final_overcount(),
+        employer._al.final_overcount())
+    if cacheable:
+        cache.put(key, result)
+    return result
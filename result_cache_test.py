@@ -0,0 +1,45 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from datetime import timedelta
+
+import batch_runner
+from batch_runner import run_batch
+from result_cache import ResultCache, cached_generate_results, result_key
+from schedule import Schedule
+
+
+def test_key_depends_on_inception(cab_population):
+    inception = cab_population.inception
+    keys = {
+        result_key(Schedule.MONTHLY, inception, cab_population, 100, .5, .1, None),
+        result_key(Schedule.MONTHLY, inception + timedelta(days=1), cab_population, 100, .5, .1, None),
+        result_key(Schedule.MONTHLY, inception, cab_population, 100, .5, .1, None, lagged_start_counts=True),
+    }
+    assert len(keys) == 3
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path, cab_population):
+    args = (Schedule.QUARTERLY, cab_population.inception, cab_population, 0, .5, .1, 11)
+    first = cached_generate_results(ResultCache(directory=str(tmp_path)), *args)
+
+    cache = ResultCache(directory=str(tmp_path))
+    assert cached_generate_results(cache, *args) == first
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_cached_batch_matches_uncached(tmp_path, monkeypatch, input_dir):
+    monkeypatch.setattr(batch_runner, '_caches', {})
+    schedules = [Schedule.MONTHLY, Schedule.QUARTERLY]
+    cache_dir = str(tmp_path / 'cache')
+    plain = run_batch(input_dir, True, schedules, str(tmp_path / 'plain.csv'), seed=3)
+    cached = run_batch(input_dir, True, schedules, str(tmp_path / 'cached.csv'), seed=3, cache_dir=cache_dir)
+    assert cached == plain
+
+    # the rerun is answered from the cache
+    rerun = run_batch(input_dir, True, schedules, str(tmp_path / 'rerun.csv'), seed=3, cache_dir=cache_dir)
+    assert rerun == plain
+    stats = batch_runner.get_cache(cache_dir).stats()
+    assert stats['memory_hits'] == len([row for row in plain if row[-1] == ''])
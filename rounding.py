@@ -0,0 +1,16 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, July 2023
+
+
+# EPSILON = 0.0000000000000001
+EPSILON = 0.0000000001
+
+
+def discretize_float(v: float, epsilon: float = EPSILON) -> float:
+    sign = -1 if v < 0 else 1
+    abs_v = abs(v)
+    if abs_v - int(abs_v) < epsilon:
+        return sign * int(abs_v)
+    return v
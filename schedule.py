@@ -71,79 +71,56 @@ class Schedule(int, Enum):
         return Schedule.QUARTERLY
 
 
-def trim_to_date(start_date: date, period_starts: list[date]) -> list[date]:
-    period_start_list = [start_date]
-    for d in period_starts:
-        if d > start_date:
-            period_start_list.append(d)
-    return period_start_list
+# The period start dates the Employer uses: the inception date followed by
+# every schedule boundary after it, or after it in custom_period_start_dates
+# when that is given. Kept here, away from the pydantic models, so the fleet
+# engine and the CLI can build calendars cheaply. period_calendar caches
+# these per pool.
+
+MONTHS_BY_SCHEDULE = {
+    Schedule.SEMIMONTHLY: [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+    Schedule.MONTHLY: [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+    Schedule.BIMONTHLY: [1, 3, 5, 7, 9, 11],
+    Schedule.QUARTERLY: [1, 4, 7, 10],
+    Schedule.SEMIANNUALLY: [1, 7],
+    Schedule.ANNUALLY: [1],
+}
+
+
+def period_start_dates_by_month_list(
+        pool_inception: date,
+        month_list: list[int],
+        bi: bool = False
+        ) -> list[date]:
+    start_dates = [pool_inception]
+    year = pool_inception.year
+    for m in month_list:
+        d_1 = date(year=year, month=m, day=1)
+        if pool_inception < d_1:
+            start_dates.append(d_1)
+        if bi:
+            d_15 = date(year=year, month=m, day=15)
+            if pool_inception < d_15:
+                start_dates.append(d_15)
+
+    return start_dates
+
+
+def period_start_dates(
+        pool_inception: date,
+        schedule: Schedule,
+        custom_period_start_dates: list[date] = []
+        ) -> list[date]:
+    if len(custom_period_start_dates) > 0:
+        later = {d for d in custom_period_start_dates if d.year == pool_inception.year and d > pool_inception}
+        return [pool_inception] + sorted(later)
+
+    if schedule in MONTHS_BY_SCHEDULE:
+        return period_start_dates_by_month_list(
+            pool_inception, MONTHS_BY_SCHEDULE[schedule], schedule == Schedule.SEMIMONTHLY)
+
+    return [pool_inception]
 
 
 def construct_period_start_dates(inception: date, schedule: Schedule) -> list[date]:
-    year = inception.year
-    period_starts = []
-    jan_1 = date(year=year, month=1, day=1)
-    period_starts.append(jan_1)
-    if schedule.num_periods == 1:
-        return trim_to_date(inception, period_starts)
-
-    if schedule.num_periods == 2:
-        period_starts.append(date(year=year, month=7, day=1))
-        return trim_to_date(inception, period_starts)
-
-    if schedule.num_periods == 4:
-        period_starts.append(date(year=year, month=4, day=1))
-        period_starts.append(date(year=year, month=7, day=1))
-        period_starts.append(date(year=year, month=10, day=1))
-        return trim_to_date(inception, period_starts)
-
-    if schedule.num_periods == 6:
-        period_starts.append(date(year=year, month=3, day=1))
-        period_starts.append(date(year=year, month=5, day=1))
-        period_starts.append(date(year=year, month=7, day=1))
-        period_starts.append(date(year=year, month=9, day=1))
-        period_starts.append(date(year=year, month=11, day=1))
-        return trim_to_date(inception, period_starts)
-
-    if schedule.num_periods == 12:
-        period_starts.append(date(year=year, month=2, day=1))
-        period_starts.append(date(year=year, month=3, day=1))
-        period_starts.append(date(year=year, month=4, day=1))
-        period_starts.append(date(year=year, month=5, day=1))
-        period_starts.append(date(year=year, month=6, day=1))
-        period_starts.append(date(year=year, month=7, day=1))
-        period_starts.append(date(year=year, month=8, day=1))
-        period_starts.append(date(year=year, month=9, day=1))
-        period_starts.append(date(year=year, month=10, day=1))
-        period_starts.append(date(year=year, month=11, day=1))
-        period_starts.append(date(year=year, month=12, day=1))
-        return trim_to_date(inception, period_starts)
-
-    if schedule.num_periods == 24:
-        period_starts.append(date(year=year, month=1, day=1))
-        period_starts.append(date(year=year, month=1, day=15))
-        period_starts.append(date(year=year, month=2, day=1))
-        period_starts.append(date(year=year, month=2, day=15))
-        period_starts.append(date(year=year, month=3, day=1))
-        period_starts.append(date(year=year, month=3, day=15))
-        period_starts.append(date(year=year, month=4, day=1))
-        period_starts.append(date(year=year, month=4, day=15))
-        period_starts.append(date(year=year, month=5, day=1))
-        period_starts.append(date(year=year, month=5, day=15))
-        period_starts.append(date(year=year, month=6, day=1))
-        period_starts.append(date(year=year, month=6, day=15))
-        period_starts.append(date(year=year, month=7, day=1))
-        period_starts.append(date(year=year, month=7, day=15))
-        period_starts.append(date(year=year, month=8, day=1))
-        period_starts.append(date(year=year, month=8, day=15))
-        period_starts.append(date(year=year, month=9, day=1))
-        period_starts.append(date(year=year, month=9, day=15))
-        period_starts.append(date(year=year, month=10, day=1))
-        period_starts.append(date(year=year, month=10, day=15))
-        period_starts.append(date(year=year, month=11, day=1))
-        period_starts.append(date(year=year, month=11, day=15))
-        period_starts.append(date(year=year, month=12, day=1))
-        period_starts.append(date(year=year, month=12, day=15))
-        return trim_to_date(inception, period_starts)
-
-    return []
+    return period_start_dates(inception, schedule)
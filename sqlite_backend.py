@@ -0,0 +1,245 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from contextlib import contextmanager
+from datetime import date
+from typing import Iterable, NamedTuple
+import json
+import queue
+import sqlite3
+
+try:
+    from .schedule import Schedule
+    from .population_year import PopulationYear
+except ImportError:
+    from schedule import Schedule
+    from population_year import PopulationYear
+
+
+# A local stand in for the Veriport DB. Pools, their populations (the
+# known days of the pool year as one blob of int32 counts), the persisted
+# Substance state and the reports live in one SQLite file shared through a
+# small pool of connections. Every statement is a constant string so the
+# sqlite3 statement cache prepares it once per connection, and the bulk
+# methods pass lists of pool ids as one json parameter so a period close is
+# a handful of queries whatever the number of pools.
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pools (
+    pool_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    schedule INTEGER NOT NULL,
+    inception TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS populations (
+    pool_id INTEGER PRIMARY KEY REFERENCES pools(pool_id),
+    year INTEGER NOT NULL,
+    inception_offset INTEGER NOT NULL,
+    counts BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS substance_state (
+    pool_id INTEGER NOT NULL REFERENCES pools(pool_id),
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (pool_id, name)
+);
+CREATE TABLE IF NOT EXISTS reports (
+    report_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pool_id INTEGER NOT NULL REFERENCES pools(pool_id),
+    period_index INTEGER NOT NULL,
+    html TEXT NOT NULL
+);
+'''
+
+INSERT_POOL = 'INSERT INTO pools (pool_id, name, schedule, inception) VALUES (?, ?, ?, ?)'
+SELECT_POOLS = (
+    'SELECT pool_id, name, schedule, inception FROM pools '
+    'WHERE pool_id IN (SELECT value FROM json_each(?))'
+)
+UPSERT_POPULATION = (
+    'INSERT INTO populations (pool_id, year, inception_offset, counts) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT (pool_id) DO UPDATE SET '
+    'year = excluded.year, inception_offset = excluded.inception_offset, counts = excluded.counts'
+)
+SELECT_POPULATIONS = (
+    'SELECT pool_id, year, inception_offset, counts FROM populations '
+    'WHERE pool_id IN (SELECT value FROM json_each(?))'
+)
+UPSERT_STATE = (
+    'INSERT INTO substance_state (pool_id, name, state) VALUES (?, ?, ?) '
+    'ON CONFLICT (pool_id, name) DO UPDATE SET state = excluded.state'
+)
+SELECT_STATES = (
+    'SELECT pool_id, name, state FROM substance_state '
+    'WHERE pool_id IN (SELECT value FROM json_each(?))'
+)
+INSERT_REPORT = 'INSERT INTO reports (pool_id, period_index, html) VALUES (?, ?, ?)'
+SELECT_LATEST_REPORT = 'SELECT html FROM reports WHERE pool_id = ? ORDER BY report_id DESC LIMIT 1'
+
+
+class Pool(NamedTuple):
+    pool_id: int
+    name: str
+    schedule: Schedule
+    inception: date
+
+
+class PoolResult(NamedTuple):
+    # what a period close writes back for one pool; html may be None
+    pool_id: int
+    period_index: int
+    states: dict
+    html: str
+
+
+def population_to_row(pool_id: int, population: PopulationYear) -> tuple:
+    return (pool_id, population.year, population.offset, population.counts.tobytes())
+
+
+def population_from_row(year: int, inception_offset: int, counts: bytes) -> PopulationYear:
+    known = len(counts) // 4
+    raw = bytes(4 * inception_offset) + counts + bytes(4 * (PopulationYear.days_in(year) - inception_offset - known))
+    return PopulationYear.from_bytes(year, inception_offset, inception_offset + known, raw)
+
+
+class SQLiteBackend:
+
+    def __init__(self, database: str, pool_size: int = 4, timeout: float = 30.0):
+        # an in memory database only exists for the connection that made it
+        if database == ':memory:':
+            pool_size = 1
+        self.database = database
+        self.timeout = timeout
+        self._connections = queue.Queue()
+        for _ in range(pool_size):
+            self._connections.put(self.connect())
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=64)
+        if self.database != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def close(self) -> None:
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+    def __enter__(self) -> 'SQLiteBackend':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    ##############################
+    #          POOLS             #
+    ##############################
+
+    def add_pools(self, pools: Iterable[tuple]) -> None:
+        # (pool_id, name, schedule, population) for each pool
+        pool_rows = []
+        population_rows = []
+        for (pool_id, name, schedule, population) in pools:
+            population = PopulationYear.from_dict(population)
+            pool_rows.append((pool_id, name, int(schedule), population.inception.isoformat()))
+            population_rows.append(population_to_row(pool_id, population))
+        with self.transaction() as conn:
+            conn.executemany(INSERT_POOL, pool_rows)
+            conn.executemany(UPSERT_POPULATION, population_rows)
+
+    def load_pools(self, pool_ids: Iterable[int]) -> dict[int, Pool]:
+        with self.connection() as conn:
+            rows = conn.execute(SELECT_POOLS, (json.dumps(list(pool_ids)),)).fetchall()
+        return {
+            pool_id: Pool(pool_id, name, Schedule(schedule), date.fromisoformat(inception))
+            for (pool_id, name, schedule, inception) in rows
+        }
+
+    ##############################
+    #        POPULATIONS         #
+    ##############################
+
+    def store_populations(self, populations: Iterable[tuple]) -> None:
+        # (pool_id, population) for each pool, replacing what was there
+        rows = [population_to_row(pool_id, PopulationYear.from_dict(p)) for (pool_id, p) in populations]
+        with self.transaction() as conn:
+            conn.executemany(UPSERT_POPULATION, rows)
+
+    def load_populations(self, pool_ids: Iterable[int]) -> dict[int, PopulationYear]:
+        with self.connection() as conn:
+            rows = conn.execute(SELECT_POPULATIONS, (json.dumps(list(pool_ids)),)).fetchall()
+        return {pool_id: population_from_row(year, offset, counts) for (pool_id, year, offset, counts) in rows}
+
+    ##############################
+    #      SUBSTANCE  STATE      #
+    ##############################
+
+    def store_states(self, states: Iterable[tuple]) -> None:
+        # (pool_id, name, state) for each row
+        with self.transaction() as conn:
+            conn.executemany(UPSERT_STATE, list(states))
+
+    def load_states(self, pool_ids: Iterable[int]) -> dict[int, dict[str, str]]:
+        states = {}
+        with self.connection() as conn:
+            for (pool_id, name, state) in conn.execute(SELECT_STATES, (json.dumps(list(pool_ids)),)):
+                states.setdefault(pool_id, {})[name] = state
+        return states
+
+    ##############################
+    #          REPORTS           #
+    ##############################
+
+    def store_report(self, pool_id: int, period_index: int, html: str) -> int:
+        with self.connection() as conn:
+            return conn.execute(INSERT_REPORT, (pool_id, period_index, html)).lastrowid
+
+    def latest_report(self, pool_id: int) -> str:
+        with self.connection() as conn:
+            row = conn.execute(SELECT_LATEST_REPORT, (pool_id,)).fetchone()
+        return None if row is None else row[0]
+
+    ##############################
+    #        PERIOD CLOSE        #
+    ##############################
+
+    def store_results(self, results: Iterable[PoolResult]) -> None:
+        # everything a period close produced for many pools, in one transaction
+        state_rows = []
+        report_rows = []
+        for r in results:
+            state_rows.extend((r.pool_id, name, state) for (name, state) in r.states.items())
+            if r.html is not None:
+                report_rows.append((r.pool_id, r.period_index, r.html))
+        with self.transaction() as conn:
+            conn.executemany(UPSERT_STATE, state_rows)
+            conn.executemany(INSERT_REPORT, report_rows)
@@ -0,0 +1,213 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from enum import IntEnum
+import json
+import os
+import stat
+import tempfile
+
+
+# Where DataPersist keeps the substance states (tmp_dr.json, tmp_al.json)
+# between periods. Writes go to an in memory cache and reads are answered
+# from it; the files are only written when the store flushes, which the
+# durability setting decides:
+#   NONE   : only on flush() / close(), nothing is fsynced
+#   BATCH  : every batch_periods periods and on close(), fsynced
+#   PERIOD : at the end of every period, fsynced
+#
+# A flush is one commit of every state written since the last one. The new
+# states go to <name>.<seq>.pending files, then the checkpoint (the flush
+# number, the period and the pending names) is written, then the pending
+# files are renamed over the states. Every file is written to a temporary
+# file and renamed, so none is ever seen half written. recover() replays
+# the renames of the last checkpoint and drops pending files of a flush
+# that never reached its checkpoint, so the states on disk are always the
+# ones of a whole flush, and it returns that flush's period.
+#
+# The checkpoint also names the run that wrote it (whatever the caller
+# hands to recover() / reset(), e.g. the schedule and the pool year). A
+# checkpoint of another run is never recovered: the directory is reset and
+# the caller starts over.
+#
+# Anything with put/get/end_period/flush/close can stand in for a
+# StateStore, e.g. to keep the states in a database.
+
+CHECKPOINT = 'state_checkpoint.json'
+
+# os.umask is the only way to read the umask, and it sets it too, so read it
+# once here rather than racing other threads on every write
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+class Durability(IntEnum):
+    NONE = 0
+    BATCH = 1
+    PERIOD = 2
+
+    @staticmethod
+    def from_str(name: str) -> 'Durability':
+        try:
+            return Durability[name.upper()]
+        except KeyError:
+            raise ValueError(f'unknown durability {name}, use one of none, batch, period') from None
+
+
+def file_mode(filename: str) -> int:
+    # the mode of the file being replaced, or the one open() gives a new file
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def write_atomic(filename: str, text: str, fsync: bool = False) -> None:
+    # mkstemp makes its file 0600, give it the mode a plain open() would
+    (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(filename), suffix='.tmp')
+    try:
+        os.chmod(tmp_path, file_mode(filename))
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class StateStore:
+
+    def __init__(self, directory: str, durability: Durability = Durability.BATCH, batch_periods: int = 4):
+        self.directory = directory
+        self.durability = durability
+        self.batch_periods = max(1, batch_periods)
+        self._cache = {}
+        self._dirty = set()
+        self._seq = 0
+        self._period = None
+        self._run = None
+        self._periods_since_flush = 0
+        self.flushes = 0
+        self.files_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def pending_path(self, name: str, seq: int) -> str:
+        return self.path(f'{name}.{seq}.pending')
+
+    @property
+    def fsync(self) -> bool:
+        return self.durability > Durability.NONE
+
+    @property
+    def period(self):
+        # the period of the last end_period call (or of the recovered checkpoint)
+        return self._period
+
+    ##############################
+    #      WRITE BEHIND CACHE    #
+    ##############################
+
+    def put(self, name: str, text: str) -> None:
+        self._cache[name] = text
+        self._dirty.add(name)
+
+    def get(self, name: str) -> str:
+        if name not in self._cache:
+            with open(self.path(name), 'r') as f:
+                self._cache[name] = f.read()
+        return self._cache[name]
+
+    def end_period(self, period_index: int) -> None:
+        # the states put so far belong to period_index
+        self._period = period_index
+        self._periods_since_flush += 1
+        if self.durability == Durability.PERIOD:
+            self.flush()
+        elif self.durability == Durability.BATCH and self._periods_since_flush >= self.batch_periods:
+            self.flush()
+
+    def flush(self) -> None:
+        self._periods_since_flush = 0
+        if len(self._dirty) == 0:
+            return
+        self._seq += 1
+        names = sorted(self._dirty)
+        for name in names:
+            write_atomic(self.pending_path(name, self._seq), self._cache[name], self.fsync)
+        checkpoint = json.dumps({'seq': self._seq, 'period': self._period, 'run': self._run, 'pending': names})
+        write_atomic(self.path(CHECKPOINT), checkpoint, self.fsync)
+        self.apply_pending(self._seq, names)
+        self._dirty.clear()
+        self.flushes += 1
+        self.files_written += len(names) + 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self) -> 'StateStore':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    ##############################
+    #      CRASH  RECOVERY       #
+    ##############################
+
+    def apply_pending(self, seq: int, names: list[str]) -> None:
+        for name in names:
+            pending = self.pending_path(name, seq)
+            if os.path.exists(pending):
+                os.replace(pending, self.path(name))
+
+    def stray_pending(self) -> list[str]:
+        # pending files of a flush that never reached its checkpoint, and
+        # temporary files of a write that never got renamed
+        return [f for f in os.listdir(self.directory) if f.endswith(('.pending', '.tmp'))]
+
+    def recover(self, run=None):
+        # Finish the last committed flush and return its period, or None if
+        # nothing was ever committed here by this run. The cache is dropped,
+        # so the states are read back from disk.
+        self._cache.clear()
+        self._dirty.clear()
+        self._periods_since_flush = 0
+        try:
+            with open(self.path(CHECKPOINT), 'r') as f:
+                checkpoint = json.load(f)
+            (seq, period, names) = (checkpoint['seq'], checkpoint['period'], checkpoint['pending'])
+            stored_run = checkpoint.get('run')
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            (seq, period, names, stored_run) = (0, None, [], run)
+        if stored_run != run:
+            # another run's states, they must not seed this one
+            self.reset(run)
+            return None
+        self.apply_pending(seq, names)
+        for f in self.stray_pending():
+            os.remove(self.path(f))
+        self._seq = seq
+        self._period = period
+        self._run = run
+        return period
+
+    def reset(self, run=None) -> None:
+        # forget any earlier run in this directory, so it is not recovered
+        self._cache.clear()
+        self._dirty.clear()
+        self._seq = 0
+        self._period = None
+        self._run = run
+        self._periods_since_flush = 0
+        for f in self.stray_pending() + [CHECKPOINT]:
+            if os.path.exists(self.path(f)):
+                os.remove(self.path(f))
@@ -0,0 +1,162 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import contextlib
+import io
+import json
+import os
+import stat
+
+import pytest
+
+from data_persist import DataPersist
+from schedule import Schedule
+from state_store import StateStore, Durability, CHECKPOINT, write_atomic
+
+class Crash(Exception):
+    pass
+
+
+class CrashingStore(StateStore):
+    # dies right after end_period(crash_after), like a process killed there
+
+    def __init__(self, directory, durability, crash_after):
+        super().__init__(directory, durability)
+        self.crash_after = crash_after
+
+    def end_period(self, period_index: int) -> None:
+        super().end_period(period_index)
+        if period_index == self.crash_after:
+            raise Crash()
+
+
+def fill(store: StateStore, periods: int) -> None:
+    for p in range(periods):
+        store.put('tmp_dr.json', f'dr {p}')
+        store.put('tmp_al.json', f'al {p}')
+        store.end_period(p)
+
+
+def test_crash_before_checkpoint_keeps_last_flush(tmp_path):
+    store = StateStore(str(tmp_path), Durability.PERIOD)
+    fill(store, 3)
+    # the next flush wrote its pending files but died before its checkpoint
+    write_atomic(store.pending_path('tmp_dr.json', store._seq+1), 'dr 3')
+
+    recovered = StateStore(str(tmp_path))
+    assert recovered.recover() == 2
+    assert recovered.get('tmp_dr.json') == 'dr 2'
+    assert recovered.get('tmp_al.json') == 'al 2'
+    assert recovered.stray_pending() == []
+
+
+def test_crash_after_checkpoint_finishes_renames(tmp_path):
+    store = StateStore(str(tmp_path), Durability.PERIOD)
+    fill(store, 3)
+    # the next flush got its checkpoint down but none of its renames
+    seq = store._seq+1
+    write_atomic(store.pending_path('tmp_dr.json', seq), 'dr 3')
+    write_atomic(store.pending_path('tmp_al.json', seq), 'al 3')
+    write_atomic(store.path(CHECKPOINT), json.dumps(
+        {'seq': seq, 'period': 3, 'pending': ['tmp_al.json', 'tmp_dr.json']}))
+
+    recovered = StateStore(str(tmp_path))
+    assert recovered.recover() == 3
+    assert recovered.get('tmp_dr.json') == 'dr 3'
+    assert recovered.get('tmp_al.json') == 'al 3'
+    assert recovered.stray_pending() == []
+
+
+def test_atomic_writes_keep_the_usual_file_mode(tmp_path):
+    umask = os.umask(0o022)
+    os.umask(umask)
+    new_file = str(tmp_path / 'new.json')
+    write_atomic(new_file, 'a')
+    assert stat.S_IMODE(os.stat(new_file).st_mode) == 0o666 & ~umask
+
+    old_file = str(tmp_path / 'old.json')
+    write_atomic(old_file, 'a')
+    os.chmod(old_file, 0o640)
+    write_atomic(old_file, 'b')
+    assert stat.S_IMODE(os.stat(old_file).st_mode) == 0o640
+
+
+def test_batch_flushes_every_few_periods(tmp_path):
+    store = StateStore(str(tmp_path), Durability.BATCH, batch_periods=2)
+    fill(store, 5)
+    assert store.flushes == 2
+    assert StateStore(str(tmp_path)).recover() == 3
+    store.close()
+    assert StateStore(str(tmp_path)).recover() == 4
+
+
+def run_pool(population, base_dir: str, store_for, resume: bool = False, schedule: Schedule = Schedule.MONTHLY) -> int:
+    data_persist = DataPersist(
+        schedule, population, base_dir, 'run', 'cab', 'cab.csv', True,
+        state_store=store_for(os.path.join(base_dir, 'run', 'cab')), resume=resume)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return data_persist.run_like_veriport_would()
+
+
+def read_state(base_dir: str, name: str) -> str:
+    with open(os.path.join(base_dir, 'run', 'cab', name), 'r') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('durability', [Durability.PERIOD, Durability.BATCH])
+def test_resume_matches_clean_run(tmp_path, cab_population, fixed_zero_draw, durability):
+    clean_dir = str(tmp_path / 'clean')
+    crash_dir = str(tmp_path / 'crash')
+
+    clean_score = run_pool(cab_population, clean_dir, lambda d: StateStore(d, durability))
+    with pytest.raises(Crash):
+        run_pool(cab_population, crash_dir, lambda d: CrashingStore(d, durability, 5))
+    resumed_score = run_pool(cab_population, crash_dir, lambda d: StateStore(d, durability), resume=True)
+
+    assert resumed_score == clean_score
+    for name in ('tmp_dr.json', 'tmp_al.json'):
+        assert read_state(crash_dir, name) == read_state(clean_dir, name)
+
+
+def test_resume_after_last_period_keeps_stored_state(tmp_path, cab_population, fixed_zero_draw):
+    base_dir = str(tmp_path)
+    score = run_pool(cab_population, base_dir, lambda d: StateStore(d, Durability.PERIOD))
+    state = read_state(base_dir, 'tmp_dr.json')
+
+    store = StateStore(os.path.join(base_dir, 'run', 'cab'), Durability.PERIOD)
+    assert run_pool(cab_population, base_dir, lambda d: store, resume=True) == score
+    assert store.flushes == 0
+    assert read_state(base_dir, 'tmp_dr.json') == state
+
+
+def test_resume_ignores_state_of_another_schedule(tmp_path, cab_population, fixed_zero_draw):
+    clean_dir = str(tmp_path / 'clean')
+    base_dir = str(tmp_path / 'run')
+    clean_score = run_pool(cab_population, clean_dir, lambda d: StateStore(d, Durability.PERIOD), schedule=Schedule.QUARTERLY)
+
+    run_pool(cab_population, base_dir, lambda d: StateStore(d, Durability.PERIOD))
+    resumed_score = run_pool(cab_population, base_dir, lambda d: StateStore(d, Durability.PERIOD), resume=True, schedule=Schedule.QUARTERLY)
+
+    assert resumed_score == clean_score
+    for name in ('tmp_dr.json', 'tmp_al.json'):
+        assert read_state(base_dir, name) == read_state(clean_dir, name)
+
+
+def test_resume_past_the_last_period_starts_over(tmp_path, cab_population, fixed_zero_draw):
+    base_dir = str(tmp_path)
+    score = run_pool(cab_population, base_dir, lambda d: StateStore(d, Durability.PERIOD))
+    state = read_state(base_dir, 'tmp_dr.json')
+
+    # a checkpoint of this run that claims more periods than the year has
+    checkpoint_file = os.path.join(base_dir, 'run', 'cab', CHECKPOINT)
+    with open(checkpoint_file, 'r') as f:
+        checkpoint = json.load(f)
+    checkpoint['period'] = 99
+    write_atomic(checkpoint_file, json.dumps(checkpoint))
+
+    store = StateStore(os.path.join(base_dir, 'run', 'cab'), Durability.PERIOD)
+    assert run_pool(cab_population, base_dir, lambda d: store, resume=True) == score
+    assert store.flushes > 0
+    assert read_state(base_dir, 'tmp_dr.json') == state
@@ -4,32 +4,17 @@
 # Written by John Read <john.read@colibri-software.com>, July 2023
 
 from datetime import date
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from typing import Optional
 from math import ceil, floor
 import json
 
-
-# EPSILON = 0.0000000000000001
-EPSILON = 0.0000000001
-
-def sum_first_n_elements(lst, n):
-    # Check if n is valid (non-negative and within the bounds of the list)
-    if n < 0:
-        n = 0
-    if n > len(lst):
-        n = len(lst)
-
-    # Use slicing to get the first n elements and sum them
-    sum_of_first_n = sum(lst[:n])
-    return sum_of_first_n
-
-def discretize_float(v: float, epsilon: float = EPSILON) -> float:
-    sign = -1 if v < 0 else 1
-    abs_v = abs(v)
-    if abs_v - int(abs_v) < epsilon:
-        return sign * int(abs_v)
-    return v
+try:
+    from .rounding import discretize_float
+    from .tracing import TraceLevel, EstimateRecord, TruthRecord, NULL_TRACER
+except ImportError:
+    from rounding import discretize_float
+    from tracing import TraceLevel, EstimateRecord, TruthRecord, NULL_TRACER
 
 
 class Substance(BaseModel):
@@ -45,7 +30,51 @@ class Substance(BaseModel):
     overcount_error: Optional[list[float]]
     disallow_zero_chance: int
 
-    debug_all_data: Optional[list[str]]
+    # What used to go into debug_all_data is reported to a Tracer (see
+    # tracing.py) and never persisted. States that still carry
+    # debug_all_data load fine, the field is ignored.
+    _tracer: object = PrivateAttr(default=NULL_TRACER)
+
+    # Running totals over the lists above, kept up to date by
+    # make_apriori_predictions and determine_aposteriori_truth and rebuilt
+    # from the lists whenever a Substance is created or loaded, so the
+    # cumulative and overcount queries never re-sum the lists. Entry p of a
+    # cumulative list is the sum of periods 0 to p. They are not persisted.
+    _predicted_cum: list[int] = PrivateAttr(default_factory=list)
+    _truth_cum: list[float] = PrivateAttr(default_factory=list)
+    _error_total: float = PrivateAttr(default=0.0)
+
+    def model_post_init(self, __context) -> None:
+        self.rebuild_ledger()
+
+    def rebuild_ledger(self) -> None:
+        # only needed if the lists were changed other than through
+        # make_apriori_predictions and determine_aposteriori_truth
+        (self._predicted_cum, self._truth_cum, self._error_total) = ([], [], 0.0)
+        for predicted in self.required_tests_predicted or []:
+            self._add_predicted(predicted)
+        for truth in self.aposteriori_truth or []:
+            self._add_truth(truth)
+        for error in self.overcount_error or []:
+            self._error_total += error
+
+    def _add_predicted(self, predicted: int) -> None:
+        self._predicted_cum.append(predicted + (self._predicted_cum[-1] if self._predicted_cum else 0))
+
+    def _add_truth(self, truth: float) -> None:
+        self._truth_cum.append((self._truth_cum[-1] if self._truth_cum else 0) + truth)
+
+    @property
+    def predicted_total(self) -> int:
+        return self._predicted_cum[-1] if self._predicted_cum else 0
+
+    @property
+    def truth_total(self) -> float:
+        return self._truth_cum[-1] if self._truth_cum else 0
+
+    @property
+    def overcount_error_total(self) -> float:
+        return self._error_total
 
     def __str__(self) -> str:
         s = f'{self.name=} and {self.percent=}\n'
@@ -62,12 +91,11 @@ class Substance(BaseModel):
 
     @property
     def actual_num_tests_required(self) -> int:
-        val = sum(self.aposteriori_truth)
-        return ceil(discretize_float(val))
+        return ceil(discretize_float(self.truth_total))
 
     # Used by employer to decide if the test needs to be reported
     def final_overcount(self) -> int:
-        return sum(self.required_tests_predicted) - self.actual_num_tests_required
+        return self.predicted_total - self.actual_num_tests_required
 
     @property
     def num_periods_approximated(self) -> int:
@@ -77,14 +105,6 @@ class Substance(BaseModel):
     def num_periods_calculated(self) -> int:
         return len(self.aposteriori_truth)
 
-    def overcount_by_period(self, period_index: int) -> int:
-        if period_index < 0:
-            period_index = 0
-        sum_boundary = 1 + min(period_index, self.num_periods_calculated-1)
-        estim = sum(self.c_required_tests_predicted[:sum_boundary])
-        truth = sum(self.aposteriori_truth[:sum_boundary])
-        return estim - ceil(discretize_float(truth))
-
     # passing a period index -1 just gets the last one on the array
     def get_tests_predicted(self, period_index: int)-> int:
         # print(f'In get_tests_predicted with {period_index=}')
@@ -100,7 +120,7 @@ class Substance(BaseModel):
 
     @property
     def previous_cummulative_overcount_error(self) -> float:
-        return sum(self.overcount_error) if len(self.overcount_error) > 0 else 0.0
+        return self._error_total
 
     def random_correct_zero_tests(self, predicted_num_test: int) -> int:
         if predicted_num_test > 0:
@@ -119,10 +139,6 @@ class Substance(BaseModel):
             days_in_year: int
             ) -> None:
 
-        if len(self.debug_all_data) == 0:
-            self.debug_all_data.append(
-                'start,end,substance,percent,s_count,days_in_period,days_in_year,initial_guess,account_for,predicted,avg_pop,truth,oc,cum_oc, summed truth - round up')
-
         num_days = (end-start).days + 1
         # best guess at average population divided by # days in the year times percent
         apriori_estimate = (float(num_days*initial_donor_count)/float(days_in_year))*self.percent
@@ -138,25 +154,32 @@ class Substance(BaseModel):
             ceil(discretize_float(apriori_estimate - account_for))
             )
         self.required_tests_predicted.append(predicted_tests)
+        self._add_predicted(predicted_tests)
 
-        self.debug_all_data.append(
-            f'{str(start)},{str(end)},{self.name},{self.percent},{initial_donor_count},{num_days},{days_in_year},{apriori_estimate}, {account_for}, {predicted_tests}')
+        if self._tracer.wants(TraceLevel.DETAIL):
+            self._tracer.emit(EstimateRecord(
+                self.name, len(self.required_tests_predicted)-1, start.toordinal(), end.toordinal(), self.percent,
+                initial_donor_count, num_days, days_in_year, apriori_estimate, account_for, predicted_tests))
 
     def determine_aposteriori_truth(self, donor_count_list: list, days_in_year: int) -> None:
         # true average population divided by # days in the year times percent
-        avg_pop = float(sum(donor_count_list))/float(days_in_year)
+        donor_sum = sum(donor_count_list)
+        avg_pop = float(donor_sum)/float(days_in_year)
         truth = avg_pop * self.percent
         self.aposteriori_truth.append(truth)
-        summed_truth = ceil((sum(self.aposteriori_truth)))  # TODO: check if this needs descrtize float
+        self._add_truth(truth)
 
         # keep track of anything we missed through the estimate
         oc_error = float(self.required_tests_predicted[-1]) - truth
         self.overcount_error.append(oc_error)
+        self._error_total += oc_error
 
-        # At the end of the first period, this is ceil(estimate) - truth
-        # self.overcount_error
-        self.debug_all_data[-1] += \
-            f',{avg_pop}, {truth}, {oc_error}, {sum(self.overcount_error)}, {summed_truth}'
+        # At the end of the first period, the cumulative error is ceil(estimate) - truth
+        if self._tracer.wants(TraceLevel.PERIOD):
+            summed_truth = ceil(self.truth_total)  # TODO: check if this needs descrtize float
+            self._tracer.emit(TruthRecord(
+                self.name, len(self.aposteriori_truth)-1, self.required_tests_predicted[-1], donor_sum,
+                days_in_year, truth, oc_error, self._error_total, summed_truth))
 
     def data_to_persist(self) -> str:
         return self.model_dump_json()
@@ -204,7 +227,7 @@ class Substance(BaseModel):
         string += apriori_predicted_tests + '\n'
         string += difference + '\n\n'
 
-        string += offset + 'PRESCRIBED:,' + str(sum(self.required_tests_predicted)) + '\n'
+        string += offset + 'PRESCRIBED:,' + str(self.predicted_total) + '\n'
         string += offset + 'NEEDED:,' + str(self.actual_num_tests_required) + '\n'
         return string + '\n'
 
@@ -217,11 +240,14 @@ class Substance(BaseModel):
         return float(sum(donor_list)) / float(len(donor_list))
 
     def required_sum_by_period(self, period_index: int) -> int:
-        required_sum = sum([self.aposteriori_truth[i] for i in range(period_index+1)])
-        return ceil(discretize_float(required_sum))
+        if period_index < 0:
+            return 0
+        return ceil(discretize_float(self._truth_cum[period_index]))
 
     def predicted_sum_by_period(self, period_index: int) -> int:
-        return sum([self.required_tests_predicted[i] for i in range(period_index+1)])
+        if period_index < 0:
+            return 0
+        return self._predicted_cum[period_index]
 
     def overcount_by_period(self, period_index: int) -> int:
         return self.predicted_sum_by_period(period_index) - \
@@ -242,14 +268,14 @@ class Substance(BaseModel):
 
     def make_text_substance_report(self) -> str:
         s = f'\n{self.name.upper()} SUMMARY:\n'
-        r_req = Substance.format_float(sum(self.aposteriori_truth))
+        r_req = Substance.format_float(self.truth_total)
         required = '[' + Substance.format_to_csv(self.aposteriori_truth) + '] summed -> ' + f'{r_req}'
-        r_req = Substance.format_float(sum(self.required_tests_predicted))
+        r_req = Substance.format_float(self.predicted_total)
         prescribed = '[' + Substance.format_to_csv(self.required_tests_predicted) + '] summed -> ' + f'{r_req}'
-        r_req = Substance.format_float(sum(self.overcount_error))
+        r_req = Substance.format_float(self.overcount_error_total)
         error = '[' + Substance.format_to_csv(self.overcount_error) + '] summed -> ' + f'{r_req}'
 
-        oc_sum = sum(self.overcount_error)
+        oc_sum = self.overcount_error_total
         s += f'   prescribed = {prescribed}\n'
         s += f'   required   = {required}\n'
         if oc_sum < 0:
@@ -259,9 +285,9 @@ class Substance(BaseModel):
         else:
             s += f'   overcount  = {error} ! OVER COUNT by {floor(oc_sum)}\n\n'
 
-        final_error = floor(discretize_float(sum(self.overcount_error)))
-        s += f'   TOTAL PREDICTED: {sum(self.required_tests_predicted)}\n'
-        s += f'   TOTAL REQUIRED:  {ceil(discretize_float(sum(self.aposteriori_truth)))}\n'
+        final_error = floor(discretize_float(self.overcount_error_total))
+        s += f'   TOTAL PREDICTED: {self.predicted_total}\n'
+        s += f'   TOTAL REQUIRED:  {ceil(discretize_float(self.truth_total))}\n'
         s += '   ---------------------\n'
 
         if final_error < 0:
@@ -272,21 +298,8 @@ class Substance(BaseModel):
             s += f'   TOTAL OVERCOUNT: {final_error}\n'
         return s
 
-    def html_total_row(self) -> list[str]:
-        r_pre = sum(self.required_tests_predicted)
-        r_tru = Substance.format_float(sum(self.aposteriori_truth))
-        r_err = Substance.format_float(sum(self.overcount_error))
-
-        s = ['          <tr>\n']
-        s.append('              <td>TOTAL:</td>\n')
-        s.append(f'              <td>{r_pre}</td>\n')
-        s.append(f'              <td>{r_tru}</td>\n')
-        s.append(f'              <td>{r_err}</td>\n')
-        s.append('          </tr>\n')
-        return s
-
     def overcount_summary(self):
-        final_error = floor(discretize_float(sum(self.overcount_error)))
+        final_error = floor(discretize_float(self.overcount_error_total))
         if final_error < 0:
             return f'  TOTAL UNDERCOUNT: {-final_error} </br> <h6> Undercount due to growing pool size </h6> </br>\n'
         elif final_error < 1:
@@ -294,56 +307,6 @@ class Substance(BaseModel):
         else:
             return f'  TOTAL OVERCOUNT: {final_error} </br> <h6> Overcount due to shrinking pool size </h6></br>\n'
 
-    def html_period_row(self, p: int) -> list[str]:
-        r_pre = self.required_tests_predicted[p]
-        r_tru = Substance.format_float(self.aposteriori_truth[p])
-        r_err = Substance.format_float(self.overcount_error[p])
-
-        s = ['          <tr>\n']
-        s.append(f'              <td>{p+1}</td>\n')
-        s.append(f'              <td>{r_pre}</td>\n')
-        s.append(f'              <td>{r_tru}</td>\n')
-        s.append(f'              <td>{r_err}</td>\n')
-        s.append('          </tr>\n')
-        return s
-
-    def make_html_substance_report(self) -> str:
-
-        s = ['<div class="container">\n']
-        s.append(f'  <h2>{self.name.upper()} SUMMARY:</h2>\n')
-        s.append('  <table class="table table-striped">\n')
-        s.append('      <thead>\n')
-        s.append('          <tr>\n')
-        s.append('              <th>Period</th>\n')
-        s.append('              <th>Tests Prescribed</th>\n')
-        s.append('              <th>Tests Required</th>\n')
-        s.append('              <th>Over Count</th>\n')
-        s.append('          </tr>\n')
-        s.append('      </thead>\n')
-        s.append('      <tbody>\n')
-
-        for p in range(len(self.aposteriori_truth)):
-            row_lines = self.html_period_row(p)
-            for line in row_lines:
-                s.append(line)
-
-        row_lines = self.html_total_row()
-        for line in row_lines:
-            s.append(line)
-
-        tot_pred = sum(self.required_tests_predicted)
-        tot_req = ceil(discretize_float(sum(self.aposteriori_truth)))
-
-        s.append('      </tbody>\n')
-        s.append('  </table>\n')
-        s.append('  <p>\n')
-        s.append(f'  TOTAL  PREDICTED: {tot_pred}</br>\n')
-        s.append(f'  ACTUAL REQUIRED: {tot_req}</br>\n')
-        s.append(self.overcount_summary())
-        s.append('  </p>\n')
-        s.append('</div>\n')
-        return s
-
 
 def generate_substance(json_str: str) -> Substance:
     d_dict = json.loads(json_str)
@@ -352,5 +315,4 @@ def generate_substance(json_str: str) -> Substance:
     d_dict['required_tests_predicted'] = []
     d_dict['overcount_error'] = []
     d_dict['disallow_zero_chance'] = int(d_dict['disallow_zero_chance'])
-    d_dict['debug_all_data'] = []
     return Substance(**d_dict)
@@ -0,0 +1,151 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from base64 import b64decode, b64encode
+from binascii import Error as Base64Error
+import json
+import struct
+
+try:
+    from .substance import Substance
+except ImportError:
+    from substance import Substance
+
+
+# Persisted Substance state comes in two encodings:
+#
+#   STATE_JSON    : Substance.model_dump_json(), what we have always stored
+#   STATE_COMPACT : {"v": 2, ...} with the three numeric lists packed as
+#                   base64 little endian int64 / float64 arrays
+#
+# Older states also carry the debug strings (debug_all_data, or "d" in the
+# compact encoding). They still decode, the strings are dropped.
+#
+# decode_substance reads either one with a single json.loads and checks the
+# fields as it goes, instead of parsing the string twice and building the
+# model twice the way check_substance_json_valid + model_validate_json do.
+# Floats survive the packing bit for bit.
+
+STATE_JSON = 1
+STATE_COMPACT = 2
+
+
+def pack_ints(values: list[int]) -> str:
+    return b64encode(struct.pack(f'<{len(values)}q', *values)).decode('ascii')
+
+
+def pack_floats(values: list[float]) -> str:
+    return b64encode(struct.pack(f'<{len(values)}d', *values)).decode('ascii')
+
+
+def unpack(packed, kind: str, field: str) -> list:
+    if not isinstance(packed, str):
+        raise ValueError(f'{field} must be a packed string')
+    try:
+        raw = b64decode(packed, validate=True)
+    except Base64Error as exc:
+        raise ValueError(f'{field} is not valid base64') from exc
+    if len(raw) % 8 != 0:
+        raise ValueError(f'{field} has {len(raw)} bytes, not a multiple of 8')
+    return list(struct.unpack(f'<{len(raw) // 8}{kind}', raw))
+
+
+def encode_substance(substance: Substance, encoding: int = STATE_COMPACT) -> str:
+    if encoding == STATE_JSON:
+        return substance.model_dump_json()
+    return json.dumps({
+        'v': STATE_COMPACT,
+        'name': substance.name,
+        'percent': substance.percent,
+        'disallow_zero_chance': substance.disallow_zero_chance,
+        'p': pack_ints(substance.required_tests_predicted),
+        't': pack_floats(substance.aposteriori_truth),
+        'e': pack_floats(substance.overcount_error),
+    }, separators=(',', ':'))
+
+
+def decode_substance(state: str) -> Substance:
+    # raises ValueError (json and pydantic errors included) on bad state
+    fields = json.loads(state)
+    if not isinstance(fields, dict):
+        raise ValueError('substance state must be a json object')
+    if 'v' not in fields:
+        return Substance.model_validate(fields)
+    if fields['v'] != STATE_COMPACT:
+        raise ValueError(f'unknown substance state version {fields["v"]}')
+
+    try:
+        (name, percent, disallow) = (fields['name'], fields['percent'], fields['disallow_zero_chance'])
+    except KeyError as exc:
+        raise ValueError(f'substance state is missing {exc}') from exc
+    if not isinstance(name, str):
+        raise ValueError('name must be a string')
+    if isinstance(percent, bool) or not isinstance(percent, (int, float)):
+        raise ValueError('percent must be a number')
+    if isinstance(disallow, bool) or not isinstance(disallow, int):
+        raise ValueError('disallow_zero_chance must be an integer')
+
+    predicted = unpack(fields.get('p'), 'q', 'required_tests_predicted')
+    truth = unpack(fields.get('t'), 'd', 'aposteriori_truth')
+    error = unpack(fields.get('e'), 'd', 'overcount_error')
+    if len(truth) != len(error) or len(truth) > len(predicted):
+        raise ValueError(f'inconsistent lengths {len(predicted)}, {len(truth)}, {len(error)}')
+
+    # everything is checked, so skip pydantic's validation
+    return Substance.model_construct(
+        name=name,
+        percent=float(percent),
+        required_tests_predicted=predicted,
+        aposteriori_truth=truth,
+        overcount_error=error,
+        disallow_zero_chance=disallow
+    )
+
+
+##############################
+#     DECODE BENCHMARKING    #
+##############################
+
+def benchmark_decode(substance: Substance, repeat: int = 2000) -> dict:
+    # seconds per decode for the old validate-then-parse path and the codec
+    from timeit import timeit
+    try:
+        from .employer import check_substance_json_valid
+    except ImportError:
+        from employer import check_substance_json_valid
+
+    legacy = encode_substance(substance, STATE_JSON)
+    compact = encode_substance(substance, STATE_COMPACT)
+
+    def current_path():
+        if check_substance_json_valid(legacy):
+            Substance.model_validate_json(legacy)
+
+    return {
+        'json_bytes': len(legacy),
+        'compact_bytes': len(compact),
+        'current_path': timeit(current_path, number=repeat) / repeat,
+        'codec_json': timeit(lambda: decode_substance(legacy), number=repeat) / repeat,
+        'codec_compact': timeit(lambda: decode_substance(compact), number=repeat) / repeat,
+    }
+
+
+def main() -> int:
+    from random import random
+    substance = Substance(
+        name='drug',
+        percent=.5,
+        required_tests_predicted=[int(10*random()) for _ in range(24)],
+        aposteriori_truth=[10*random() for _ in range(24)],
+        overcount_error=[random()-.5 for _ in range(24)],
+        disallow_zero_chance=100,
+        )
+    for key, value in benchmark_decode(substance).items():
+        print(f'{key}: {value}')
+    return 0
+
+
+if __name__ == "__main__":
+    main()
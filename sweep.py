@@ -0,0 +1,191 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from typing import NamedTuple
+import argparse
+import os
+import random
+import sys
+
+try:
+    from .schedule import Schedule
+    from .population_year import PopulationYear
+    from .change_points import stream_compact_population_from_file
+    from .fleet_calculator import fleet_population, period_inputs, run_substances
+    from .batch_runner import find_files, schedules_from_string
+except ImportError:
+    from schedule import Schedule
+    from population_year import PopulationYear
+    from change_points import stream_compact_population_from_file
+    from fleet_calculator import fleet_population, period_inputs, run_substances
+    from batch_runner import find_files, schedules_from_string
+
+
+# Runs pools under every combination of schedule, drug fraction, alcohol
+# fraction and disallow zero chance. Each pool is loaded once. Its period
+# inputs (start count, days and donor sum of every period) are worked out
+# once per schedule from one prefix sum and the shared calendar, and every
+# fraction and disallow combination reuses them; only the two substance
+# tracks run per combination.
+#
+# A job is one pool under one schedule, seeded from the master seed, the
+# pool and the schedule, so the table does not depend on how many workers
+# ran it.
+
+SWEEP_HEADER = ('pool,schedule,inception,dr_fraction,al_fraction,disallow,'
+                'drug_predicted,drug_required,drug_overcount,'
+                'alcohol_predicted,alcohol_required,alcohol_overcount,final_overcount\n')
+
+
+class SweepGrid(NamedTuple):
+    schedules: list
+    dr_fractions: list
+    al_fractions: list
+    disallow: list
+
+    @property
+    def combinations(self) -> int:
+        return len(self.schedules) * len(self.dr_fractions) * len(self.al_fractions) * len(self.disallow)
+
+
+def parse_values(s: str, cast=float) -> list:
+    # a comma separated list, or start:stop:step with stop included
+    if ':' in s:
+        (start, stop, step) = (cast(v) for v in s.split(':'))
+        if step <= 0:
+            raise ValueError(f'step must be positive in {s}')
+        values = []
+        k = 0
+        while start + k*step <= stop + step/1000:
+            values.append(cast(round(start + k*step, 10)))
+            k += 1
+        return values
+    return [cast(v) for v in s.split(',')]
+
+
+def sweep_schedule(pool: str, population: PopulationYear, schedule: Schedule, grid: SweepGrid) -> list[tuple]:
+    inputs = period_inputs(population, schedule, lagged_start_counts=True)
+    days_in_year = PopulationYear.days_in(population.year)
+    rows = []
+    for (dr_fraction, al_fraction, disallow) in product(grid.dr_fractions, grid.al_fractions, grid.disallow):
+        (dr, al) = run_substances(inputs, days_in_year, dr_fraction, al_fraction, disallow)
+        (dr_overcount, al_overcount) = (dr.final_overcount(), al.final_overcount())
+        rows.append((
+            pool,
+            Schedule.as_str(schedule),
+            str(population.inception),
+            dr_fraction,
+            al_fraction,
+            disallow,
+            dr.predicted_total,
+            dr.actual_num_tests_required,
+            dr_overcount,
+            al.predicted_total,
+            al.actual_num_tests_required,
+            al_overcount,
+            abs(dr_overcount) + abs(al_overcount)))
+    return rows
+
+
+def sweep_job(job: tuple) -> list[tuple]:
+    (pool, population, schedule, grid, seed) = job
+    random.seed(f'{seed}:{pool}:{Schedule.as_str(schedule)}')
+    return sweep_schedule(pool, population, schedule, grid)
+
+
+def sweep_population(population, grid: SweepGrid, pool: str = '', seed: int = 0) -> list[tuple]:
+    # the whole grid for one population, in this process
+    population = fleet_population(population)
+    rows = []
+    for schedule in grid.schedules:
+        rows.extend(sweep_job((pool, population, schedule, grid, seed)))
+    return rows
+
+
+def run_sweep(
+        populations: dict,
+        grid: SweepGrid,
+        out_file: str,
+        workers: int = 1,
+        seed: int = 0
+        ) -> int:
+    # populations: pool name -> population. Writes one row per pool and
+    # combination and returns the number of rows.
+    jobs = []
+    for (pool, population) in populations.items():
+        population = fleet_population(population)
+        for schedule in grid.schedules:
+            jobs.append((pool, population, schedule, grid, seed))
+
+    os.makedirs(os.path.dirname(out_file) or '.', exist_ok=True)
+    with open(out_file, 'w') as f:
+        f.write(SWEEP_HEADER)
+        if workers <= 1:
+            return write_rows(f, map(sweep_job, jobs))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return write_rows(f, executor.map(sweep_job, jobs, chunksize=max(1, len(jobs) // (4 * workers))))
+
+
+def write_rows(f, tables) -> int:
+    # the rows of each job as it finishes, returns the number of rows
+    num_rows = 0
+    for rows in tables:
+        for row in rows:
+            f.write(','.join(str(v) for v in row) + '\n')
+        num_rows += len(rows)
+    return num_rows
+
+
+def load_populations(pattern: str, vp_format: bool) -> tuple:
+    # (pool name -> population, files that could not be read)
+    filenames = [pattern] if os.path.isfile(pattern) else find_files(pattern)
+    populations = {}
+    failed = []
+    for filename in filenames:
+        pool = os.path.splitext(os.path.basename(filename))[0]
+        try:
+            populations[pool] = stream_compact_population_from_file(filename, vp_format)[0]
+        except (OSError, ValueError) as exc:
+            failed.append(f'{filename}: {exc}')
+    return (populations, failed)
+
+
+def get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Arguments: population file, directory or glob, the parameter grid and output file'
+        )
+    parser.add_argument('pools', type=str, help='population file, directory or glob of population files')
+    parser.add_argument('--vp', type=str, help='whether the files are in VP format', default='true')
+    parser.add_argument('--sch', type=str, help='schedules: "all" or a list, e.g. monthly,quarterly', default='all')
+    parser.add_argument('--dr', type=str, help='drug fractions: a list or start:stop:step', default='.5')
+    parser.add_argument('--al', type=str, help='alcohol fractions: a list or start:stop:step', default='.1')
+    parser.add_argument('--disallow', type=str, help='disallow zero chances: a list or start:stop:step', default='0')
+    parser.add_argument('--out', type=str, help='table to write', default='sweep.csv')
+    parser.add_argument('--workers', type=int, help='number of processes', default=1)
+    parser.add_argument('--seed', type=int, help='master seed for the zero test correction', default=0)
+    args = parser.parse_args()
+    return args
+
+
+def main() -> int:
+    args = get_args()
+    grid = SweepGrid(
+        schedules_from_string(args.sch),
+        parse_values(args.dr),
+        parse_values(args.al),
+        parse_values(args.disallow, int)
+        )
+    (populations, failed) = load_populations(args.pools, args.vp.lower()[0] == 't')
+    for message in failed:
+        print(f'Cannot load {message}')
+    num_rows = run_sweep(populations, grid, args.out, max(1, args.workers), args.seed)
+    print(f'{len(populations)} pools x {grid.combinations} combinations: {num_rows} rows written to {args.out}')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
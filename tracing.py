@@ -0,0 +1,126 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+from collections import deque
+from datetime import date
+from enum import IntEnum
+from typing import NamedTuple
+
+
+# What a Substance works out each period, as numeric records instead of the
+# csv strings that used to pile up in debug_all_data and go into the
+# persisted state on every round trip. The trace is never persisted.
+#
+# Substances report through the Tracer the Employer hands them. The level
+# picks how much is recorded:
+#   OFF    : nothing (NULL_TRACER, the default)
+#   PERIOD : a TruthRecord at the end of every period
+#   DETAIL : an EstimateRecord at the start of every period as well
+#
+# A Tracer can keep the last ring_size records in memory and/or hand every
+# record to a sink (any callable) for a full trace, e.g. CsvTraceSink.
+
+
+class TraceLevel(IntEnum):
+    OFF = 0
+    PERIOD = 1
+    DETAIL = 2
+
+
+class EstimateRecord(NamedTuple):
+    # Substance.make_apriori_predictions, start and end are date ordinals
+    substance: str
+    period_index: int
+    start: int
+    end: int
+    percent: float
+    start_count: int
+    days: int
+    days_in_year: int
+    estimate: float
+    account_for: float
+    predicted: int
+
+
+class TruthRecord(NamedTuple):
+    # Substance.determine_aposteriori_truth
+    substance: str
+    period_index: int
+    predicted: int
+    donor_sum: int
+    days_in_year: int
+    truth: float
+    error: float
+    cumulative_error: float
+    summed_truth: int
+
+
+class Tracer:
+
+    def __init__(self, level: TraceLevel = TraceLevel.OFF, ring_size: int = 0, sink=None):
+        self.level = level
+        self.ring = deque(maxlen=ring_size) if ring_size > 0 else None
+        self.sink = sink
+
+    def wants(self, level: TraceLevel) -> bool:
+        return self.level >= level
+
+    def emit(self, record) -> None:
+        if self.ring is not None:
+            self.ring.append(record)
+        if self.sink is not None:
+            self.sink(record)
+
+    def recent(self) -> list:
+        return [] if self.ring is None else list(self.ring)
+
+
+NULL_TRACER = Tracer()
+
+
+class ListSink:
+    # keeps the full trace in memory
+
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record) -> None:
+        self.records.append(record)
+
+
+class CsvTraceSink:
+    # writes one line per record to an open file, the record type first
+
+    def __init__(self, out):
+        self.out = out
+        self.out.write('# estimate,' + ','.join(EstimateRecord._fields) + '\n')
+        self.out.write('# truth,' + ','.join(TruthRecord._fields) + '\n')
+
+    def __call__(self, record) -> None:
+        kind = 'estimate' if isinstance(record, EstimateRecord) else 'truth'
+        self.out.write(kind + ',' + ','.join(str(v) for v in record) + '\n')
+
+
+DEBUG_HEADER = ('start,end,substance,percent,s_count,days_in_period,days_in_year,initial_guess,account_for,'
+                'predicted,avg_pop,truth,oc,cum_oc, summed truth - round up')
+
+
+def debug_lines(records, substance: str) -> list[str]:
+    # the lines debug_all_data used to hold for one substance, from DETAIL records
+    lines = {}
+    for r in records:
+        if r.substance != substance:
+            continue
+        if isinstance(r, EstimateRecord):
+            lines[r.period_index] = (
+                f'{date.fromordinal(r.start)},{date.fromordinal(r.end)},{r.substance},{r.percent},'
+                f'{r.start_count},{r.days},{r.days_in_year},{r.estimate}, {r.account_for}, {r.predicted}')
+        elif r.period_index in lines:
+            avg_pop = float(r.donor_sum)/float(r.days_in_year)
+            lines[r.period_index] += \
+                f',{avg_pop}, {r.truth}, {r.error}, {r.cumulative_error}, {r.summed_truth}'
+    if len(lines) == 0:
+        return []
+    return [DEBUG_HEADER] + [lines[p] for p in sorted(lines)]
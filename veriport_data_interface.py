@@ -3,28 +3,132 @@
 # Proprietary and confidential
 # Written by John Read <john.read@colibri-software.com>, July 2023
 
-from calculator import get_calculator_instance
+try:
+    from .calculator import get_calculator_instance
+    from .sqlite_backend import SQLiteBackend, PoolResult
+    from .substance_codec import decode_substance
+except ImportError:
+    from calculator import get_calculator_instance
+    from sqlite_backend import SQLiteBackend, PoolResult
+    from substance_codec import decode_substance
+
+DR_STATE = 'tmp_dr.json'
+AL_STATE = 'tmp_al.json'
 
 
 class VeriportDataInterface:
+    # What DataPersist does with files, for one pool stored in a backend.
+    # The population is every day Veriport knows about so far, loaded again
+    # for every period close so days stored since then are seen.
 
-    # self.schedule = schedule
-    # self.population = population
-    # self.inception = list(population.keys())[0]
+    def __init__(
+            self,
+            backend: SQLiteBackend,
+            pool_id: int,
+            disallow: int = 0,
+            dr_fraction: float = .5,
+            al_fraction: float = .1
+            ):
+        pool = backend.load_pools([pool_id])[pool_id]
+        self.backend = backend
+        self.pool_id = pool_id
+        self.schedule = pool.schedule
+        self.inception = pool.inception
+        self.population = backend.load_populations([pool_id])[pool_id]
+        self.disallow = disallow
+        self.dr_fraction = dr_fraction
+        self.al_fraction = al_fraction
+        self.period_index = 0
 
     # used in run_like_veriport_would
     def store_reports(self, html: str) -> int:
-        pass
+        return self.backend.store_report(self.pool_id, self.period_index, html)
 
     # used in run_like_veriport_would
     def store_json(self, tmp_json, file_name) -> None:
-        pass
+        self.backend.store_states([(self.pool_id, file_name, tmp_json)])
 
     # used in run_like_veriport_would
     def retrieve_json(self, file_name) -> str:
-        pass
+        return self.backend.load_states([self.pool_id]).get(self.pool_id, {}).get(file_name, '')
+
+    def close_period(self, period_index: int) -> int:
+        # the period_end/estimate step for period_index, persisted in one transaction
+        self.population = self.backend.load_populations([self.pool_id])[self.pool_id]
+        states = self.backend.load_states([self.pool_id]).get(self.pool_id, {})
+        (result, score) = close_pool_period(
+            self.pool_id,
+            self.schedule,
+            self.inception,
+            self.population,
+            states,
+            period_index,
+            self.disallow,
+            self.dr_fraction,
+            self.al_fraction
+            )
+        self.backend.store_results([result])
+        self.period_index = period_index
+        return score
 
     # This is the method that we need to give the output to Veriport
     def get_requirements(self, period_index: int, drug: bool) -> int:
-        calc = get_calculator_instance(self.schedule, self.inception, self.population)
-        return calc.get_requirements(period_index, drug)
+        state = self.retrieve_json(DR_STATE if drug else AL_STATE)
+        if state == '':
+            raise ValueError(f'pool {self.pool_id} has no state yet, close period 0 first')
+        substance = decode_substance(state)
+        return substance.required_tests_predicted[period_index]
+
+
+def close_pool_period(
+        pool_id: int,
+        schedule,
+        inception,
+        population,
+        states: dict,
+        period_index: int,
+        disallow: int,
+        dr_fraction: float,
+        al_fraction: float
+        ) -> tuple:
+    calc = get_calculator_instance(schedule, inception, population, disallow, dr_fraction, al_fraction)
+    (dr_json, al_json, score, html) = calc.process_period(
+        period_index,
+        states.get(DR_STATE, ''),
+        states.get(AL_STATE, '')
+        )
+    return (PoolResult(pool_id, period_index, {DR_STATE: dr_json, AL_STATE: al_json}, html), score)
+
+
+def close_periods(
+        backend: SQLiteBackend,
+        period_indexes: dict[int, int],
+        disallow: int = 0,
+        dr_fraction: float = .5,
+        al_fraction: float = .1
+        ) -> dict[int, int]:
+    # Close the given period for many pools, {pool_id: period_index}: three
+    # queries to load everything and one transaction to write it back.
+    pool_ids = list(period_indexes)
+    pools = backend.load_pools(pool_ids)
+    populations = backend.load_populations(pool_ids)
+    states = backend.load_states(pool_ids)
+
+    results = []
+    scores = {}
+    for pool_id in pool_ids:
+        pool = pools[pool_id]
+        (result, scores[pool_id]) = close_pool_period(
+            pool_id,
+            pool.schedule,
+            pool.inception,
+            populations[pool_id],
+            states.get(pool_id, {}),
+            period_indexes[pool_id],
+            disallow,
+            dr_fraction,
+            al_fraction
+            )
+        results.append(result)
+    backend.store_results(results)
+    return scores
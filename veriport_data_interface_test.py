@@ -0,0 +1,42 @@
+# Copyright (C) Colibri Software, Inc - All Rights Reserved
+# Unauthorized copying of this file, via any medium is strictly prohibited
+# Proprietary and confidential
+# Written by John Read <john.read@colibri-software.com>, October 2023
+
+import pytest
+
+from schedule import Schedule
+from sqlite_backend import SQLiteBackend
+from substance_codec import decode_substance
+from veriport_data_interface import VeriportDataInterface, DR_STATE
+
+def test_close_period_sees_population_stored_later(tmp_path, cab_population, fixed_zero_draw):
+    # what Veriport knew when the interface was made: the same days, before
+    # the headcount was corrected upwards
+    earlier = cab_population.copy()
+    for day in earlier:
+        earlier.set(day, earlier[day] - 10)
+
+    with SQLiteBackend(str(tmp_path / 'late.db')) as late, SQLiteBackend(str(tmp_path / 'full.db')) as full:
+        late.add_pools([(1, 'cab', Schedule.MONTHLY, earlier)])
+        interface = VeriportDataInterface(late, 1)
+        interface.close_period(0)
+        late.store_populations([(1, cab_population)])
+        interface.close_period(1)
+
+        full.add_pools([(1, 'cab', Schedule.MONTHLY, cab_population)])
+        expected = VeriportDataInterface(full, 1)
+        expected.close_period(0)
+        expected.close_period(1)
+
+        # the estimates differ, but period 0's truth only depends on the population
+        truth = decode_substance(interface.retrieve_json(DR_STATE)).aposteriori_truth
+        assert truth == decode_substance(expected.retrieve_json(DR_STATE)).aposteriori_truth
+
+
+def test_requirements_before_any_period_closed(tmp_path, cab_population):
+    with SQLiteBackend(str(tmp_path / 'pools.db')) as backend:
+        backend.add_pools([(1, 'cab', Schedule.MONTHLY, cab_population)])
+        interface = VeriportDataInterface(backend, 1)
+        with pytest.raises(ValueError, match='no state yet'):
+            interface.get_requirements(0, True)